@@ -1,12 +1,45 @@
 import requests
+import os
 import sys
 from datetime import datetime, timezone, timedelta
 from pymongo import MongoClient
 import uuid
+import time
+import io
+import base64
+import hashlib
+from PIL import Image
+
+def sample_jpeg_data_url(size=(64, 64)):
+    """Build a small JPEG data URL for attachment tests"""
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "white").save(buffer, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+class InProcessDatabase:
+    """Blocking access to the app's in-memory datastore, run on the TestClient's event loop"""
+
+    def __init__(self, database, portal):
+        self.database = database
+        self.portal = portal
+
+    def __getattr__(self, name):
+        return InProcessCollection(self.database[name], self.portal)
+
+class InProcessCollection:
+    def __init__(self, collection, portal):
+        self.collection = collection
+        self.portal = portal
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+        return lambda *args, **kwargs: self.portal.call(lambda: method(*args, **kwargs))
 
 class TarjetaDigitalAPITester:
-    def __init__(self, base_url="https://digital-profile-14.preview.emergentagent.com"):
+    def __init__(self, base_url="https://digital-profile-14.preview.emergentagent.com", http=requests, db=None):
         self.base_url = base_url
+        # requests against a deployed backend, a TestClient when running in-process
+        self.http = http
         self.api = f"{base_url}/api"
         self.session_token = None
         self.user_id = None
@@ -15,8 +48,10 @@ class TarjetaDigitalAPITester:
         self.test_results = []
         
         # MongoDB connection
-        self.mongo_client = MongoClient("mongodb://localhost:27017")
-        self.db = self.mongo_client["test_database"]
+        if db is None:
+            self.mongo_client = MongoClient("mongodb://localhost:27017")
+            db = self.mongo_client["test_database"]
+        self.db = db
 
     def log_result(self, test_name, passed, message=""):
         """Log test result"""
@@ -52,7 +87,7 @@ class TarjetaDigitalAPITester:
                 "name": "Test User",
                 "picture": "https://via.placeholder.com/150",
                 "plan": "free",
-                "created_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc)
             }
             self.db.users.insert_one(user_doc)
             print(f"✅ Created test user: {self.user_id}")
@@ -62,8 +97,8 @@ class TarjetaDigitalAPITester:
             session_doc = {
                 "user_id": self.user_id,
                 "session_token": self.session_token,
-                "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
-                "created_at": datetime.now(timezone.utc).isoformat()
+                "expires_at": datetime.now(timezone.utc) + timedelta(days=7),
+                "created_at": datetime.now(timezone.utc)
             }
             self.db.user_sessions.insert_one(session_doc)
             print(f"✅ Created session: {self.session_token}")
@@ -90,7 +125,7 @@ class TarjetaDigitalAPITester:
         print("\n📝 Testing authentication...")
         
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.api}/auth/me",
                 headers={"Authorization": f"Bearer {self.session_token}"}
             )
@@ -111,7 +146,7 @@ class TarjetaDigitalAPITester:
         print("\n📝 Testing get tarjetas...")
         
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.api}/tarjetas",
                 headers={"Authorization": f"Bearer {self.session_token}"}
             )
@@ -141,7 +176,7 @@ class TarjetaDigitalAPITester:
                 "foto_url": "https://via.placeholder.com/150"
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.api}/tarjetas",
                 json=payload,
                 headers={"Authorization": f"Bearer {self.session_token}"}
@@ -168,7 +203,7 @@ class TarjetaDigitalAPITester:
             return self.log_result("GET /api/tarjetas/{id}", False, "No test tarjeta created")
         
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.api}/tarjetas/{self.test_tarjeta_id}",
                 headers={"Authorization": f"Bearer {self.session_token}"}
             )
@@ -197,7 +232,7 @@ class TarjetaDigitalAPITester:
                 "descripcion": "Updated description"
             }
             
-            response = requests.put(
+            response = self.http.put(
                 f"{self.api}/tarjetas/{self.test_tarjeta_id}",
                 json=payload,
                 headers={"Authorization": f"Bearer {self.session_token}"}
@@ -222,7 +257,7 @@ class TarjetaDigitalAPITester:
             return self.log_result("GET /api/tarjetas/slug/{slug}", False, "No test tarjeta created")
         
         try:
-            response = requests.get(f"{self.api}/tarjetas/slug/{self.test_tarjeta_slug}")
+            response = self.http.get(f"{self.api}/tarjetas/slug/{self.test_tarjeta_slug}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -235,6 +270,156 @@ class TarjetaDigitalAPITester:
         except Exception as e:
             return self.log_result("GET /api/tarjetas/slug/{slug}", False, str(e))
 
+    def test_archivo_preview(self):
+        """Test archivo_negocio preview generation and lazy download"""
+        print("\n📝 Testing archivo_negocio preview...")
+        
+        if not hasattr(self, 'test_tarjeta_id'):
+            return self.log_result("Archivo preview", False, "No test tarjeta created")
+        
+        try:
+            payload = {
+                "archivo_negocio": sample_jpeg_data_url(),
+                "archivo_negocio_tipo": "jpg",
+                "archivo_negocio_nombre": "test.jpg"
+            }
+            response = self.http.put(
+                f"{self.api}/tarjetas/{self.test_tarjeta_id}",
+                json=payload,
+                headers={"Authorization": f"Bearer {self.session_token}"}
+            )
+            if response.status_code != 200:
+                return self.log_result("Archivo preview", False, f"Update status {response.status_code}")
+            
+            # Preview is rendered in the background
+            data = {}
+            for _ in range(10):
+                data = self.http.get(f"{self.api}/tarjetas/slug/{self.test_tarjeta_slug}").json()
+                if data.get("archivo_negocio_preview"):
+                    break
+                time.sleep(0.5)
+            
+            if data.get("archivo_negocio"):
+                return self.log_result("Archivo preview", False, "Public response includes full attachment")
+            if not data.get("archivo_negocio_preview", "").startswith("data:image/jpeg"):
+                return self.log_result("Archivo preview", False, "Preview was not generated")
+            
+            download = self.http.get(f"{self.base_url}{data['archivo_negocio_url']}")
+            if download.status_code == 200 and download.headers.get("content-type") == "image/jpeg":
+                return self.log_result("Archivo preview", True, f"Preview and lazy download work ({len(download.content)} bytes)")
+            else:
+                return self.log_result("Archivo preview", False, f"Download status {download.status_code}")
+        except Exception as e:
+            return self.log_result("Archivo preview", False, str(e))
+
+    def test_search_tarjetas(self):
+        """Test GET /api/tarjetas/buscar"""
+        print("\n📝 Testing tarjeta search...")
+        
+        if not hasattr(self, 'test_tarjeta_id'):
+            return self.log_result("GET /api/tarjetas/buscar", False, "No test tarjeta created")
+        
+        try:
+            tarjeta = self.http.get(
+                f"{self.api}/tarjetas/{self.test_tarjeta_id}",
+                headers={"Authorization": f"Bearer {self.session_token}"}
+            ).json()
+            # Search by the start of the first word, upper-cased
+            prefix = tarjeta["nombre"].split()[0][:3].upper()
+            response = self.http.get(
+                f"{self.api}/tarjetas/buscar",
+                params={"q": prefix},
+                headers={"Authorization": f"Bearer {self.session_token}"}
+            )
+            
+            if response.status_code != 200:
+                return self.log_result("GET /api/tarjetas/buscar", False, f"Status {response.status_code}")
+            ids = [item["id"] for item in response.json()["items"]]
+            if self.test_tarjeta_id in ids:
+                return self.log_result("GET /api/tarjetas/buscar", True, f"Found tarjeta searching '{prefix}'")
+            else:
+                return self.log_result("GET /api/tarjetas/buscar", False, f"Tarjeta not found searching '{prefix}'")
+        except Exception as e:
+            return self.log_result("GET /api/tarjetas/buscar", False, str(e))
+
+    def test_vcard(self):
+        """Test the public vCard export and its ETag"""
+        print("\n📝 Testing vCard export...")
+        
+        if not hasattr(self, 'test_tarjeta_slug'):
+            return self.log_result("GET /api/public/{slug}/vcard", False, "No test tarjeta created")
+        
+        try:
+            response = self.http.get(f"{self.api}/public/{self.test_tarjeta_slug}/vcard")
+            if response.status_code != 200 or not response.text.startswith("BEGIN:VCARD"):
+                return self.log_result("GET /api/public/{slug}/vcard", False, f"Status {response.status_code}")
+            
+            cached = self.http.get(
+                f"{self.api}/public/{self.test_tarjeta_slug}/vcard",
+                headers={"If-None-Match": response.headers.get("etag", "")}
+            )
+            if cached.status_code == 304:
+                return self.log_result("GET /api/public/{slug}/vcard", True, f"vCard served ({len(response.content)} bytes), ETag revalidates")
+            else:
+                return self.log_result("GET /api/public/{slug}/vcard", False, f"Revalidation status {cached.status_code}")
+        except Exception as e:
+            return self.log_result("GET /api/public/{slug}/vcard", False, str(e))
+
+    def test_chunked_upload(self):
+        """Test resumable upload init/append/commit"""
+        print("\n📝 Testing chunked upload...")
+        
+        if not hasattr(self, 'test_tarjeta_id'):
+            return self.log_result("Chunked upload", False, "No test tarjeta created")
+        
+        try:
+            headers = {"Authorization": f"Bearer {self.session_token}"}
+            content = base64.b64decode(sample_jpeg_data_url((256, 256)).split(",", 1)[1])
+            middle = len(content) // 2
+            
+            response = self.http.post(
+                f"{self.api}/uploads",
+                json={
+                    "tarjeta_id": self.test_tarjeta_id,
+                    "nombre": "chunked.jpg",
+                    "tipo": "jpg",
+                    "size": len(content),
+                    "sha256": hashlib.sha256(content).hexdigest()
+                },
+                headers=headers
+            )
+            if response.status_code != 200:
+                return self.log_result("Chunked upload", False, f"Init status {response.status_code}")
+            upload_id = response.json()["upload_id"]
+            
+            for offset, chunk in ((0, content[:middle]), (middle, content[middle:])):
+                response = self.http.put(
+                    f"{self.api}/uploads/{upload_id}",
+                    params={"offset": offset},
+                    data=chunk,
+                    headers={**headers, "Content-Type": "application/octet-stream"}
+                )
+                if response.status_code != 200:
+                    return self.log_result("Chunked upload", False, f"Append status {response.status_code}")
+            
+            # Replaying an old offset must be rejected
+            response = self.http.put(
+                f"{self.api}/uploads/{upload_id}",
+                params={"offset": 0},
+                data=content[:middle],
+                headers={**headers, "Content-Type": "application/octet-stream"}
+            )
+            if response.status_code != 409:
+                return self.log_result("Chunked upload", False, f"Stale offset accepted ({response.status_code})")
+            
+            response = self.http.post(f"{self.api}/uploads/{upload_id}/commit", headers=headers)
+            if response.status_code == 200 and response.json().get("archivo_negocio_nombre") == "chunked.jpg":
+                return self.log_result("Chunked upload", True, f"Uploaded {len(content)} bytes in 2 chunks")
+            else:
+                return self.log_result("Chunked upload", False, f"Commit status {response.status_code}")
+        except Exception as e:
+            return self.log_result("Chunked upload", False, str(e))
+
     def test_generate_qr(self):
         """Test POST /api/tarjetas/{id}/generate-qr"""
         print("\n📝 Testing QR code generation...")
@@ -243,7 +428,7 @@ class TarjetaDigitalAPITester:
             return self.log_result("POST /api/tarjetas/{id}/generate-qr", False, "No test tarjeta created")
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 f"{self.api}/tarjetas/{self.test_tarjeta_id}/generate-qr",
                 headers={"Authorization": f"Bearer {self.session_token}"}
             )
@@ -273,7 +458,7 @@ class TarjetaDigitalAPITester:
                 "orden": 0
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.api}/enlaces/{self.test_tarjeta_id}",
                 json=payload,
                 headers={"Authorization": f"Bearer {self.session_token}"}
@@ -299,7 +484,7 @@ class TarjetaDigitalAPITester:
             return self.log_result("GET /api/enlaces/{tarjeta_id}", False, "No test tarjeta created")
         
         try:
-            response = requests.get(f"{self.api}/enlaces/{self.test_tarjeta_id}")
+            response = self.http.get(f"{self.api}/enlaces/{self.test_tarjeta_id}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -325,7 +510,7 @@ class TarjetaDigitalAPITester:
                 "url": "https://linkedin.com/in/updated"
             }
             
-            response = requests.put(
+            response = self.http.put(
                 f"{self.api}/enlaces/{self.test_enlace_id}",
                 json=payload,
                 headers={"Authorization": f"Bearer {self.session_token}"}
@@ -350,7 +535,7 @@ class TarjetaDigitalAPITester:
             return self.log_result("DELETE /api/enlaces/{enlace_id}", False, "No test enlace created")
         
         try:
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.api}/enlaces/{self.test_enlace_id}",
                 headers={"Authorization": f"Bearer {self.session_token}"}
             )
@@ -366,6 +551,62 @@ class TarjetaDigitalAPITester:
         except Exception as e:
             return self.log_result("DELETE /api/enlaces/{enlace_id}", False, str(e))
 
+    def test_plan_limits(self):
+        """Test the free plan limits on tarjetas and enlaces"""
+        print("\n📝 Testing plan limits...")
+        
+        name = "Free plan limits"
+        headers = {"Authorization": f"Bearer {self.session_token}"}
+        created = []
+        try:
+            # Fill the plan: 3 tarjetas, then 10 enlaces on the last one
+            tarjetas = self.http.get(f"{self.api}/tarjetas", headers=headers).json()
+            for n in range(3 - len(tarjetas)):
+                response = self.http.post(f"{self.api}/tarjetas", json={"nombre": f"Limit Card {n}"}, headers=headers)
+                if response.status_code != 200:
+                    return self.log_result(name, False, f"Tarjeta {len(tarjetas) + n + 1}: status {response.status_code}")
+                created.append(response.json()["id"])
+            response = self.http.post(f"{self.api}/tarjetas", json={"nombre": "Limit Card 4"}, headers=headers)
+            if response.status_code != 403:
+                return self.log_result(name, False, f"4th tarjeta: status {response.status_code}")
+            
+            if not created:
+                return self.log_result(name, False, "No tarjeta to fill with enlaces")
+            enlaces = self.http.get(f"{self.api}/auth/me", headers=headers).json()["usage"]["enlaces"]
+            for n in range(10 - enlaces):
+                response = self.http.post(f"{self.api}/enlaces/{created[-1]}", headers=headers,
+                                          json={"titulo": f"Link {n}", "url": f"https://example.com/{n}"})
+                if response.status_code != 200:
+                    return self.log_result(name, False, f"Enlace {enlaces + n + 1}: status {response.status_code}")
+            response = self.http.post(f"{self.api}/enlaces/{created[0]}", headers=headers,
+                                      json={"titulo": "Link 11", "url": "https://example.com/11"})
+            if response.status_code != 403:
+                return self.log_result(name, False, f"11th enlace: status {response.status_code}")
+            
+            # Deleting the tarjeta gives back its slot and those of its enlaces
+            response = self.http.delete(f"{self.api}/tarjetas/{created.pop()}", headers=headers)
+            if response.status_code != 200:
+                return self.log_result(name, False, f"Delete: status {response.status_code}")
+            response = self.http.post(f"{self.api}/enlaces/{self.test_tarjeta_id}", headers=headers,
+                                      json={"titulo": "Link 11", "url": "https://example.com/11"})
+            if response.status_code != 200:
+                return self.log_result(name, False, f"Enlace after delete: status {response.status_code}")
+            self.http.delete(f"{self.api}/enlaces/{response.json()['id']}", headers=headers)
+            response = self.http.post(f"{self.api}/tarjetas", json={"nombre": "Limit Card 4"}, headers=headers)
+            if response.status_code != 200:
+                return self.log_result(name, False, f"Tarjeta after delete: status {response.status_code}")
+            created.append(response.json()["id"])
+            
+            usage = self.http.get(f"{self.api}/auth/me", headers=headers).json()["usage"]
+            if usage["tarjetas"] != 3 or usage["enlaces"] != enlaces:
+                return self.log_result(name, False, f"Usage drifted: {usage}")
+            return self.log_result(name, True, "Limits enforced and released on delete")
+        except Exception as e:
+            return self.log_result(name, False, str(e))
+        finally:
+            for tarjeta_id in created:
+                self.http.delete(f"{self.api}/tarjetas/{tarjeta_id}", headers=headers)
+
     def test_delete_tarjeta(self):
         """Test DELETE /api/tarjetas/{id}"""
         print("\n📝 Testing delete tarjeta...")
@@ -374,17 +615,22 @@ class TarjetaDigitalAPITester:
             return self.log_result("DELETE /api/tarjetas/{id}", False, "No test tarjeta created")
         
         try:
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.api}/tarjetas/{self.test_tarjeta_id}",
                 headers={"Authorization": f"Bearer {self.session_token}"}
             )
             
             if response.status_code == 200:
                 data = response.json()
-                if data.get("success"):
+                if not data.get("success"):
+                    return self.log_result("DELETE /api/tarjetas/{id}", False, "Delete not confirmed")
+                
+                # Deleted tarjetas disappear from public lookups before they are purged
+                public = self.http.get(f"{self.api}/tarjetas/slug/{self.test_tarjeta_slug}")
+                if public.status_code == 404:
                     return self.log_result("DELETE /api/tarjetas/{id}", True, "Tarjeta deleted successfully")
                 else:
-                    return self.log_result("DELETE /api/tarjetas/{id}", False, "Delete not confirmed")
+                    return self.log_result("DELETE /api/tarjetas/{id}", False, f"Deleted tarjeta still public ({public.status_code})")
             else:
                 return self.log_result("DELETE /api/tarjetas/{id}", False, f"Status {response.status_code}")
         except Exception as e:
@@ -395,7 +641,7 @@ class TarjetaDigitalAPITester:
         print("\n📝 Testing logout...")
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 f"{self.api}/auth/logout",
                 headers={"Authorization": f"Bearer {self.session_token}"}
             )
@@ -429,11 +675,16 @@ class TarjetaDigitalAPITester:
         self.test_get_tarjeta_by_id()
         self.test_update_tarjeta()
         self.test_get_tarjeta_by_slug_public()
+        self.test_archivo_preview()
+        self.test_chunked_upload()
+        self.test_vcard()
+        self.test_search_tarjetas()
         self.test_generate_qr()
         self.test_create_enlace()
         self.test_get_enlaces()
         self.test_update_enlace()
         self.test_delete_enlace()
+        self.test_plan_limits()
         self.test_delete_tarjeta()
         self.test_logout()
         
@@ -452,7 +703,20 @@ class TarjetaDigitalAPITester:
             print(f"❌ {self.tests_run - self.tests_passed} test(s) failed")
             return 1
 
+def run_in_process():
+    """Run the tests against the app in this process, on the in-memory datastore (no MongoDB or network)"""
+    os.environ["DATASTORE"] = "memory"
+    os.environ.setdefault("DB_NAME", "test_database")
+    from starlette.testclient import TestClient
+    import server
+
+    with TestClient(server.app) as client:
+        tester = TarjetaDigitalAPITester("http://testserver", http=client, db=InProcessDatabase(server.db, client.portal))
+        return tester.run_all_tests()
+
 def main():
+    if "--in-process" in sys.argv[1:]:
+        return run_in_process()
     tester = TarjetaDigitalAPITester()
     return tester.run_all_tests()
 
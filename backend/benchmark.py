@@ -0,0 +1,180 @@
+"""In-process API benchmark.
+
+Runs the app through httpx's ASGI transport on the in-memory datastore
+(DATASTORE=memory, see datastore.py), so it needs neither MongoDB nor a
+network and measures the API itself.  It registers --users accounts, gives
+each of them tarjetas and enlaces, then sends --requests requests per
+scenario with --concurrency of them in flight and prints throughput and
+latency percentiles.
+
+    python benchmark.py --users 10 --requests 2000 --concurrency 32 --only slug vcard
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+NOMBRES = ["Ana", "José", "María", "Núñez", "García", "López", "Ibáñez", "Martín", "Sofía", "Rubén"]
+OFICIOS = ["fotografía", "diseño", "carpintería", "abogada", "dentista", "catering", "fontanería"]
+TARJETAS_PER_USER = 3  # The free plan limit, counting the default tarjeta
+ENLACES_PER_TARJETA = 3
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Fixture:
+    """Users with their session tokens and tarjetas"""
+
+    def __init__(self):
+        self.users = []
+        self.tarjetas = []
+
+    def user(self) -> dict:
+        return random.choice(self.users)
+
+    def tarjeta(self) -> dict:
+        return random.choice(self.tarjetas)
+
+
+async def seed(http, users: int) -> Fixture:
+    fixture = Fixture()
+    for n in range(users):
+        nombre = f"{random.choice(NOMBRES)} {random.choice(NOMBRES)}"
+        response = await http.post("/api/auth/register", json={
+            "name": nombre, "email": f"bench{n}@example.com", "password": "benchmark"
+        })
+        response.raise_for_status()
+        user = {"id": response.json()["user_id"], "token": response.cookies["session_token"]}
+        headers = {"Authorization": f"Bearer {user['token']}"}
+
+        for _ in range(TARJETAS_PER_USER - 1):
+            response = await http.post("/api/tarjetas", headers=headers, json={
+                "nombre": f"{random.choice(NOMBRES)} {random.choice(NOMBRES)}",
+                "descripcion": f"{random.choice(OFICIOS)} en Madrid",
+                "email": f"contacto{n}@example.com",
+                "telefono": "+34 600 000 000",
+                "directorio": True,
+            })
+            response.raise_for_status()
+        tarjetas = (await http.get("/api/tarjetas", headers=headers)).json()
+        for tarjeta in tarjetas:
+            for orden in range(ENLACES_PER_TARJETA):
+                response = await http.post(f"/api/enlaces/{tarjeta['id']}", headers=headers, json={
+                    "titulo": f"Enlace {orden}", "url": f"https://example.com/{orden}", "orden": orden
+                })
+                response.raise_for_status()
+            fixture.tarjetas.append({**tarjeta, "headers": headers})
+        fixture.users.append({**user, "headers": headers})
+    return fixture
+
+
+def scenarios(fixture: Fixture) -> dict:
+    """Scenario name -> function returning the next (method, url, request options)"""
+    def update():
+        tarjeta = fixture.tarjeta()
+        return "PUT", f"/api/tarjetas/{tarjeta['id']}", {
+            "headers": tarjeta["headers"], "json": {"descripcion": f"{random.choice(OFICIOS)} en Sevilla"}
+        }
+
+    return {
+        "slug": lambda: ("GET", f"/api/tarjetas/slug/{fixture.tarjeta()['slug']}", {}),
+        "enlaces": lambda: ("GET", f"/api/enlaces/{fixture.tarjeta()['id']}", {}),
+        "vcard": lambda: ("GET", f"/api/public/{fixture.tarjeta()['slug']}/vcard", {}),
+        "directorio": lambda: ("GET", f"/api/public/directorio/{fixture.user()['id']}", {
+            "params": {"q": random.choice(OFICIOS)[:3]}
+        }),
+        "buscar": lambda: ("GET", "/api/tarjetas/buscar", {
+            "headers": fixture.user()["headers"], "params": {"q": random.choice(NOMBRES)[:3]}
+        }),
+        "tarjetas": lambda: ("GET", "/api/tarjetas", {"headers": fixture.user()["headers"]}),
+        "update": update,
+    }
+
+
+async def run_scenario(http, next_request, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, url, options = next_request()
+            started = time.perf_counter()
+            response = await http.request(method, url, **options)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50_ms": percentile(ordered, 0.5) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+async def wait_for_jobs(database, timeout: float = 30):
+    """Let the vCards queued while seeding finish so they don't compete with the measurements"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not await database.jobs.count_documents({"status": {"$in": ["queued", "running"]}}):
+            return
+        await asyncio.sleep(0.1)
+
+
+async def run_benchmark(args):
+    import httpx
+    import server
+
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as http:
+            started = time.perf_counter()
+            fixture = await seed(http, args.users)
+            await wait_for_jobs(server.db)
+            print(f"Seeded {len(fixture.users)} users and {len(fixture.tarjetas)} tarjetas "
+                  f"in {time.perf_counter() - started:.1f}s\n")
+
+            print(f"{'scenario':12} {'requests':>8} {'errors':>6} {'req/s':>8} "
+                  f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+            for name, next_request in scenarios(fixture).items():
+                if args.only and name not in args.only:
+                    continue
+                result = await run_scenario(http, next_request, args.requests, args.concurrency)
+                print(f"{name:12} {result['requests']:>8} {result['errors']:>6} {result['rps']:>8.0f} "
+                      f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['max_ms']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API in-process on the in-memory datastore")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", nargs="+", metavar="SCENARIO",
+                        choices=["slug", "enlaces", "vcard", "directorio", "buscar", "tarjetas", "update"])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Must be set before server is imported
+    os.environ["DATASTORE"] = "memory"
+    os.environ.setdefault("DB_NAME", "benchmark")
+    random.seed(args.seed)
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    main()
@@ -0,0 +1,1093 @@
+"""Datastore selection and an in-memory stand-in for MongoDB.
+
+DATASTORE picks where the API keeps its data:
+
+- ``mongo`` (the default) connects Motor to MONGO_URL, as in production.
+- ``memory`` uses MemoryClient below, a process-local store implementing
+  the part of the Motor API the backend uses: the same query and update
+  operators, projections, sorting, unique (and partial) indexes, bulk
+  writes, the aggregation stages behind /api/admin/jobs and a GridFS
+  bucket.  The API, ``backend_test.py --in-process`` and benchmark.py run
+  on it without a MongoDB server or any network.
+
+The memory store is for tests and benchmarks.  Its data lives as long as
+the process and can't be shared with other processes, and TTL indexes are
+recorded but never expire anything.  Queries, updates or stages outside
+the supported subset raise NotImplementedError rather than quietly behave
+differently from MongoDB.
+"""
+import itertools
+import os
+import re
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidDocument
+from gridfs.errors import NoFile
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, WriteError
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+DATASTORE = os.environ.get('DATASTORE', 'mongo')
+DATASTORES = ("mongo", "memory")
+# Same as GridFS
+GRIDFS_CHUNK_SIZE = 255 * 1024
+
+# $type aliases and their BSON type numbers
+BSON_TYPES = {
+    "double": 1, "string": 2, "object": 3, "array": 4, "binData": 5,
+    "objectId": 7, "bool": 8, "date": 9, "null": 10, "regex": 11, "int": 16, "long": 18,
+}
+
+
+def connect(**motor_options):
+    """Client for the configured datastore, options are passed on to Motor"""
+    if DATASTORE not in DATASTORES:
+        raise ValueError(f"Unknown DATASTORE {DATASTORE!r}, expected one of {', '.join(DATASTORES)}")
+    if DATASTORE == "memory":
+        return MemoryClient()
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(os.environ['MONGO_URL'], **motor_options)
+
+
+def gridfs_bucket(database, bucket_name: str):
+    """GridFS bucket on a database from connect()"""
+    if isinstance(database, MemoryDatabase):
+        return MemoryGridFSBucket(database, bucket_name=bucket_name)
+    from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+    return AsyncIOMotorGridFSBucket(database, bucket_name=bucket_name)
+
+
+# ============ VALUES ============
+
+def to_bson(value):
+    """Copy a value the way a round trip through BSON would store it"""
+    if isinstance(value, dict):
+        copied = {}
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise InvalidDocument(f"documents must have only string keys, key was {key!r}")
+            copied[key] = to_bson(item)
+        return copied
+    if isinstance(value, (list, tuple)):
+        return [to_bson(item) for item in value]
+    if isinstance(value, datetime):
+        # BSON dates are UTC milliseconds, read back timezone-aware (tz_aware=True)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).replace(microsecond=value.microsecond // 1000 * 1000)
+    if value is None or isinstance(value, (str, int, float, bytes, ObjectId, re.Pattern)):
+        return value
+    raise InvalidDocument(f"cannot encode object: {value!r}, of type: {type(value)}")
+
+
+def clone(value):
+    """Copy a stored value so callers can't change the store through it"""
+    if isinstance(value, dict):
+        return {key: clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [clone(item) for item in value]
+    return value
+
+
+def type_order(value) -> int:
+    """Position of a value's type in MongoDB's comparison order"""
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    if isinstance(value, re.Pattern):
+        return 11
+    raise NotImplementedError(f"Unsupported value type: {type(value).__name__}")
+
+
+def sort_key(value):
+    """Hashable key that orders values like MongoDB does, across types too"""
+    order = type_order(value)
+    if order == 1:
+        return (1, 0)
+    if order == 4:
+        return (4, tuple((key, sort_key(item)) for key, item in value.items()))
+    if order == 5:
+        return (5, tuple(sort_key(item) for item in value))
+    if order == 6:
+        return (6, len(value), value)
+    if order == 7:
+        return (7, value.binary)
+    if order == 9 and value.tzinfo is None:
+        return (9, value.replace(tzinfo=timezone.utc))
+    if order == 11:
+        return (11, value.pattern, value.flags)
+    return (order, value)
+
+
+def bson_type(value) -> int:
+    if isinstance(value, float):
+        return 1
+    if isinstance(value, int) and not isinstance(value, bool):
+        return 16 if -2 ** 31 <= value < 2 ** 31 else 18
+    return {1: 10, 3: 2, 4: 3, 5: 4, 6: 5, 7: 7, 8: 8, 9: 9, 11: 11}[type_order(value)]
+
+
+def lookup(doc, path: str) -> list:
+    """Values at a dotted path, descending into arrays the way MongoDB does (empty when missing)"""
+    values = [doc]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit():
+                    if int(part) < len(value):
+                        found.append(value[int(part)])
+                else:
+                    found.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        values = found
+    return values
+
+
+def candidates(values: list):
+    """Values a condition is tested against: arrays match as a whole or by any element"""
+    for value in values:
+        if isinstance(value, list):
+            yield from value
+        yield value
+
+
+# ============ QUERIES ============
+
+def is_operator_dict(value) -> bool:
+    return isinstance(value, dict) and bool(value) and all(key.startswith("$") for key in value)
+
+
+def equals(values: list, target) -> bool:
+    if target is None:
+        return not values or any(value is None for value in candidates(values))
+    if isinstance(target, re.Pattern):
+        return any(isinstance(value, str) and target.search(value) for value in candidates(values))
+    target_key = sort_key(target)
+    return any(sort_key(value) == target_key for value in candidates(values))
+
+
+def compares(values: list, target, test) -> bool:
+    """Range operators only compare values of the same type, like MongoDB"""
+    order, target_key = type_order(target), sort_key(target)
+    return any(
+        type_order(value) == order and test(sort_key(value), target_key)
+        for value in candidates(values)
+    )
+
+
+def regex_matches(values: list, pattern, options: str = "") -> bool:
+    if not isinstance(pattern, re.Pattern):
+        flags = 0
+        for option in options:
+            flags |= {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}[option]
+        pattern = re.compile(pattern, flags)
+    return any(isinstance(value, str) and pattern.search(value) for value in candidates(values))
+
+
+def type_matches(values: list, expected) -> bool:
+    expected = expected if isinstance(expected, list) else [expected]
+    codes = set()
+    for alias in expected:
+        if alias == "number":
+            codes.update((1, 16, 18))
+        else:
+            codes.add(BSON_TYPES.get(alias, alias))
+    return any(bson_type(value) in codes for value in candidates(values))
+
+
+def field_matches(values: list, condition) -> bool:
+    if not is_operator_dict(condition):
+        return equals(values, condition)
+    for op, target in condition.items():
+        if op == "$eq":
+            matched = equals(values, target)
+        elif op == "$ne":
+            matched = not equals(values, target)
+        elif op == "$gt":
+            matched = compares(values, target, lambda a, b: a > b)
+        elif op == "$gte":
+            matched = compares(values, target, lambda a, b: a >= b)
+        elif op == "$lt":
+            matched = compares(values, target, lambda a, b: a < b)
+        elif op == "$lte":
+            matched = compares(values, target, lambda a, b: a <= b)
+        elif op == "$in":
+            matched = any(equals(values, item) for item in target)
+        elif op == "$nin":
+            matched = not any(equals(values, item) for item in target)
+        elif op == "$exists":
+            matched = bool(values) == bool(target)
+        elif op == "$type":
+            matched = type_matches(values, target)
+        elif op == "$regex":
+            matched = regex_matches(values, target, condition.get("$options", ""))
+        elif op == "$options":
+            continue
+        elif op == "$not":
+            matched = not field_matches(values, target)
+        else:
+            raise NotImplementedError(f"Query operator {op} is not supported by the memory datastore")
+        if not matched:
+            return False
+    return True
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """Whether doc matches a MongoDB query filter"""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            matched = all(matches(doc, clause) for clause in condition)
+        elif key == "$or":
+            matched = any(matches(doc, clause) for clause in condition)
+        elif key == "$nor":
+            matched = not any(matches(doc, clause) for clause in condition)
+        elif key.startswith("$"):
+            raise NotImplementedError(f"Query operator {key} is not supported by the memory datastore")
+        else:
+            matched = field_matches(lookup(doc, key), condition)
+        if not matched:
+            return False
+    return True
+
+
+# ============ UPDATES ============
+
+def set_path(doc: dict, path: str, value):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list) and part.isdigit():
+            target = target[int(part)]
+        elif isinstance(target, dict):
+            target = target.setdefault(part, {})
+        else:
+            raise WriteError(f"Cannot create field '{part}' in element {target!r}", 28)
+    last = parts[-1]
+    if isinstance(target, list) and last.isdigit():
+        target.extend([None] * (int(last) + 1 - len(target)))
+        target[int(last)] = value
+    elif isinstance(target, dict):
+        target[last] = value
+    else:
+        raise WriteError(f"Cannot create field '{last}' in element {target!r}", 28)
+
+
+def unset_path(doc: dict, path: str):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, dict) and part in target:
+            target = target[part]
+        elif isinstance(target, list) and part.isdigit() and int(part) < len(target):
+            target = target[int(part)]
+        else:
+            return
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+    elif isinstance(target, list) and parts[-1].isdigit() and int(parts[-1]) < len(target):
+        target[int(parts[-1])] = None
+
+
+def get_path(doc: dict, path: str):
+    target = doc
+    for part in path.split("."):
+        if isinstance(target, dict) and part in target:
+            target = target[part]
+        elif isinstance(target, list) and part.isdigit() and int(part) < len(target):
+            target = target[int(part)]
+        else:
+            return None
+    return target
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def inc_path(doc: dict, path: str, amount):
+    current = get_path(doc, path)
+    if not is_number(amount):
+        raise WriteError("Cannot increment with non-numeric argument", 14)
+    if current is not None and not is_number(current):
+        raise WriteError(f"Cannot apply $inc to a value of non-numeric type at '{path}'", 14)
+    set_path(doc, path, (current or 0) + amount)
+
+
+def extreme_path(doc: dict, path: str, value, test):
+    current = get_path(doc, path)
+    if current is None or test(sort_key(value), sort_key(current)):
+        set_path(doc, path, value)
+
+
+UPDATE_OPERATORS = {
+    "$set": lambda doc, path, value: set_path(doc, path, to_bson(value)),
+    "$setOnInsert": lambda doc, path, value: set_path(doc, path, to_bson(value)),
+    "$unset": lambda doc, path, value: unset_path(doc, path),
+    "$inc": inc_path,
+    "$min": lambda doc, path, value: extreme_path(doc, path, to_bson(value), lambda a, b: a < b),
+    "$max": lambda doc, path, value: extreme_path(doc, path, to_bson(value), lambda a, b: a > b),
+}
+
+
+def validate_update(update):
+    if isinstance(update, list):
+        raise NotImplementedError("Update pipelines are not supported by the memory datastore")
+    if not update or not all(key.startswith("$") for key in update):
+        raise ValueError("update only works with $ operators")
+    for op in update:
+        if op not in UPDATE_OPERATORS:
+            raise NotImplementedError(f"Update operator {op} is not supported by the memory datastore")
+
+
+def validate_replacement(replacement: dict):
+    if any(key.startswith("$") for key in replacement):
+        raise ValueError("replacement can not include $ operators")
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False) -> dict:
+    """Return a copy of doc with update applied"""
+    updated = clone(doc)
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            UPDATE_OPERATORS[op](updated, path, value)
+    if "_id" in doc and sort_key(updated.get("_id")) != sort_key(doc["_id"]):
+        raise WriteError("Performing an update on the path '_id' would modify the immutable field '_id'", 66)
+    return updated
+
+
+def upsert_seed(query: dict) -> dict:
+    """Fields an upsert copies from the equality conditions of its filter"""
+    doc = {}
+    for key, condition in query.items():
+        if key == "$and":
+            for clause in condition:
+                for path, value in upsert_seed(clause).items():
+                    set_path(doc, path, value)
+        elif key.startswith("$") or isinstance(condition, re.Pattern):
+            continue
+        elif is_operator_dict(condition):
+            if "$eq" in condition:
+                set_path(doc, key, to_bson(condition["$eq"]))
+        else:
+            set_path(doc, key, to_bson(condition))
+    return doc
+
+
+# ============ PROJECTIONS AND SORTING ============
+
+def projection_tree(paths) -> dict:
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is True:
+                break
+        else:
+            node[parts[-1]] = True
+    return tree
+
+
+def include(value, tree: dict):
+    if isinstance(value, list):
+        return [include(item, tree) for item in value if isinstance(item, (dict, list))]
+    projected = {}
+    for key, item in value.items():
+        branch = tree.get(key)
+        if branch is True:
+            projected[key] = clone(item)
+        elif branch and isinstance(item, (dict, list)):
+            projected[key] = include(item, branch)
+    return projected
+
+
+def exclude(value, tree: dict):
+    if isinstance(value, list):
+        return [exclude(item, tree) if isinstance(item, (dict, list)) else item for item in value]
+    projected = {}
+    for key, item in value.items():
+        branch = tree.get(key)
+        if branch is True:
+            continue
+        projected[key] = exclude(item, branch) if branch and isinstance(item, (dict, list)) else clone(item)
+    return projected
+
+
+def project(doc: dict, projection) -> dict:
+    """Apply a find() projection (field inclusion or exclusion, dotted paths allowed)"""
+    if not projection:
+        return clone(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    for field, flag in projection.items():
+        if not isinstance(flag, (bool, int)):
+            raise NotImplementedError(f"Projection of {field} is not supported by the memory datastore")
+    fields = {field: bool(flag) for field, flag in projection.items() if field != "_id"}
+    keep_id = bool(projection.get("_id", 1))
+    if any(fields.values()) or (not fields and keep_id):
+        if not all(fields.values()):
+            raise OperationFailure("Cannot do exclusion in an inclusion projection", 31254)
+        return include(doc, projection_tree([*fields, *(["_id"] if keep_id else [])]))
+    return exclude(doc, projection_tree([*fields, *([] if keep_id else ["_id"])]))
+
+
+def normalize_sort(key_or_list, direction=None) -> list:
+    if key_or_list is None:
+        return []
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(key, value) for key, value in key_or_list]
+
+
+def field_sort_key(doc: dict, path: str, descending: bool):
+    """Arrays sort by their smallest element ascending and their largest descending"""
+    values = list(itertools.chain.from_iterable(
+        value if isinstance(value, list) and value else [value] for value in lookup(doc, path)
+    ))
+    if not values:
+        return sort_key(None)
+    keys = [sort_key(value) for value in values]
+    return max(keys) if descending else min(keys)
+
+
+def sort_documents(docs: list, spec: list) -> list:
+    # Stable sorts from the last key to the first give a multi-key sort
+    for path, direction in reversed(spec):
+        if direction not in (1, -1):
+            raise NotImplementedError(f"Sort direction {direction!r} is not supported by the memory datastore")
+        docs = sorted(docs, key=lambda doc: field_sort_key(doc, path, direction == -1), reverse=direction == -1)
+    return docs
+
+
+# ============ AGGREGATION ============
+
+def evaluate(doc: dict, expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        values = lookup(doc, expression[1:])
+        return values[0] if len(values) == 1 else (values or None)
+    if isinstance(expression, dict):
+        if is_operator_dict(expression):
+            raise NotImplementedError(f"Expression {next(iter(expression))} is not supported by the memory datastore")
+        return {key: evaluate(doc, item) for key, item in expression.items()}
+    return expression
+
+
+def accumulate(op: str, values: list):
+    present = [value for value in values if value is not None]
+    if op == "$sum":
+        return sum(value for value in present if is_number(value))
+    if op == "$avg":
+        numbers = [value for value in present if is_number(value)]
+        return sum(numbers) / len(numbers) if numbers else None
+    if op == "$min":
+        return min(present, key=sort_key) if present else None
+    if op == "$max":
+        return max(present, key=sort_key) if present else None
+    if op == "$first":
+        return values[0] if values else None
+    if op == "$last":
+        return values[-1] if values else None
+    if op == "$push":
+        return values
+    if op == "$addToSet":
+        return list({sort_key(value): value for value in values}.values())
+    raise NotImplementedError(f"Accumulator {op} is not supported by the memory datastore")
+
+
+def group(docs: list, spec: dict) -> list:
+    groups = {}
+    for doc in docs:
+        group_id = evaluate(doc, spec["_id"])
+        rows = groups.setdefault(sort_key(group_id), (group_id, []))[1]
+        rows.append(doc)
+    results = []
+    for group_id, rows in groups.values():
+        result = {"_id": clone(group_id)}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expression), = accumulator.items()
+            result[field] = accumulate(op, [evaluate(row, expression) for row in rows])
+        results.append(result)
+    return results
+
+
+def run_pipeline(docs: list, pipeline: list) -> list:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name == "$group":
+            docs = group(docs, spec)
+        elif name == "$sort":
+            docs = sort_documents(docs, normalize_sort(spec))
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$project":
+            docs = [project(doc, spec) for doc in docs]
+        elif name == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        else:
+            raise NotImplementedError(f"Aggregation stage {name} is not supported by the memory datastore")
+    return docs
+
+
+# ============ COLLECTIONS ============
+
+class MemoryCursor:
+    """Result of find() and aggregate(), evaluated when first read"""
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def _results(self) -> list:
+        return self._fetch(self._sort, self._skip, self._limit)
+
+    async def to_list(self, length=None) -> list:
+        results = self._results()
+        return results if length is None else results[:length]
+
+    async def __aiter__(self):
+        for doc in self._results():
+            yield doc
+
+
+class MemoryIndex:
+    def __init__(self, name: str, keys: list, unique: bool = False, partial: dict = None, **options):
+        self.name = name
+        self.keys = keys
+        self.fields = [field for field, _ in keys]
+        self.unique = unique
+        self.partial = partial
+        self.options = options
+        # Values of the leading field -> ids of the documents holding them, to narrow equality lookups
+        self.entries = {}
+        self.unique_entries = {}
+
+    def entry_keys(self, doc: dict) -> set:
+        values = lookup(doc, self.fields[0])
+        return {sort_key(value) for value in candidates(values)} if values else {sort_key(None)}
+
+    def unique_key(self, doc: dict):
+        if not self.unique or (self.partial and not matches(doc, self.partial)):
+            return None
+        return tuple(sort_key(get_path(doc, field)) for field in self.fields)
+
+    def check(self, collection, doc: dict, doc_key):
+        unique_key = self.unique_key(doc)
+        if unique_key is not None and self.unique_entries.get(unique_key, doc_key) != doc_key:
+            dup = {field: get_path(doc, field) for field in self.fields}
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {collection.full_name} index: {self.name} dup key: {dup}",
+                11000, {"keyPattern": dict(self.keys), "keyValue": dup},
+            )
+
+    def add(self, doc: dict, doc_key):
+        for key in self.entry_keys(doc):
+            self.entries.setdefault(key, set()).add(doc_key)
+        unique_key = self.unique_key(doc)
+        if unique_key is not None:
+            self.unique_entries[unique_key] = doc_key
+
+    def remove(self, doc: dict, doc_key):
+        for key in self.entry_keys(doc):
+            ids = self.entries.get(key)
+            if ids is not None:
+                ids.discard(doc_key)
+                if not ids:
+                    del self.entries[key]
+        unique_key = self.unique_key(doc)
+        if unique_key is not None and self.unique_entries.get(unique_key) == doc_key:
+            del self.unique_entries[unique_key]
+
+
+class MemoryCollection:
+    """In-memory counterpart of a Motor collection.
+
+    Every method runs to completion without yielding to the event loop, so
+    each single-document operation is atomic the way it is in MongoDB.
+    """
+
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        # sort_key(_id) -> document, in insertion (natural) order
+        self._docs = {}
+        self._order = {}
+        self._counter = itertools.count()
+        self._indexes = {"_id_": MemoryIndex("_id_", [("_id", 1)], unique=True)}
+
+    def __getitem__(self, name: str):
+        return self.database[f"{self.name}.{name}"]
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    # Reads
+
+    def _equality_targets(self, query: dict):
+        """Ids of the documents an indexed equality condition in query allows, or None"""
+        for index in self._indexes.values():
+            condition = query.get(index.fields[0], ...)
+            if condition is ...:
+                continue
+            if is_operator_dict(condition):
+                if set(condition) == {"$eq"}:
+                    targets = [condition["$eq"]]
+                elif set(condition) == {"$in"}:
+                    targets = condition["$in"]
+                else:
+                    continue
+            else:
+                targets = [condition]
+            if any(isinstance(target, (dict, list, re.Pattern)) for target in targets):
+                continue
+            ids = set()
+            for target in targets:
+                ids.update(index.entries.get(sort_key(target), ()))
+            return ids
+        return None
+
+    def _select(self, query: dict) -> list:
+        query = query or {}
+        ids = self._equality_targets(query)
+        if ids is None:
+            docs = self._docs.values()
+        else:
+            docs = [self._docs[key] for key in sorted(ids, key=self._order.__getitem__)]
+        return [doc for doc in docs if matches(doc, query)]
+
+    def _find(self, query, projection, sort, skip, limit) -> list:
+        docs = self._select(query)
+        if sort:
+            docs = sort_documents(docs, sort)
+        docs = docs[skip:]
+        if limit:
+            docs = docs[:abs(limit)]
+        return [project(doc, projection) for doc in docs]
+
+    def _first(self, query: dict, sort) -> dict:
+        docs = self._select(query)
+        if sort:
+            docs = sort_documents(docs, normalize_sort(sort))
+        return docs[0] if docs else None
+
+    def find(self, filter=None, projection=None, sort=None, skip: int = 0, limit: int = 0) -> MemoryCursor:
+        cursor = MemoryCursor(lambda sort, skip, limit: self._find(filter, projection, sort, skip, limit))
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    async def find_one(self, filter=None, projection=None, sort=None):
+        doc = self._first(filter, sort)
+        return project(doc, projection) if doc is not None else None
+
+    async def count_documents(self, filter: dict, skip: int = 0, limit: int = 0) -> int:
+        count = max(0, len(self._select(filter)) - skip)
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter=None) -> list:
+        values = {}
+        for doc in self._select(filter):
+            for value in lookup(doc, key):
+                for item in (value if isinstance(value, list) else [value]):
+                    values.setdefault(sort_key(item), clone(item))
+        return list(values.values())
+
+    def aggregate(self, pipeline: list) -> MemoryCursor:
+        return MemoryCursor(lambda sort, skip, limit: run_pipeline(list(self._docs.values()), pipeline))
+
+    # Writes
+
+    def _store(self, doc: dict, previous: dict = None):
+        key = sort_key(doc["_id"])
+        for index in self._indexes.values():
+            index.check(self, doc, key)
+        for index in self._indexes.values():
+            if previous is not None:
+                index.remove(previous, key)
+            index.add(doc, key)
+        if key not in self._order:
+            self._order[key] = next(self._counter)
+        self._docs[key] = doc
+
+    def _remove(self, doc: dict):
+        key = sort_key(doc["_id"])
+        for index in self._indexes.values():
+            index.remove(doc, key)
+        del self._docs[key]
+        del self._order[key]
+
+    def _insert(self, document: dict):
+        # Like pymongo, fills in the caller's document _id
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        self._store(to_bson(document))
+        return document["_id"]
+
+    def _update(self, query: dict, update: dict, upsert: bool, multi: bool, sort=None, replace: bool = False):
+        """Returns (matched, modified, upserted_id, [(before, after), ...])"""
+        if replace:
+            validate_replacement(update)
+        else:
+            validate_update(update)
+        if multi:
+            docs = self._select(query)
+        else:
+            first = self._first(query, sort)
+            docs = [first] if first is not None else []
+
+        if not docs:
+            if not upsert:
+                return 0, 0, None, []
+            seed = {} if replace else upsert_seed(query)
+            doc = {**seed, **to_bson(update)} if replace else apply_update(seed, update, inserting=True)
+            if "_id" not in doc:
+                doc = {"_id": ObjectId(), **doc}
+            self._store(doc)
+            return 0, 0, doc["_id"], [(None, doc)]
+
+        changes = []
+        modified = 0
+        for doc in docs:
+            if replace:
+                updated = {"_id": doc["_id"], **to_bson(update)}
+                if sort_key(updated["_id"]) != sort_key(doc["_id"]):
+                    raise WriteError("The _id field cannot be changed", 66)
+            else:
+                updated = apply_update(doc, update)
+            if updated != doc:
+                self._store(updated, previous=doc)
+                modified += 1
+            changes.append((doc, updated))
+        return len(docs), modified, None, changes
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents, ordered: bool = True) -> InsertManyResult:
+        result = await self.bulk_write([InsertOne(document) for document in documents], ordered=ordered)
+        return InsertManyResult([document["_id"] for document in documents if "_id" in document][:result.inserted_count], True)
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        matched, modified, upserted_id, _ = self._update(filter, update, upsert, multi=False)
+        return update_result(matched, modified, upserted_id)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        matched, modified, upserted_id, _ = self._update(filter, update, upsert, multi=True)
+        return update_result(matched, modified, upserted_id)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False) -> UpdateResult:
+        matched, modified, upserted_id, _ = self._update(filter, replacement, upsert, multi=False, replace=True)
+        return update_result(matched, modified, upserted_id)
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection=None, sort=None,
+                                  upsert: bool = False, return_document: bool = False):
+        _, _, _, changes = self._update(filter, update, upsert, multi=False, sort=sort)
+        if not changes:
+            return None
+        before, after = changes[0]
+        doc = after if return_document else before
+        return project(doc, projection) if doc is not None else None
+
+    async def find_one_and_replace(self, filter: dict, replacement: dict, projection=None, sort=None,
+                                   upsert: bool = False, return_document: bool = False):
+        _, _, _, changes = self._update(filter, replacement, upsert, multi=False, sort=sort, replace=True)
+        if not changes:
+            return None
+        before, after = changes[0]
+        doc = after if return_document else before
+        return project(doc, projection) if doc is not None else None
+
+    async def find_one_and_delete(self, filter: dict, projection=None, sort=None):
+        doc = self._first(filter, sort)
+        if doc is None:
+            return None
+        self._remove(doc)
+        return project(doc, projection)
+
+    async def delete_one(self, filter: dict) -> DeleteResult:
+        doc = self._first(filter, None)
+        if doc is not None:
+            self._remove(doc)
+        return DeleteResult({"n": int(doc is not None)}, True)
+
+    async def delete_many(self, filter: dict) -> DeleteResult:
+        docs = self._select(filter)
+        for doc in docs:
+            self._remove(doc)
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True) -> BulkWriteResult:
+        result = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+        }
+        for position, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    docs = self._select(request._filter)
+                    for doc in docs if isinstance(request, DeleteMany) else docs[:1]:
+                        self._remove(doc)
+                        result["nRemoved"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    matched, modified, upserted_id, _ = self._update(
+                        request._filter, request._doc, request._upsert,
+                        multi=isinstance(request, UpdateMany), replace=isinstance(request, ReplaceOne)
+                    )
+                    result["nMatched"] += matched
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": position, "_id": upserted_id})
+                else:
+                    raise NotImplementedError(f"{type(request).__name__} is not supported by the memory datastore")
+            except WriteError as e:
+                result["writeErrors"].append({"index": position, "code": e.code, "errmsg": str(e), "op": request})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # Indexes
+
+    def _create_index(self, keys, **kwargs) -> str:
+        keys = normalize_sort(keys, 1)
+        name = kwargs.pop("name", None) or "_".join(f"{field}_{direction}" for field, direction in keys)
+        index = MemoryIndex(
+            name, keys, unique=kwargs.pop("unique", False), partial=kwargs.pop("partialFilterExpression", None), **kwargs
+        )
+        existing = self._indexes.get(name)
+        if existing is not None:
+            if (existing.keys, existing.unique, existing.partial, existing.options) != (index.keys, index.unique, index.partial, index.options):
+                raise OperationFailure(f"An existing index has the same name ({name}) but different options", 86)
+            return name
+        for key, doc in self._docs.items():
+            index.check(self, doc, key)
+            index.add(doc, key)
+        self._indexes[name] = index
+        return name
+
+    async def create_index(self, keys, **kwargs) -> str:
+        # TTL indexes (expireAfterSeconds) are recorded, documents never expire
+        return self._create_index(keys, **kwargs)
+
+    async def index_information(self) -> dict:
+        return {
+            name: {"key": index.keys, **({"unique": True} if index.unique else {}), **index.options}
+            for name, index in self._indexes.items()
+        }
+
+    async def drop(self):
+        self.database._collections.pop(self.name, None)
+
+
+def update_result(matched: int, modified: int, upserted_id) -> UpdateResult:
+    raw = {"n": matched or int(upserted_id is not None), "nModified": modified}
+    if upserted_id is not None:
+        raw["upserted"] = upserted_id
+    return UpdateResult(raw, True)
+
+
+class MemoryDatabase:
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def get_collection(self, name: str, **options) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return self.get_collection(name)
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    async def list_collection_names(self) -> list:
+        return list(self._collections)
+
+    async def drop_collection(self, name: str):
+        self._collections.pop(name, None)
+
+
+class MemoryClient:
+    """In-memory counterpart of AsyncIOMotorClient (DATASTORE=memory)"""
+
+    def __init__(self):
+        self._databases = {}
+
+    def get_database(self, name: str, **options) -> MemoryDatabase:
+        # Read preferences and other options don't apply to a single in-process copy
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(self, name)
+        return database
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        return self.get_database(name)
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_database(name)
+
+    async def drop_database(self, name: str):
+        self._databases.pop(name, None)
+
+    def close(self):
+        pass
+
+
+# ============ GRIDFS ============
+
+class MemoryGridIn:
+    def __init__(self, bucket, file_id, filename: str, metadata: dict, chunk_size: int):
+        self._bucket = bucket
+        self._id = file_id
+        self.filename = filename
+        self.metadata = metadata
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._chunks = 0
+        self._length = 0
+
+    def _flush(self, final: bool = False):
+        while len(self._buffer) >= self.chunk_size or (final and self._buffer):
+            data = bytes(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+            self._bucket._chunks._insert({"files_id": self._id, "n": self._chunks, "data": data})
+            self._chunks += 1
+
+    async def write(self, data: bytes):
+        self._buffer.extend(data)
+        self._length += len(data)
+        self._flush()
+
+    async def abort(self):
+        await self._bucket._chunks.delete_many({"files_id": self._id})
+
+    async def close(self):
+        self._flush(final=True)
+        self._bucket._files._insert({
+            "_id": self._id,
+            "length": self._length,
+            "chunkSize": self.chunk_size,
+            "uploadDate": datetime.now(timezone.utc),
+            "filename": self.filename,
+            **({"metadata": self.metadata} if self.metadata is not None else {}),
+        })
+
+
+class MemoryGridOut:
+    def __init__(self, bucket, file_doc: dict):
+        self._bucket = bucket
+        self._id = file_doc["_id"]
+        self.length = file_doc["length"]
+        self.chunk_size = file_doc["chunkSize"]
+        self.filename = file_doc.get("filename")
+        self.metadata = file_doc.get("metadata")
+        self.upload_date = file_doc["uploadDate"]
+        self._next_chunk = 0
+
+    async def readchunk(self) -> bytes:
+        chunk = await self._bucket._chunks.find_one({"files_id": self._id, "n": self._next_chunk})
+        if chunk is None:
+            return b""
+        self._next_chunk += 1
+        return chunk["data"]
+
+    async def read(self, size: int = -1) -> bytes:
+        data = bytearray()
+        while size < 0 or len(data) < size:
+            chunk = await self.readchunk()
+            if not chunk:
+                break
+            data.extend(chunk)
+        return bytes(data)
+
+
+class MemoryGridFSBucket:
+    """In-memory counterpart of AsyncIOMotorGridFSBucket, files and chunks are kept in the usual collections"""
+
+    def __init__(self, database: MemoryDatabase, bucket_name: str = "fs", chunk_size_bytes: int = GRIDFS_CHUNK_SIZE):
+        self._files = database[f"{bucket_name}.files"]
+        self._chunks = database[f"{bucket_name}.chunks"]
+        self._chunk_size = chunk_size_bytes
+        self._chunks._create_index([("files_id", 1), ("n", 1)], unique=True)
+
+    def open_upload_stream_with_id(self, file_id, filename: str, chunk_size_bytes: int = None, metadata: dict = None):
+        return MemoryGridIn(self, file_id, filename, metadata, chunk_size_bytes or self._chunk_size)
+
+    async def upload_from_stream_with_id(self, file_id, filename: str, source: bytes, chunk_size_bytes: int = None, metadata: dict = None):
+        grid_in = self.open_upload_stream_with_id(file_id, filename, chunk_size_bytes, metadata)
+        await grid_in.write(source)
+        await grid_in.close()
+
+    async def open_download_stream(self, file_id) -> MemoryGridOut:
+        file_doc = await self._files.find_one({"_id": file_id})
+        if file_doc is None:
+            raise NoFile(f"no file in gridfs collection {self._files.full_name!r} with _id {file_id!r}")
+        return MemoryGridOut(self, file_doc)
+
+    async def delete(self, file_id):
+        deleted = await self._files.delete_one({"_id": file_id})
+        await self._chunks.delete_many({"files_id": file_id})
+        if not deleted.deleted_count:
+            raise NoFile(f"File id {file_id!r} not found")
@@ -0,0 +1,327 @@
+"""Durable background jobs.
+
+Jobs are documents in the ``jobs`` collection.  A worker leases a due job
+by atomically switching it to ``running`` with a ``lease_until`` deadline,
+and renews the lease while the handler runs.  If the worker dies, the job
+is picked up again once its lease expires, or moved to ``dead`` if that was
+its last attempt, so a job that keeps killing its worker can't loop forever.
+The attempt number doubles as a fencing token, so a worker that lost its
+lease can't overwrite the outcome of the worker that took over.
+
+A failed job is retried with exponential backoff.  After its last attempt
+it is moved to ``dead``, where it stays until someone retries it by hand
+(POST /api/admin/jobs/{id}/retry).  Finished jobs are removed by a TTL index
+after JOB_RETENTION_SECONDS.
+
+Every job type has its own concurrency limit.  Handlers are coroutines that
+take a Job; CPU-bound handlers hand their rendering to the process pool
+themselves, since they also need the database around it.  A job can run more
+than once, so handlers must be idempotent.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '60'))
+# How often idle workers look for jobs enqueued by other processes
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '5'))
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', str(7 * 24 * 60 * 60)))
+JOB_RETRY_BASE_SECONDS = 5
+JOB_RETRY_MAX_SECONDS = 60 * 60
+# Recent jobs per type kept for latency metrics
+LATENCY_WINDOW = 500
+
+
+class DuplicateJob(Exception):
+    """Raised when a keyed job can't be queued because another job with its key already is"""
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with some jitter so failed jobs don't retry in lockstep"""
+    delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def latency_summary(samples) -> dict:
+    if not samples:
+        return {"avg_ms": None, "p95_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+    return {
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+class JobType:
+    def __init__(self, name: str, handler, concurrency: int, max_attempts: int):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.slots = asyncio.Semaphore(concurrency)
+        self.wakeup = asyncio.Event()
+        self.active = 0
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+        # Seconds from when a job was due until it started, and how long it ran
+        self.waits = deque(maxlen=LATENCY_WINDOW)
+        self.durations = deque(maxlen=LATENCY_WINDOW)
+
+
+class Job:
+    """A leased job, as seen by its handler"""
+
+    def __init__(self, runner, doc: dict):
+        self.runner = runner
+        self.id = doc["id"]
+        self.type = doc["type"]
+        self.payload = doc.get("payload") or {}
+        self.attempts = doc["attempts"]
+
+    async def progress(self, key: str, count: int = 1):
+        """Add to a progress counter shown with the job"""
+        await self.runner.database.jobs.update_one({"id": self.id}, {"$inc": {f"progress.{key}": count}})
+
+
+class JobRunner:
+    def __init__(self, database):
+        self.database = database
+        self.types = {}
+        self.loops = []
+        self.tasks = set()
+        self._stopping = False
+
+    def register(self, name: str, handler, concurrency: int = 1, max_attempts: int = 5):
+        self.types[name] = JobType(name, handler, concurrency, max_attempts)
+
+    async def enqueue(self, job_type: str, payload: dict = None, key: str = None, delay: float = 0):
+        """Queue a job.
+
+        A job enqueued with a key is dropped if another job with the same key
+        is still waiting to run, so repeated requests for the same work
+        (re-rendering one tarjeta) collapse into one job.
+        """
+        if job_type not in self.types:
+            raise ValueError(f"Unknown job type: {job_type}")
+        now = utcnow()
+        doc = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload or {},
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": self.types[job_type].max_attempts,
+            "progress": {},
+            "run_at": now + timedelta(seconds=delay),
+            "created_at": now,
+        }
+        if key is None:
+            # No key field at all, so unkeyed jobs stay out of the unique key index
+            await self.database.jobs.insert_one(doc)
+        else:
+            try:
+                await self.database.jobs.update_one(
+                    {"key": key, "status": "queued"}, {"$setOnInsert": doc}, upsert=True
+                )
+            except DuplicateKeyError:
+                pass  # Lost the race to an identical job
+        self.types[job_type].wakeup.set()
+
+    async def _bury_abandoned(self, spec: JobType, now: datetime):
+        """Dead-letter jobs whose worker vanished during their last attempt"""
+        result = await self.database.jobs.update_many(
+            {"type": spec.name, "status": "running", "lease_until": {"$lt": now},
+             "attempts": {"$gte": spec.max_attempts}},
+            {"$set": {"status": "dead", "dead_at": now, "lease_until": None,
+                      "last_error": "Lease expired on the last attempt"}}
+        )
+        spec.dead += result.modified_count
+
+    async def _claim(self, spec: JobType):
+        now = utcnow()
+        await self._bury_abandoned(spec, now)
+        return await self.database.jobs.find_one_and_update(
+            {"type": spec.name, "$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": spec.max_attempts}},
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "started_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _type_loop(self, spec: JobType):
+        """Keep up to spec.concurrency jobs of one type running"""
+        while not self._stopping:
+            await spec.slots.acquire()
+            spec.wakeup.clear()
+            try:
+                doc = await self._claim(spec)
+            except Exception:
+                spec.slots.release()
+                logger.exception("Could not claim %s job", spec.name)
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+
+            if doc is None:
+                spec.slots.release()
+                # Not wait_for: on 3.11 it can swallow a cancel that lands as the wait finishes
+                try:
+                    async with asyncio.timeout(JOB_POLL_SECONDS):
+                        await spec.wakeup.wait()
+                except TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._execute(spec, doc))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _renew_lease(self, job: Job):
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            await self.database.jobs.update_one(
+                {"id": job.id, "attempts": job.attempts, "status": "running"},
+                {"$set": {"lease_until": utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}}
+            )
+
+    async def _execute(self, spec: JobType, doc: dict):
+        job = Job(self, doc)
+        spec.active += 1
+        spec.waits.append(max(0.0, (utcnow() - doc["run_at"]).total_seconds()))
+        started = time.monotonic()
+        heartbeat = asyncio.create_task(self._renew_lease(job))
+        try:
+            await spec.handler(job)
+        except asyncio.CancelledError:
+            raise  # Shutting down, the lease expires and the job runs again elsewhere
+        except Exception as e:
+            logger.error("Job %s (%s) failed on attempt %d", job.id, spec.name, job.attempts, exc_info=e)
+            await self._fail(spec, doc, e)
+        else:
+            spec.completed += 1
+            await self.database.jobs.update_one(
+                {"id": job.id, "attempts": job.attempts},
+                {"$set": {"status": "done", "finished_at": utcnow(), "lease_until": None}}
+            )
+        finally:
+            heartbeat.cancel()
+            spec.active -= 1
+            spec.durations.append(time.monotonic() - started)
+            spec.slots.release()
+
+    async def _fail(self, spec: JobType, doc: dict, error: Exception):
+        now = utcnow()
+        if doc["attempts"] >= doc.get("max_attempts", spec.max_attempts):
+            spec.dead += 1
+            changes = {"status": "dead", "dead_at": now}
+        else:
+            spec.retried += 1
+            changes = {"status": "queued", "run_at": now + timedelta(seconds=retry_delay(doc["attempts"]))}
+        try:
+            await self.database.jobs.update_one(
+                {"id": doc["id"], "attempts": doc["attempts"]},
+                {"$set": {**changes, "last_error": repr(error), "lease_until": None}}
+            )
+        except DuplicateKeyError:
+            # A newer job with the same key is already queued and will do the same work
+            await self.database.jobs.delete_one({"id": doc["id"], "attempts": doc["attempts"]})
+
+    async def retry(self, job_id: str) -> bool:
+        """Queue a dead job again with a fresh set of attempts"""
+        try:
+            result = await self.database.jobs.update_one(
+                {"id": job_id, "status": "dead"},
+                {"$set": {"status": "queued", "attempts": 0, "run_at": utcnow()}, "$unset": {"dead_at": ""}}
+            )
+        except DuplicateKeyError:
+            raise DuplicateJob(job_id)
+        if result.modified_count:
+            doc = await self.database.jobs.find_one({"id": job_id}, {"_id": 0, "type": 1})
+            if doc and doc["type"] in self.types:
+                self.types[doc["type"]].wakeup.set()
+        return result.modified_count > 0
+
+    async def metrics(self) -> dict:
+        """Queue depth per status plus this process's throughput and latency, per job type"""
+        counts = {}
+        async for row in self.database.jobs.aggregate([
+            {"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}}
+        ]):
+            counts.setdefault(row["_id"]["type"], {})[row["_id"]["status"]] = row["count"]
+
+        oldest = {}
+        async for row in self.database.jobs.aggregate([
+            {"$match": {"status": "queued"}},
+            {"$group": {"_id": "$type", "run_at": {"$min": "$run_at"}}}
+        ]):
+            oldest[row["_id"]] = row["run_at"]
+
+        now = utcnow()
+        metrics = {}
+        for name in sorted(set(self.types) | set(counts)):
+            spec = self.types.get(name)
+            due = oldest.get(name)
+            metrics[name] = {
+                "queued": counts.get(name, {}).get("queued", 0),
+                "running": counts.get(name, {}).get("running", 0),
+                "dead": counts.get(name, {}).get("dead", 0),
+                "done": counts.get(name, {}).get("done", 0),
+                "oldest_queued_seconds": max(0.0, (now - due).total_seconds()) if due else None,
+            }
+            if spec:
+                metrics[name].update({
+                    "concurrency": spec.concurrency,
+                    "active": spec.active,
+                    "completed": spec.completed,
+                    "retried": spec.retried,
+                    "dead_lettered": spec.dead,
+                    "wait": latency_summary(spec.waits),
+                    "run": latency_summary(spec.durations),
+                })
+        return metrics
+
+    async def start(self):
+        self._stopping = False
+        await self.database.jobs.create_index("id", unique=True)
+        await self.database.jobs.create_index([("type", 1), ("status", 1), ("run_at", 1)])
+        await self.database.jobs.create_index(
+            "key", unique=True, partialFilterExpression={"status": "queued", "key": {"$exists": True}}
+        )
+        await self.database.jobs.create_index("finished_at", expireAfterSeconds=JOB_RETENTION_SECONDS)
+        for spec in self.types.values():
+            self.loops.append(asyncio.create_task(self._type_loop(spec)))
+
+    async def stop(self):
+        """Stop claiming jobs and cancel running ones (their leases expire and they run again)"""
+        self._stopping = True
+        for spec in self.types.values():
+            spec.wakeup.set()
+        pending = self.loops + list(self.tasks)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.loops = []
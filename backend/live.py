@@ -0,0 +1,129 @@
+"""Live editor sessions.
+
+Editors connected over WebSocket send field-level patches.  The hub keeps
+one in-memory session per tarjeta, merges patches into it, broadcasts them
+to every editor (and preview) connected to that tarjeta and persists the
+accumulated changes with a single debounced ``$set``.  A burst of colour and
+text tweaks therefore becomes one write instead of one full PUT per change.
+
+Sessions live in the process that accepted the connection, so all editors
+of one tarjeta must reach the same instance for broadcasts to be shared.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EditorSession:
+    def __init__(self, tarjeta_id: str, state: dict):
+        self.tarjeta_id = tarjeta_id
+        self.state = state
+        self.pending = {}
+        self.pending_since = None
+        self.version = 0
+        self.sockets = set()
+        self.flush_task = None
+        self.lock = asyncio.Lock()
+
+
+class EditorHub:
+    def __init__(self, persist, debounce: float, max_delay: float):
+        # persist(tarjeta_id, fields) writes the accumulated changes
+        self.persist = persist
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.sessions = {}
+
+    def join(self, tarjeta_id: str, websocket, state: dict) -> EditorSession:
+        session = self.sessions.get(tarjeta_id)
+        if session is None:
+            session = self.sessions[tarjeta_id] = EditorSession(tarjeta_id, state)
+        session.sockets.add(websocket)
+        return session
+
+    async def leave(self, session: EditorSession, websocket):
+        session.sockets.discard(websocket)
+        if not session.sockets:
+            await self.flush(session)
+            if not session.sockets and self.sessions.get(session.tarjeta_id) is session:
+                del self.sessions[session.tarjeta_id]
+
+    async def apply(self, session: EditorSession, fields: dict):
+        """Merge a patch into the session, broadcast it and schedule a write"""
+        changed = {k: v for k, v in fields.items() if session.state.get(k) != v}
+        if not changed:
+            return
+        session.state.update(changed)
+        session.pending.update(changed)
+        session.version += 1
+        if session.pending_since is None:
+            session.pending_since = time.monotonic()
+
+        await self.broadcast(session, {"type": "patch", "fields": changed, "version": session.version})
+
+        # Continuous typing keeps pushing the write back, but never past max_delay
+        if session.flush_task:
+            session.flush_task.cancel()
+        waited = time.monotonic() - session.pending_since
+        delay = max(0.0, min(self.debounce, self.max_delay - waited))
+        session.flush_task = asyncio.create_task(self._flush_later(session, delay))
+
+    async def refresh(self, tarjeta_id: str, fields: dict):
+        """Take in fields written outside the session (a REST update) and broadcast them.
+
+        The outside write is newer, so it also replaces any pending edit of the
+        same field instead of being overwritten by the next flush.
+        """
+        session = self.sessions.get(tarjeta_id)
+        if session is None:
+            return
+        for field in fields:
+            session.pending.pop(field, None)
+        if not session.pending:
+            session.pending_since = None
+        changed = {k: v for k, v in fields.items() if session.state.get(k) != v}
+        if not changed:
+            return
+        session.state.update(changed)
+        session.version += 1
+        await self.broadcast(session, {"type": "patch", "fields": changed, "version": session.version})
+
+    async def _flush_later(self, session: EditorSession, delay: float):
+        await asyncio.sleep(delay)
+        session.flush_task = None
+        await self.flush(session)
+
+    async def flush(self, session: EditorSession):
+        """Persist whatever is pending right now"""
+        if session.flush_task and session.flush_task is not asyncio.current_task():
+            session.flush_task.cancel()
+            session.flush_task = None
+        async with session.lock:
+            if not session.pending:
+                return
+            fields, session.pending, session.pending_since = session.pending, {}, None
+            version = session.version
+            try:
+                await self.persist(session.tarjeta_id, fields)
+            except Exception:
+                # Put the changes back (newer patches win) so the next flush retries them
+                session.pending = {**fields, **session.pending}
+                session.pending_since = session.pending_since or time.monotonic()
+                logger.exception("Could not persist live edits for tarjeta %s", session.tarjeta_id)
+                await self.broadcast(session, {"type": "error", "detail": "Could not save changes"})
+                return
+        await self.broadcast(session, {"type": "saved", "version": version})
+
+    async def broadcast(self, session: EditorSession, message: dict):
+        for websocket in list(session.sockets):
+            try:
+                await websocket.send_json(message)
+            except Exception:
+                session.sockets.discard(websocket)
+
+    async def close(self):
+        """Flush every session (on shutdown)"""
+        for session in list(self.sessions.values()):
+            await self.flush(session)
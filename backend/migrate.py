@@ -0,0 +1,241 @@
+"""Resumable data migrations.
+
+Each migration walks one collection in ``_id`` order, transforms the matching
+documents in batches with ``bulk_write`` and records its position in the
+``migrations`` collection after every batch.  An interrupted run picks up
+after the last completed batch, and every transform only touches documents
+still in the old shape, so running a migration twice is harmless.
+
+    python migrate.py                  # run every pending migration
+    python migrate.py --list           # show progress
+    python migrate.py --only dates_users --rerun --ops-per-sec 500
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+from quotas import inline_archivo_bytes
+from search import SEARCH_FIELDS, search_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_OPS_PER_SEC = 2000
+
+
+class Migration:
+    def __init__(self, name: str, collection: str, query: dict, projection: dict, transform):
+        self.name = name
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        # transform(doc) -> dict of fields to $set, or None to leave the doc alone
+        self.transform = transform
+
+
+def parse_date(value):
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return value
+
+
+def dates_migration(collection: str, fields: list) -> Migration:
+    """Convert ISO string dates to BSON dates"""
+    def transform(doc):
+        changes = {field: parse_date(doc[field]) for field in fields if isinstance(doc.get(field), str)}
+        return changes or None
+
+    return Migration(
+        name=f"dates_{collection}",
+        collection=collection,
+        query={"$or": [{field: {"$type": "string"}} for field in fields]},
+        projection={field: 1 for field in fields},
+        transform=transform,
+    )
+
+
+TARJETA_DEFAULTS = {
+    "descripcion": "",
+    "color_tema": "#6366f1",
+    "telefono": "",
+    "whatsapp": "",
+    "email": "",
+    "foto_url": "",
+    "qr_url": "",
+    "archivo_negocio": "",
+    "archivo_negocio_tipo": "",
+    "archivo_negocio_nombre": "",
+    "archivo_negocio_preview": "",
+    "plantilla_id": 1,
+}
+
+
+def tarjeta_defaults(doc):
+    changes = {field: value for field, value in TARJETA_DEFAULTS.items() if field not in doc}
+    if "archivo_negocio_bytes" not in doc:
+        changes["archivo_negocio_bytes"] = inline_archivo_bytes(doc.get("archivo_negocio", ""))
+    return changes or None
+
+
+def tarjeta_search(doc):
+    changes = {"search_tokens": search_tokens(doc)}
+    if "directorio" not in doc:
+        changes["directorio"] = False
+    return changes
+
+
+def enlace_defaults(doc):
+    return {"orden": 0} if "orden" not in doc else None
+
+
+MIGRATIONS = [
+    dates_migration("users", ["created_at"]),
+    dates_migration("user_sessions", ["created_at", "expires_at"]),
+    dates_migration("tarjetas", ["created_at"]),
+    dates_migration("enlaces", ["created_at"]),
+    dates_migration("uploads", ["created_at", "updated_at"]),
+    Migration(
+        name="defaults_tarjetas",
+        collection="tarjetas",
+        query={"$or": [{field: {"$exists": False}} for field in [*TARJETA_DEFAULTS, "archivo_negocio_bytes"]]},
+        # Includes archivo_negocio, needed to size attachments stored before byte tracking
+        projection={field: 1 for field in [*TARJETA_DEFAULTS, "archivo_negocio_bytes"]},
+        transform=tarjeta_defaults,
+    ),
+    Migration(
+        name="search_tarjetas",
+        collection="tarjetas",
+        query={"search_tokens": {"$exists": False}},
+        projection={field: 1 for field in [*SEARCH_FIELDS, "directorio"]},
+        transform=tarjeta_search,
+    ),
+    Migration(
+        name="defaults_enlaces",
+        collection="enlaces",
+        query={"orden": {"$exists": False}},
+        projection={"orden": 1},
+        transform=enlace_defaults,
+    ),
+]
+
+
+async def run_migration(database, migration: Migration, batch_size: int, ops_per_sec: float, rerun: bool = False):
+    """Run (or resume) one migration, returns the number of modified documents"""
+    state = await database.migrations.find_one({"name": migration.name}) or {}
+    if state.get("status") == "done" and not rerun:
+        logger.info("%s: already done, skipping", migration.name)
+        return 0
+
+    last_id = None if rerun else state.get("last_id")
+    if rerun or not state:
+        await database.migrations.update_one(
+            {"name": migration.name},
+            {"$set": {
+                "collection": migration.collection,
+                "status": "running",
+                "last_id": None,
+                "processed": 0,
+                "modified": 0,
+                "started_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc),
+            }},
+            upsert=True,
+        )
+    elif last_id is not None:
+        logger.info("%s: resuming after _id %s", migration.name, last_id)
+
+    collection = database[migration.collection]
+    modified_total = 0
+    while True:
+        query = dict(migration.query)
+        if last_id is not None:
+            query = {"$and": [query, {"_id": {"$gt": last_id}}]}
+
+        started = time.monotonic()
+        batch = await collection.find(query, migration.projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            changes = migration.transform(doc)
+            if changes:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        modified = 0
+        if ops:
+            result = await collection.bulk_write(ops, ordered=False)
+            modified = result.modified_count
+
+        last_id = batch[-1]["_id"]
+        modified_total += modified
+        await database.migrations.update_one(
+            {"name": migration.name},
+            {
+                "$set": {"last_id": last_id, "updated_at": datetime.now(timezone.utc)},
+                "$inc": {"processed": len(batch), "modified": modified},
+            },
+        )
+
+        # Throttle to the target rate so the migration doesn't starve live traffic
+        delay = len(batch) / ops_per_sec - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    await database.migrations.update_one(
+        {"name": migration.name},
+        {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc)}},
+    )
+    logger.info("%s: done, %d documents modified", migration.name, modified_total)
+    return modified_total
+
+
+async def run_migrations(database, names=None, batch_size=DEFAULT_BATCH_SIZE,
+                         ops_per_sec=DEFAULT_OPS_PER_SEC, rerun=False):
+    for migration in MIGRATIONS:
+        if names and migration.name not in names:
+            continue
+        await run_migration(database, migration, batch_size, ops_per_sec, rerun)
+
+
+async def list_migrations(database):
+    states = {state["name"]: state async for state in database.migrations.find({}, {"_id": 0})}
+    for migration in MIGRATIONS:
+        state = states.get(migration.name, {})
+        print(f"{migration.name:24} {state.get('status', 'pending'):8} "
+              f"processed={state.get('processed', 0)} modified={state.get('modified', 0)}")
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Run resumable data migrations")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="run only these migrations")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--ops-per-sec", type=float, default=DEFAULT_OPS_PER_SEC)
+    parser.add_argument("--rerun", action="store_true", help="start over even if already done")
+    parser.add_argument("--list", action="store_true", help="show migration progress and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    database = client[os.environ['DB_NAME']]
+    try:
+        if args.list:
+            asyncio.run(list_migrations(database))
+        else:
+            asyncio.run(run_migrations(database, args.only, args.batch_size, args.ops_per_sec, args.rerun))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
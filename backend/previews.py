@@ -0,0 +1,144 @@
+"""Preview generation for archivo_negocio attachments.
+
+Rendering runs in worker processes (PDF rasterising and JPEG resampling are
+CPU bound), so the functions called from the pool only take and return plain
+strings.  Run this module directly to backfill previews for existing cards:
+
+    python previews.py --workers 4
+"""
+import argparse
+import asyncio
+import base64
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pymupdf
+from PIL import Image
+
+from uploads import read_file
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_MAX_SIZE = (480, 480)
+PREVIEW_QUALITY = 70
+# Rasterise the first PDF page at this zoom before downscaling
+PDF_RENDER_ZOOM = 1.5
+
+
+def decode_data_url(value: str) -> tuple:
+    """Split a base64 data URL into (mime_type, raw bytes)"""
+    mime_type = "application/octet-stream"
+    if value.startswith("data:") and "," in value:
+        header, value = value.split(",", 1)
+        mime_type = header[5:].split(";", 1)[0] or mime_type
+    return mime_type, base64.b64decode(value)
+
+
+def render_preview(raw: bytes, tipo: str) -> str:
+    """Render a JPEG preview data URL for a PDF (first page) or JPG attachment"""
+    if tipo == "pdf":
+        with pymupdf.open(stream=raw, filetype="pdf") as document:
+            pixmap = document[0].get_pixmap(matrix=pymupdf.Matrix(PDF_RENDER_ZOOM, PDF_RENDER_ZOOM))
+            image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    else:
+        image = Image.open(io.BytesIO(raw))
+        image.draft("RGB", PREVIEW_MAX_SIZE)
+        image = image.convert("RGB")
+
+    image.thumbnail(PREVIEW_MAX_SIZE)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=PREVIEW_QUALITY, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode("ascii")
+
+
+async def generate_preview(database, pool, tarjeta_id: str) -> bool:
+    """Render and store the preview for one tarjeta, returns False if nothing was stored"""
+    tarjeta = await database.tarjetas.find_one(
+        {"id": tarjeta_id},
+        {
+            "_id": 0,
+            "archivo_negocio": 1,
+            "archivo_negocio_file_id": 1,
+            "archivo_negocio_tipo": 1,
+            "archivo_negocio_version": 1,
+        },
+    )
+    if not tarjeta:
+        return False
+
+    loop = asyncio.get_running_loop()
+    try:
+        # Chunked uploads live in GridFS, older attachments inline as base64
+        if tarjeta.get("archivo_negocio_file_id"):
+            raw = await read_file(database, tarjeta["archivo_negocio_file_id"])
+        elif tarjeta.get("archivo_negocio"):
+            _, raw = decode_data_url(tarjeta["archivo_negocio"])
+        else:
+            return False
+        preview = await loop.run_in_executor(
+            pool, render_preview, raw, tarjeta.get("archivo_negocio_tipo", "")
+        )
+    except Exception:
+        logger.exception("Could not render preview for tarjeta %s", tarjeta_id)
+        return False
+
+    # Only store it if the attachment was not replaced while we were rendering
+    result = await database.tarjetas.update_one(
+        {"id": tarjeta_id, "archivo_negocio_version": tarjeta.get("archivo_negocio_version")},
+        {"$set": {"archivo_negocio_preview": preview}},
+    )
+    return result.modified_count > 0
+
+
+async def backfill_previews(database, workers: int) -> int:
+    """Generate previews for every tarjeta with an attachment but no preview"""
+    cursor = database.tarjetas.find(
+        {
+            "$or": [
+                {"archivo_negocio": {"$nin": ["", None]}},
+                {"archivo_negocio_file_id": {"$nin": ["", None]}},
+            ],
+            "archivo_negocio_preview": {"$in": ["", None]},
+        },
+        {"_id": 0, "id": 1},
+    )
+    pending = set()
+    generated = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        async for tarjeta in cursor:
+            pending.add(asyncio.create_task(generate_preview(database, pool, tarjeta["id"])))
+            # Keep the cursor from running far ahead of the pool
+            if len(pending) >= workers * 2:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                generated += sum(1 for task in done if task.result())
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            generated += sum(1 for task in done if task.result())
+
+    return generated
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Backfill archivo_negocio previews")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        generated = asyncio.run(backfill_previews(client[os.environ['DB_NAME']], args.workers))
+        logger.info("Generated %d previews", generated)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Opt-in request profiling and slow-request sampling.
+
+A request is traced when it carries the admin token in ``X-Profile`` or is
+picked by ``PROFILE_SAMPLE_RATE``.  A traced request records how long every
+MongoDB command took (via a pymongo command listener; Motor runs commands in
+threads that inherit the request's context) and, when no other request holds
+the profiler, a cProfile of the request.  Traces of requests slower than
+``PROFILE_SLOW_MS`` (or explicitly requested via the header) are written as
+JSON files to a bounded ring in ``PROFILE_DIR``.
+
+cProfile is per-thread, so other coroutines that run on the event loop while
+the traced request awaits show up in its profile too; the Mongo timings are
+exact per request.
+"""
+import asyncio
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', '/tmp/tarjetas-profiles'))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '50'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_TOP_FUNCTIONS = 40
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+# Only one cProfile can be active on the event loop thread at a time
+_profiler_lock = threading.Lock()
+
+
+class RequestTrace:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc)
+        self.commands = []
+        self._collections = {}
+        self.profile_text = None
+
+    def mongo_summary(self) -> dict:
+        return {
+            "count": len(self.commands),
+            "total_ms": round(sum(c["duration_ms"] for c in self.commands), 3),
+            "commands": self.commands,
+        }
+
+
+class MongoTimingListener(monitoring.CommandListener):
+    """Attach MongoDB command timings to the trace of the current request"""
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is not None:
+            target = event.command.get(event.command_name)
+            trace._collections[event.request_id] = target if isinstance(target, str) else None
+
+    def _finish(self, event, ok: bool):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.commands.append({
+                "command": event.command_name,
+                "collection": trace._collections.pop(event.request_id, None),
+                "duration_ms": event.duration_micros / 1000,
+                "ok": ok,
+            })
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+
+def format_profile(profiler: cProfile.Profile) -> str:
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    return output.getvalue()
+
+
+def trace_filename(trace: RequestTrace) -> str:
+    path = re.sub(r"[^A-Za-z0-9]+", "-", trace.path).strip("-")[:60] or "root"
+    return f"{trace.started_at.strftime('%Y%m%dT%H%M%S%f')}-{trace.method}-{path}.json"
+
+
+def write_trace(trace: RequestTrace, status: int, duration_ms: float):
+    """Write a trace file and drop the oldest ones beyond PROFILE_MAX_FILES"""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    data = {
+        "method": trace.method,
+        "path": trace.path,
+        "status": status,
+        "duration_ms": round(duration_ms, 3),
+        "started_at": trace.started_at.isoformat(),
+        "mongo": trace.mongo_summary(),
+        "profile": trace.profile_text,
+    }
+    (PROFILE_DIR / trace_filename(trace)).write_text(json.dumps(data, indent=2))
+
+    # Names start with a timestamp, so sorting them sorts by age
+    files = sorted(PROFILE_DIR.glob("*.json"))
+    for old in files[:-PROFILE_MAX_FILES]:
+        old.unlink(missing_ok=True)
+
+
+def list_traces() -> list:
+    if not PROFILE_DIR.exists():
+        return []
+    traces = []
+    for path in sorted(PROFILE_DIR.glob("*.json"), reverse=True):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        traces.append({
+            "name": path.name,
+            "method": data.get("method"),
+            "path": data.get("path"),
+            "status": data.get("status"),
+            "duration_ms": data.get("duration_ms"),
+            "mongo_ms": data.get("mongo", {}).get("total_ms"),
+            "started_at": data.get("started_at"),
+        })
+    return traces
+
+
+def read_trace(name: str):
+    """Read one trace file, None if it doesn't exist"""
+    path = PROFILE_DIR / Path(name).name
+    if path.suffix != ".json" or not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that traces sampled or explicitly requested HTTP requests"""
+
+    def __init__(self, app, admin_token: str = None):
+        self.app = app
+        self.admin_token = admin_token
+
+    def _forced(self, scope) -> bool:
+        if not self.admin_token:
+            return False
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile":
+                return value.decode("latin-1") == self.admin_token
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        forced = self._forced(scope)
+        if not forced and (PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE):
+            return await self.app(scope, receive, send)
+
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = cProfile.Profile() if _profiler_lock.acquire(blocking=False) else None
+        started = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if profiler:
+                profiler.disable()
+                _profiler_lock.release()
+            duration_ms = (time.perf_counter() - started) * 1000
+            current_trace.reset(token)
+
+            if forced or duration_ms >= PROFILE_SLOW_MS:
+                if profiler:
+                    trace.profile_text = format_profile(profiler)
+                try:
+                    await asyncio.to_thread(write_trace, trace, status, duration_ms)
+                except OSError:
+                    logger.exception("Could not write profile trace")
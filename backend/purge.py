@@ -0,0 +1,110 @@
+"""Background purging of deleted tarjetas and accounts.
+
+Deleting a tarjeta only marks it with ``deleted_at``, which hides it from
+every lookup at once, releases its quota and queues a ``purge`` job.
+Deleting an account does the same for all of its tarjetas, ends its
+sessions and queues one job for the user.  The job (see jobs.py) removes
+the dependent data in batches and records how much it removed in the job's
+``progress``.  Every step can be repeated safely, so a job that failed or
+was interrupted is simply run again from the start.
+
+A deleted tarjeta gives up its slug, and a deleted account its email, as
+soon as it is marked, so both can be taken again before the purge runs.
+"""
+import logging
+import os
+from datetime import datetime, timezone
+
+from gridfs.errors import NoFile
+
+import uploads
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', '500'))
+
+
+def tombstone(doc_id: str) -> str:
+    """Placeholder slug or email for a deleted document (generate_slug never yields "~")"""
+    return f"deleted~{doc_id}"
+
+
+async def soft_delete_tarjetas(database, query: dict, now: datetime) -> int:
+    """Mark matching live tarjetas deleted and free their slugs, returns how many"""
+    deleted = 0
+    async for tarjeta in database.tarjetas.find({**query, "deleted_at": None}, {"_id": 0, "id": 1}):
+        result = await database.tarjetas.update_one(
+            {"id": tarjeta["id"], "deleted_at": None},
+            {"$set": {"deleted_at": now, "slug": tombstone(tarjeta["id"])}}
+        )
+        deleted += result.modified_count
+    return deleted
+
+
+async def delete_in_batches(database, job, collection: str, query: dict) -> int:
+    """Delete matching documents PURGE_BATCH_SIZE at a time, returns how many were deleted"""
+    deleted = 0
+    while True:
+        batch = await database[collection].find(query, {"_id": 1}).limit(PURGE_BATCH_SIZE).to_list(PURGE_BATCH_SIZE)
+        if not batch:
+            return deleted
+        result = await database[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        deleted += result.deleted_count
+        await job.progress(collection, result.deleted_count)
+
+
+async def purge_uploads(database, job, query: dict):
+    """Delete upload records and their temporary files"""
+    async for upload in database.uploads.find(query, {"_id": 0, "id": 1}):
+        uploads.discard_upload_file(upload["id"])
+    await delete_in_batches(database, job, "uploads", query)
+
+
+async def purge_tarjeta(database, job, tarjeta_id: str):
+    """Remove a deleted tarjeta with its enlaces, uploads and stored attachment"""
+    tarjeta = await database.tarjetas.find_one(
+        {"id": tarjeta_id, "deleted_at": {"$ne": None}},
+        {"_id": 0, "id": 1, "archivo_negocio_file_id": 1}
+    )
+    if not tarjeta:
+        return  # Already purged
+
+    await delete_in_batches(database, job, "enlaces", {"tarjeta_id": tarjeta_id})
+    await purge_uploads(database, job, {"tarjeta_id": tarjeta_id})
+    if tarjeta.get("archivo_negocio_file_id"):
+        try:
+            await uploads.get_bucket(database).delete(tarjeta["archivo_negocio_file_id"])
+        except NoFile:
+            pass
+
+    # The tarjeta goes last so a retry can still find what's left of it
+    result = await database.tarjetas.delete_one({"id": tarjeta_id})
+    await job.progress("tarjetas", result.deleted_count)
+
+
+async def purge_user(database, job, user_id: str):
+    """Remove a deleted account with its sessions, tarjetas and everything under them"""
+    await delete_in_batches(database, job, "user_sessions", {"user_id": user_id})
+
+    # Catches tarjetas created while the account was being deleted
+    await soft_delete_tarjetas(database, {"usuario_id": user_id}, datetime.now(timezone.utc))
+    while True:
+        batch = await database.tarjetas.find(
+            {"usuario_id": user_id}, {"_id": 0, "id": 1}
+        ).limit(PURGE_BATCH_SIZE).to_list(PURGE_BATCH_SIZE)
+        if not batch:
+            break
+        for tarjeta in batch:
+            await purge_tarjeta(database, job, tarjeta["id"])
+
+    await purge_uploads(database, job, {"usuario_id": user_id})
+    result = await database.users.delete_one({"id": user_id, "deleted_at": {"$ne": None}})
+    await job.progress("users", result.deleted_count)
+
+
+PURGERS = {"tarjeta": purge_tarjeta, "user": purge_user}
+
+
+async def run_purge(database, job):
+    """Handler for purge jobs, payload {"kind": "tarjeta" | "user", "target_id": ...}"""
+    await PURGERS[job.payload["kind"]](database, job, job.payload["target_id"])
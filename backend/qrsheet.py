@@ -0,0 +1,179 @@
+"""Local QR code rendering and streamed QR sheets (multi-page PDF or ZIP).
+
+The render_* functions are CPU bound and run in worker processes, so they
+only take and return plain values.  The writers turn rendered pieces into
+output bytes incrementally: each call returns just the bytes produced by
+that piece, which lets the endpoint stream the archive as it is built.
+"""
+import io
+import zipfile
+from datetime import datetime
+
+import qrcode
+from qrcode.image.pil import PilImage
+
+# A4 in PDF points
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+QR_SIZE = 400
+QR_BORDER = 4
+
+
+def qr_matrix(data: str) -> list:
+    qr = qrcode.QRCode(border=QR_BORDER, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def dark_runs(row: list):
+    """Yield (start, length) for each horizontal run of dark modules"""
+    start = None
+    for x, dark in enumerate(row + [False]):
+        if dark and start is None:
+            start = x
+        elif not dark and start is not None:
+            yield start, x - start
+            start = None
+
+
+def render_png(data: str, box_size: int = 10) -> bytes:
+    qr = qrcode.QRCode(border=QR_BORDER, box_size=box_size, image_factory=PilImage)
+    qr.add_data(data)
+    qr.make(fit=True)
+    output = io.BytesIO()
+    qr.make_image().save(output)
+    return output.getvalue()
+
+
+def render_svg(data: str) -> bytes:
+    matrix = qr_matrix(data)
+    size = len(matrix)
+    path = "".join(
+        f"M{x} {y}h{length}v1h-{length}z"
+        for y, row in enumerate(matrix)
+        for x, length in dark_runs(row)
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/><path fill="#000" d="{path}"/></svg>'
+    ).encode("utf-8")
+
+
+def pdf_text(value: str) -> str:
+    """Escape a string for a PDF literal (WinAnsi encoded)"""
+    value = value.encode("cp1252", errors="replace").decode("latin-1")
+    return value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def render_pdf_page(data: str, label: str) -> bytes:
+    """Build the content stream for one sheet page: a vector QR code plus its label"""
+    matrix = qr_matrix(data)
+    module = QR_SIZE / len(matrix)
+    left = (PAGE_WIDTH - QR_SIZE) / 2
+    top = PAGE_HEIGHT - 120
+
+    ops = ["0 g"]
+    for y, row in enumerate(matrix):
+        for x, length in dark_runs(row):
+            ops.append(f"{left + x * module:.2f} {top - (y + 1) * module:.2f} {length * module:.2f} {module:.2f} re")
+    ops.append("f")
+
+    ops.append(f"BT /F1 20 Tf {left:.2f} {top - QR_SIZE - 40:.2f} Td ({pdf_text(label)}) Tj ET")
+    ops.append(f"BT /F1 10 Tf {left:.2f} {top - QR_SIZE - 60:.2f} Td ({pdf_text(data)}) Tj ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+class PdfSheetWriter:
+    """Write a multi-page PDF one page at a time.
+
+    Objects 1-3 (catalog, page tree, font) are referenced by every page but
+    written last, once the page list is known; the xref table records real
+    byte offsets so the order of objects in the file doesn't matter.
+    """
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.page_ids = []
+        self.next_id = 4
+
+    def _emit(self, chunks: list, data: bytes):
+        chunks.append(data)
+        self.position += len(data)
+
+    def _object(self, chunks: list, object_id: int, body: bytes):
+        self.offsets[object_id] = self.position
+        self._emit(chunks, f"{object_id} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def start(self) -> bytes:
+        chunks = []
+        self._emit(chunks, b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        return b"".join(chunks)
+
+    def add_page(self, content: bytes) -> bytes:
+        chunks = []
+        page_id, content_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        self._object(chunks, page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+        self._object(chunks, content_id, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        return b"".join(chunks)
+
+    def finish(self) -> bytes:
+        chunks = []
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._object(chunks, 1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(chunks, 2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        self._object(chunks, 3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+        xref_offset = self.position
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[object_id]:010d} 00000 n \n" for object_id in range(1, self.next_id)]
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self._emit(chunks, "".join(lines).encode())
+        return b"".join(chunks)
+
+
+class _DrainableBuffer(io.RawIOBase):
+    """Non-seekable sink that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class ZipSheetWriter:
+    """Write a ZIP archive one file at a time without keeping earlier files in memory"""
+
+    def __init__(self):
+        self.sink = _DrainableBuffer()
+        # A non-seekable sink makes zipfile use data descriptors instead of seeking back
+        self.archive = zipfile.ZipFile(self.sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+
+    def start(self) -> bytes:
+        return b""
+
+    def add_file(self, name: str, content: bytes) -> bytes:
+        info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        self.archive.writestr(info, content)
+        return self.sink.drain()
+
+    def finish(self) -> bytes:
+        self.archive.close()
+        return self.sink.drain()
@@ -0,0 +1,155 @@
+"""Plan limits and per-user usage counters.
+
+Usage is kept on the user document as ``usage.tarjetas``, ``usage.enlaces``
+and ``usage.bytes`` and maintained with ``$inc`` by the write handlers, so
+enforcing a limit never needs to count documents.  Each tarjeta also keeps
+``enlaces_count``, which is what deleting it gives back.  The reconciliation
+job here recomputes all of these from the collections and repairs any drift.
+Run it once by hand with:
+
+    python quotas.py
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# None means unlimited
+PLAN_LIMITS = {
+    "free": {
+        "max_upload_bytes": 5 * 1024 * 1024,
+        "max_tarjetas": 3,
+        "max_enlaces": 10,
+        "max_storage_bytes": 10 * 1024 * 1024,
+    },
+    "premium": {
+        "max_upload_bytes": 25 * 1024 * 1024,
+        "max_tarjetas": None,
+        "max_enlaces": None,
+        "max_storage_bytes": 1024 * 1024 * 1024,
+    },
+}
+
+EMPTY_USAGE = {"tarjetas": 0, "enlaces": 0, "bytes": 0}
+
+
+def get_plan_limits(plan: str) -> dict:
+    return PLAN_LIMITS.get(plan, PLAN_LIMITS["free"])
+
+
+def inline_archivo_bytes(archivo: str) -> int:
+    """Decoded size of a base64 (data URL) attachment"""
+    if not archivo:
+        return 0
+    encoded = archivo.split(",", 1)[1] if archivo.startswith("data:") else archivo
+    return len(encoded) * 3 // 4 - encoded[-2:].count("=")
+
+
+async def compute_usage(database, user_id: str) -> dict:
+    """Recompute a user's usage from the collections"""
+    tarjeta_ids = []
+    legacy_ids = []
+    stored_bytes = 0
+    async for tarjeta in database.tarjetas.find(
+        {"usuario_id": user_id, "deleted_at": None}, {"_id": 0, "id": 1, "archivo_negocio_bytes": 1}
+    ):
+        tarjeta_ids.append(tarjeta["id"])
+        if "archivo_negocio_bytes" in tarjeta:
+            stored_bytes += tarjeta["archivo_negocio_bytes"] or 0
+        else:
+            legacy_ids.append(tarjeta["id"])
+
+    # Attachments stored before byte tracking only have the base64 string
+    if legacy_ids:
+        async for tarjeta in database.tarjetas.find(
+            {"id": {"$in": legacy_ids}}, {"_id": 0, "archivo_negocio": 1}
+        ):
+            stored_bytes += inline_archivo_bytes(tarjeta.get("archivo_negocio", ""))
+
+    enlaces = 0
+    if tarjeta_ids:
+        enlaces = await database.enlaces.count_documents({"tarjeta_id": {"$in": tarjeta_ids}})
+
+    return {"tarjetas": len(tarjeta_ids), "enlaces": enlaces, "bytes": stored_bytes}
+
+
+async def reconcile_enlace_counts(database, user_id: str) -> int:
+    """Repair the enlaces_count of a user's tarjetas, returns how many had drifted"""
+    stored = {
+        tarjeta["id"]: tarjeta.get("enlaces_count")
+        async for tarjeta in database.tarjetas.find(
+            {"usuario_id": user_id, "deleted_at": None}, {"_id": 0, "id": 1, "enlaces_count": 1}
+        )
+    }
+    if not stored:
+        return 0
+    counts = {}
+    async for row in database.enlaces.aggregate([
+        {"$match": {"tarjeta_id": {"$in": list(stored)}}},
+        {"$group": {"_id": "$tarjeta_id", "count": {"$sum": 1}}},
+    ]):
+        counts[row["_id"]] = row["count"]
+
+    repaired = 0
+    for tarjeta_id, count in stored.items():
+        actual = counts.get(tarjeta_id, 0)
+        if count != actual:
+            # Also fills in tarjetas from before the counter (null matches a missing field)
+            result = await database.tarjetas.update_one(
+                {"id": tarjeta_id, "enlaces_count": count}, {"$set": {"enlaces_count": actual}}
+            )
+            repaired += result.modified_count
+    return repaired
+
+
+async def reconcile_user_usage(database, user_id: str, current=None) -> bool:
+    """Repair one user's counters, returns True if they had drifted"""
+    counts_drifted = await reconcile_enlace_counts(database, user_id) > 0
+    usage = await compute_usage(database, user_id)
+    if usage == current:
+        return counts_drifted
+    # Only overwrite if no handler touched the counters while we were counting
+    result = await database.users.update_one(
+        {"id": user_id, "usage": current}, {"$set": {"usage": usage}}
+    )
+    return result.modified_count > 0 or counts_drifted
+
+
+async def reconcile_usage(database) -> int:
+    """Repair counters for every user, returns how many had drifted"""
+    repaired = 0
+    async for user in database.users.find({}, {"_id": 0, "id": 1, "usage": 1}):
+        if await reconcile_user_usage(database, user["id"], user.get("usage")):
+            repaired += 1
+    return repaired
+
+
+async def reconcile_loop(database, interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            repaired = await reconcile_usage(database)
+            if repaired:
+                logger.warning("Repaired usage counters for %d users", repaired)
+        except Exception:
+            logger.exception("Usage reconciliation failed")
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        repaired = asyncio.run(reconcile_usage(client[os.environ['DB_NAME']]))
+        logger.info("Repaired usage counters for %d users", repaired)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Prefix search over tarjetas.
+
+Every tarjeta stores ``search_tokens``: the accent-folded, lowercased words
+of its nombre, descripcion and email.  A query is folded the same way and
+each of its words must be a prefix of some token.  MongoDB answers that
+with anchored regexes on a multikey index (``^jos`` becomes an index range
+scan), so "jose" finds "José" and "gar mar" finds "María García".
+"""
+import re
+import unicodedata
+
+SEARCH_FIELDS = ("nombre", "descripcion", "email")
+# Bound the index entries per tarjeta (long descripciones)
+MAX_TOKENS = 64
+MAX_QUERY_TOKENS = 5
+MIN_TOKEN_LENGTH = 2
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# Fields returned by search results
+SUMMARY_PROJECTION = {
+    "_id": 0, "id": 1, "slug": 1, "nombre": 1, "descripcion": 1,
+    "email": 1, "color_tema": 1, "vcard_photo": 1,
+}
+SUMMARY_DESCRIPCION_LENGTH = 160
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, so "Núñez" and "nunez" compare equal"""
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> list:
+    return WORD_PATTERN.findall(fold(text or ""))
+
+
+def search_tokens(tarjeta: dict) -> list:
+    tokens = []
+    for field in SEARCH_FIELDS:
+        value = tarjeta.get(field) or ""
+        words = tokenize(value)
+        if field == "email" and value:
+            # Also match the whole address and its local part
+            words = [fold(value), fold(value.split("@")[0]), *words]
+        for word in words:
+            if len(word) >= MIN_TOKEN_LENGTH and word not in tokens:
+                tokens.append(word)
+    return tokens[:MAX_TOKENS]
+
+
+def search_query(q: str) -> dict:
+    """Filter matching every word of q as a token prefix (empty for a blank query)"""
+    words = list(dict.fromkeys(tokenize(q)))[:MAX_QUERY_TOKENS]
+    if not words:
+        return {}
+    clauses = [{"search_tokens": {"$regex": f"^{re.escape(word)}"}} for word in words]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def summarize(tarjeta: dict) -> dict:
+    """Turn a SUMMARY_PROJECTION document into a search result"""
+    descripcion = tarjeta.get("descripcion") or ""
+    if len(descripcion) > SUMMARY_DESCRIPCION_LENGTH:
+        descripcion = descripcion[:SUMMARY_DESCRIPCION_LENGTH].rstrip() + "…"
+    return {
+        "id": tarjeta["id"],
+        "slug": tarjeta["slug"],
+        "nombre": tarjeta.get("nombre", ""),
+        "descripcion": descripcion,
+        "email": tarjeta.get("email") or "",
+        "color_tema": tarjeta.get("color_tema") or "#6366f1",
+        "foto_url": tarjeta.get("vcard_photo") or "",
+    }
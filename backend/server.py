@@ -1,17 +1,37 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Cookie
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Cookie, Query, WebSocket, WebSocketDisconnect
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import StreamingResponse
+from pymongo import ReturnDocument
+from pymongo.read_preferences import ReadPreference, read_pref_mode_from_name, make_read_preference
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
+from typing import List, Literal, Optional
 import uuid
+from collections import deque
 from datetime import datetime, timezone, timedelta
 import httpx
 import re
+import json
+from urllib.parse import urlsplit
 from passlib.context import CryptContext
+from concurrent.futures import ProcessPoolExecutor
+
+from previews import decode_data_url, generate_preview
+import uploads
+import qrsheet
+from live import EditorHub
+import profiling
+from singleflight import SingleFlight, query_key
+from quotas import get_plan_limits, inline_archivo_bytes, reconcile_loop, reconcile_user_usage
+from vcard import VCARD_FIELDS, VcardRefresher, refresh_vcard
+import purge
+import datastore
+from jobs import DuplicateJob, JobRunner
+from search import SEARCH_FIELDS, SUMMARY_PROJECTION, search_query, search_tokens, summarize
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -19,11 +39,66 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# MongoDB connection (DATASTORE=memory keeps everything in-process, see datastore.py)
+# Dates are stored as BSON dates (see migrate.py) and come back timezone-aware
+client = datastore.connect(
+    tz_aware=True,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+    # Records command timings for profiled requests (no-op otherwise)
+    event_listeners=[profiling.MongoTimingListener()]
+)
 db = client[os.environ['DB_NAME']]
 
+def public_read_preference():
+    """Read preference for public, cache-tolerant reads (QR scans)"""
+    mode = read_pref_mode_from_name(os.environ.get('MONGO_PUBLIC_READ_PREFERENCE', 'secondaryPreferred'))
+    if mode == ReadPreference.PRIMARY.mode:  # primary doesn't take a staleness bound
+        return make_read_preference(mode, None)
+    # MongoDB requires at least 90 seconds, -1 means no bound
+    max_staleness = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', '90'))
+    return make_read_preference(mode, None, max_staleness=max_staleness)
+
+# Auth and owner reads stay on the primary through db, public lookups may be
+# served by a secondary through public_db
+public_db = client.get_database(os.environ['DB_NAME'], read_preference=public_read_preference())
+
+# Grants access to /api/admin endpoints and forces profiling via X-Profile
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Browser origins allowed to call the API and open the live editor socket
+CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
+
+# Worker processes for CPU-bound rendering (attachment previews, QR codes)
+PROCESS_POOL_WORKERS = int(os.environ.get('PROCESS_POOL_WORKERS', '2'))
+process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS)
+
+ARCHIVO_TIPOS = {"pdf": "application/pdf", "jpg": "image/jpeg"}
+# QR codes rendered ahead of the one being streamed
+QR_RENDER_WINDOW = int(os.environ.get('QR_RENDER_WINDOW', '8'))
+QR_SHEET_MAX_TARJETAS = 500
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+# Fields the live editor may change (attachments and photos go through their own endpoints)
+LIVE_FIELDS = {"nombre", "descripcion", "color_tema", "telefono", "whatsapp", "email", "plantilla_id"}
+LIVE_DEBOUNCE_SECONDS = float(os.environ.get('LIVE_DEBOUNCE_SECONDS', '1.5'))
+LIVE_MAX_DELAY_SECONDS = float(os.environ.get('LIVE_MAX_DELAY_SECONDS', '10'))
+UPLOAD_SWEEP_INTERVAL = int(os.environ.get('UPLOAD_SWEEP_INTERVAL', '900'))
+QUOTA_RECONCILE_INTERVAL = int(os.environ.get('QUOTA_RECONCILE_INTERVAL', str(6 * 60 * 60)))
+# Usage counter -> plan limit that caps it
+QUOTA_LIMIT_KEYS = {"tarjetas": "max_tarjetas", "enlaces": "max_enlaces", "bytes": "max_storage_bytes"}
+
+VCARD_MAX_AGE_SECONDS = int(os.environ.get('VCARD_MAX_AGE_SECONDS', '300'))
+
+# Jobs of each type run at once per process (previews and vCard photos also share the process pool)
+JOB_CONCURRENCY = {"preview": PROCESS_POOL_WORKERS, "vcard": 4, "purge": 2}
+
+# Concurrent identical hot lookups share a single in-flight query
+lookups = SingleFlight(timeout=float(os.environ.get('LOOKUP_TIMEOUT_SECONDS', '10')))
+
+# Keep references to fire-and-forget tasks so they aren't garbage collected
+background_tasks = set()
+
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -37,6 +112,11 @@ logger = logging.getLogger(__name__)
 
 # ============ MODELS ============
 
+class Usage(BaseModel):
+    tarjetas: int = 0
+    enlaces: int = 0
+    bytes: int = 0
+
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -45,6 +125,7 @@ class User(BaseModel):
     password_hash: Optional[str] = None  # For password-based auth
     picture: Optional[str] = None
     plan: str = "free"
+    usage: Optional[Usage] = None  # Counters for plan quotas, see quotas.py
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class UserSession(BaseModel):
@@ -86,7 +167,10 @@ class Tarjeta(BaseModel):
     archivo_negocio: Optional[str] = ""  # PDF or JPG in base64
     archivo_negocio_tipo: Optional[str] = ""  # 'pdf' or 'jpg'
     archivo_negocio_nombre: Optional[str] = ""
+    archivo_negocio_preview: Optional[str] = ""  # JPEG thumbnail as base64 data URL
+    archivo_negocio_url: Optional[str] = ""  # Lazy download link (public responses only)
     plantilla_id: int = 1
+    directorio: bool = False  # Listed in the owner's public directory
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class TarjetaCreate(BaseModel):
@@ -101,6 +185,7 @@ class TarjetaCreate(BaseModel):
     archivo_negocio_tipo: Optional[str] = ""
     archivo_negocio_nombre: Optional[str] = ""
     plantilla_id: Optional[int] = 1
+    directorio: Optional[bool] = False
 
 class TarjetaUpdate(BaseModel):
     nombre: Optional[str] = None
@@ -114,6 +199,34 @@ class TarjetaUpdate(BaseModel):
     archivo_negocio_tipo: Optional[str] = None
     archivo_negocio_nombre: Optional[str] = None
     plantilla_id: Optional[int] = None
+    directorio: Optional[bool] = None
+
+class TarjetaResumen(BaseModel):
+    id: str
+    slug: str
+    nombre: str
+    descripcion: str = ""
+    email: str = ""
+    color_tema: str = "#6366f1"
+    foto_url: str = ""  # Small thumbnail
+
+class TarjetaSearchPage(BaseModel):
+    items: List[TarjetaResumen]
+    page: int
+    limit: int
+    has_more: bool
+
+class QrSheetRequest(BaseModel):
+    tarjeta_ids: Optional[List[str]] = None  # None means all the user's tarjetas
+    formato: Literal["pdf", "zip"] = "pdf"
+    imagen: Literal["png", "svg"] = "png"  # File type inside the ZIP
+
+class UploadInit(BaseModel):
+    tarjeta_id: str
+    nombre: str
+    tipo: str  # 'pdf' or 'jpg'
+    size: int
+    sha256: str
 
 class Enlace(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -136,6 +249,25 @@ class EnlaceUpdate(BaseModel):
 
 # ============ AUTH HELPERS ============
 
+async def shared_lookup(key: str, fn):
+    """Run a read through the single-flight group, mapping timeouts to 503"""
+    try:
+        return await lookups.do(key, fn)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Lookup timed out")
+
+async def find_session_user(session_token: str) -> Optional[dict]:
+    """Find the user doc behind a valid session"""
+    session = await db.user_sessions.find_one({
+        "session_token": session_token,
+        "expires_at": {"$gt": datetime.now(timezone.utc)}
+    })
+    
+    if not session:
+        return None
+    
+    return await db.users.find_one({"id": session["user_id"], "deleted_at": None}, {"_id": 0})
+
 async def get_current_user(request: Request) -> Optional[User]:
     """Get user from session_token (cookie or Authorization header)"""
     session_token = request.cookies.get("session_token")
@@ -148,24 +280,14 @@ async def get_current_user(request: Request) -> Optional[User]:
     if not session_token:
         return None
     
-    # Find valid session
-    session = await db.user_sessions.find_one({
-        "session_token": session_token,
-        "expires_at": {"$gt": datetime.now(timezone.utc).isoformat()}
-    })
-    
-    if not session:
-        return None
-    
-    # Find user
-    user_doc = await db.users.find_one({"id": session["user_id"]}, {"_id": 0})
+    # Find valid session and its user
+    user_doc = await shared_lookup(
+        query_key(db.user_sessions, {"session_token": session_token}),
+        lambda: find_session_user(session_token)
+    )
     if not user_doc:
         return None
     
-    # Convert ISO string back to datetime if needed
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-    
     return User(**user_doc)
 
 async def require_auth(request: Request) -> User:
@@ -175,6 +297,105 @@ async def require_auth(request: Request) -> User:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
+def run_in_background(coro):
+    """Schedule a coroutine without awaiting it, logging any failure"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+
+    def on_done(t):
+        background_tasks.discard(t)
+        if not t.cancelled() and t.exception():
+            logger.error("Background task failed", exc_info=t.exception())
+
+    task.add_done_callback(on_done)
+    return task
+
+async def schedule_preview(tarjeta_id: str):
+    """Queue rendering of the archivo_negocio preview for a tarjeta"""
+    await job_runner.enqueue("preview", {"tarjeta_id": tarjeta_id}, key=f"preview:{tarjeta_id}")
+
+async def schedule_vcard(tarjeta_id: str, refresh_photo: bool = False):
+    """Queue a rebuild of the stored vCard of a tarjeta"""
+    key = f"vcard-photo:{tarjeta_id}" if refresh_photo else f"vcard:{tarjeta_id}"
+    await job_runner.enqueue("vcard", {"tarjeta_id": tarjeta_id, "refresh_photo": refresh_photo}, key=key)
+
+async def schedule_purge(kind: str, target_id: str):
+    """Queue the purge of a deleted tarjeta or user"""
+    await job_runner.enqueue("purge", {"kind": kind, "target_id": target_id}, key=f"purge:{kind}:{target_id}")
+
+def require_admin(request: Request):
+    """Require the admin token, raise 403 otherwise"""
+    if not ADMIN_TOKEN or request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+def plan_limits(user: User) -> dict:
+    """Get the limits for the user's plan"""
+    return get_plan_limits(user.plan)
+
+def check_archivo_size(user: User, archivo: Optional[str]):
+    """Reject inline base64 attachments larger than the plan allows"""
+    if inline_archivo_bytes(archivo) > plan_limits(user)["max_upload_bytes"]:
+        raise HTTPException(status_code=413, detail="File exceeds your plan's size limit")
+
+async def reserve_usage(user: User, counter: str, amount: int = 1):
+    """Atomically increment a usage counter, raise 403 if it would exceed the plan limit"""
+    if amount <= 0:
+        await release_usage(user.id, counter, -amount)
+        return
+    
+    # Accounts created before quotas get their counters computed once
+    if user.usage is None:
+        await reconcile_user_usage(db, user.id)
+    
+    query = {"id": user.id}
+    limit = plan_limits(user)[QUOTA_LIMIT_KEYS[counter]]
+    if limit is not None:
+        query[f"usage.{counter}"] = {"$lte": limit - amount}
+    
+    result = await db.users.update_one(query, {"$inc": {f"usage.{counter}": amount}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=403, detail=f"Plan limit reached for {counter}")
+
+async def release_usage(user_id: str, counter: str, amount: int = 1):
+    """Decrement a usage counter"""
+    if amount:
+        await db.users.update_one({"id": user_id}, {"$inc": {f"usage.{counter}": -amount}})
+
+def tarjeta_public_url(slug: str) -> str:
+    """Public URL of a tarjeta, as encoded in its QR code"""
+    frontend_url = os.environ.get('REACT_APP_BACKEND_URL', '').replace('/api', '')
+    return f"{frontend_url}/t/{slug}"
+
+vcard_refresher = VcardRefresher(
+    lambda tarjeta_id, refresh_photo: refresh_vcard(db, process_pool, tarjeta_id, tarjeta_public_url, refresh_photo)
+)
+
+job_runner = JobRunner(db)
+job_runner.register(
+    "preview",
+    lambda job: generate_preview(db, process_pool, job.payload["tarjeta_id"]),
+    concurrency=JOB_CONCURRENCY["preview"]
+)
+job_runner.register(
+    "vcard",
+    lambda job: vcard_refresher.run(job.payload["tarjeta_id"], job.payload.get("refresh_photo", False)),
+    concurrency=JOB_CONCURRENCY["vcard"]
+)
+job_runner.register("purge", lambda job: purge.run_purge(db, job), concurrency=JOB_CONCURRENCY["purge"], max_attempts=8)
+
+async def search_tarjetas(collection, query: dict, q: str, page: int, limit: int) -> dict:
+    """One page of tarjeta summaries matching query and the search words in q"""
+    docs = await collection.find(
+        {**query, **search_query(q)}, SUMMARY_PROJECTION
+    ).sort("nombre", 1).skip((page - 1) * limit).limit(limit + 1).to_list(limit + 1)
+    
+    return {
+        "items": [summarize(doc) for doc in docs[:limit]],
+        "page": page,
+        "limit": limit,
+        "has_more": len(docs) > limit,
+    }
+
 def generate_slug(nombre: str) -> str:
     """Generate URL-safe slug from name"""
     slug = nombre.lower()
@@ -188,7 +409,7 @@ def generate_slug(nombre: str) -> str:
 async def register(user_input: UserRegister, response: Response):
     """Register new user with email and password"""
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_input.email}, {"_id": 0})
+    existing_user = await db.users.find_one({"email": user_input.email, "deleted_at": None}, {"_id": 0})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -207,7 +428,8 @@ async def register(user_input: UserRegister, response: Response):
         "password_hash": password_hash,
         "picture": "",
         "plan": "free",
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "usage": {"tarjetas": 1, "enlaces": 0, "bytes": 0},  # Counts the default tarjeta
+        "created_at": datetime.now(timezone.utc)
     }
     await db.users.insert_one(user_data)
     
@@ -231,18 +453,23 @@ async def register(user_input: UserRegister, response: Response):
         "archivo_negocio": "",
         "archivo_negocio_tipo": "",
         "archivo_negocio_nombre": "",
+        "archivo_negocio_bytes": 0,
+        "enlaces_count": 0,
         "plantilla_id": 1,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "directorio": False,
+        "created_at": datetime.now(timezone.utc)
     }
+    tarjeta_data["search_tokens"] = search_tokens(tarjeta_data)
     await db.tarjetas.insert_one(tarjeta_data)
+    await schedule_vcard(tarjeta_data['id'])
     
     # Create session
     session_token = str(uuid.uuid4())
     session_doc = {
         "user_id": user_id,
         "session_token": session_token,
-        "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=7),
+        "created_at": datetime.now(timezone.utc)
     }
     await db.user_sessions.insert_one(session_doc)
     
@@ -263,7 +490,7 @@ async def register(user_input: UserRegister, response: Response):
 async def login(user_input: UserLogin, response: Response):
     """Login user with email and password"""
     # Find user
-    user = await db.users.find_one({"email": user_input.email}, {"_id": 0})
+    user = await db.users.find_one({"email": user_input.email, "deleted_at": None}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
@@ -280,8 +507,8 @@ async def login(user_input: UserLogin, response: Response):
     session_doc = {
         "user_id": user["id"],
         "session_token": session_token,
-        "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=7),
+        "created_at": datetime.now(timezone.utc)
     }
     await db.user_sessions.insert_one(session_doc)
     
@@ -314,51 +541,166 @@ async def logout(request: Request, response: Response):
     response.delete_cookie(key="session_token", path="/")
     return {"success": True}
 
+@api_router.delete("/auth/me")
+async def delete_account(request: Request, response: Response):
+    """Delete the current user's account and everything in it"""
+    user = await require_auth(request)
+    
+    now = datetime.now(timezone.utc)
+    # The email and slugs are freed right away, so they can be used again before the purge
+    await db.users.update_one(
+        {"id": user.id, "deleted_at": None},
+        {"$set": {"deleted_at": now, "email": purge.tombstone(user.id)}}
+    )
+    await purge.soft_delete_tarjetas(db, {"usuario_id": user.id}, now)
+    await db.user_sessions.delete_many({"user_id": user.id})
+    
+    await schedule_purge("user", user.id)
+    
+    response.delete_cookie(key="session_token", path="/")
+    return {"success": True}
+
 # ============ TARJETAS ENDPOINTS ============
 
 @api_router.get("/tarjetas", response_model=List[Tarjeta])
 async def get_tarjetas(request: Request):
     """Get all user's tarjetas"""
     user = await require_auth(request)
-    tarjetas = await db.tarjetas.find({"usuario_id": user.id}, {"_id": 0}).to_list(100)
-    
-    for tarjeta in tarjetas:
-        if isinstance(tarjeta.get('created_at'), str):
-            tarjeta['created_at'] = datetime.fromisoformat(tarjeta['created_at'])
+    tarjetas = await db.tarjetas.find({"usuario_id": user.id, "deleted_at": None}, {"_id": 0}).to_list(100)
     
     return tarjetas
 
+@api_router.get("/tarjetas/buscar", response_model=TarjetaSearchPage)
+async def buscar_tarjetas(
+    request: Request,
+    q: str = "",
+    page: int = Query(1, ge=1),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE)
+):
+    """Search the user's tarjetas by nombre, descripcion and email"""
+    user = await require_auth(request)
+    return await search_tarjetas(db.tarjetas, {"usuario_id": user.id, "deleted_at": None}, q, page, limit)
+
 @api_router.get("/tarjetas/{tarjeta_id}", response_model=Tarjeta)
 async def get_tarjeta(tarjeta_id: str, request: Request):
     """Get specific tarjeta"""
     user = await require_auth(request)
-    tarjeta = await db.tarjetas.find_one({"id": tarjeta_id, "usuario_id": user.id}, {"_id": 0})
+    tarjeta = await db.tarjetas.find_one({"id": tarjeta_id, "usuario_id": user.id, "deleted_at": None}, {"_id": 0})
     
     if not tarjeta:
         raise HTTPException(status_code=404, detail="Tarjeta not found")
     
-    if isinstance(tarjeta.get('created_at'), str):
-        tarjeta['created_at'] = datetime.fromisoformat(tarjeta['created_at'])
-    
     return tarjeta
 
 @api_router.get("/tarjetas/slug/{slug}", response_model=Tarjeta)
 async def get_tarjeta_by_slug(slug: str):
     """Get tarjeta by slug (public)"""
-    tarjeta = await db.tarjetas.find_one({"slug": slug}, {"_id": 0})
+    # The attachment itself is served lazily by get_archivo_by_slug, the vCard by get_vcard
+    query = {"slug": slug, "deleted_at": None}
+    projection = {"_id": 0, "archivo_negocio": 0, "vcard": 0, "vcard_photo": 0, "vcard_etag": 0}
+    tarjeta = await shared_lookup(
+        query_key(public_db.tarjetas, query, projection),
+        lambda: public_db.tarjetas.find_one(query, projection)
+    )
     
     if not tarjeta:
         raise HTTPException(status_code=404, detail="Tarjeta not found")
     
-    if isinstance(tarjeta.get('created_at'), str):
-        tarjeta['created_at'] = datetime.fromisoformat(tarjeta['created_at'])
+    if tarjeta.get('archivo_negocio_tipo'):
+        tarjeta['archivo_negocio_url'] = f"/api/tarjetas/slug/{slug}/archivo"
     
     return tarjeta
 
+@api_router.get("/tarjetas/slug/{slug}/archivo")
+async def get_archivo_by_slug(slug: str):
+    """Download the archivo_negocio attachment of a tarjeta (public)"""
+    # Read from the primary like the file itself: replaced GridFS files are deleted
+    # right away, so a lagging secondary could point at one that no longer exists
+    tarjeta = await db.tarjetas.find_one(
+        {"slug": slug, "deleted_at": None},
+        {"_id": 0, "archivo_negocio": 1, "archivo_negocio_file_id": 1,
+         "archivo_negocio_tipo": 1, "archivo_negocio_nombre": 1}
+    )
+    
+    if not tarjeta or not (tarjeta.get('archivo_negocio') or tarjeta.get('archivo_negocio_file_id')):
+        raise HTTPException(status_code=404, detail="Archivo not found")
+    
+    filename = (tarjeta.get('archivo_negocio_nombre') or 'archivo').replace('"', '')
+    headers = {"Content-Disposition": f'inline; filename="{filename}"'}
+    
+    if tarjeta.get('archivo_negocio_file_id'):
+        media_type = ARCHIVO_TIPOS.get(tarjeta.get('archivo_negocio_tipo'), "application/octet-stream")
+        return StreamingResponse(
+            uploads.stream_file(db, tarjeta['archivo_negocio_file_id']),
+            media_type=media_type,
+            headers=headers
+        )
+    
+    media_type, content = decode_data_url(tarjeta['archivo_negocio'])
+    return Response(content=content, media_type=media_type, headers=headers)
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header (*, or a list of possibly weak tags) matches etag"""
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison: W/"x" matches "x"
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+@api_router.get("/public/{slug}/vcard")
+async def get_vcard(slug: str, request: Request):
+    """Download the contact of a tarjeta as a vCard (public)"""
+    query, projection = {"slug": slug, "deleted_at": None}, {"_id": 0, "id": 1, "vcard": 1, "vcard_etag": 1}
+    tarjeta = await shared_lookup(
+        query_key(public_db.tarjetas, query, projection),
+        lambda: public_db.tarjetas.find_one(query, projection)
+    )
+    
+    if not tarjeta:
+        raise HTTPException(status_code=404, detail="Tarjeta not found")
+    
+    vcard, etag = tarjeta.get('vcard'), tarjeta.get('vcard_etag')
+    if not vcard:
+        # Tarjetas written before vCards were precomputed get theirs on first request
+        built = await refresh_vcard(db, process_pool, tarjeta['id'], tarjeta_public_url)
+        if not built:
+            raise HTTPException(status_code=404, detail="Tarjeta not found")
+        vcard, etag = built
+    
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={VCARD_MAX_AGE_SECONDS}"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    
+    headers["Content-Disposition"] = f'attachment; filename="{slug}.vcf"'
+    return Response(content=vcard, media_type="text/vcard; charset=utf-8", headers=headers)
+
+@api_router.get("/public/directorio/{usuario_id}", response_model=TarjetaSearchPage)
+async def get_directorio(
+    usuario_id: str,
+    q: str = "",
+    page: int = Query(1, ge=1),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE)
+):
+    """List and search the tarjetas an account shows in its directory (public)"""
+    query = {"usuario_id": usuario_id, "directorio": True, "deleted_at": None}
+    return await shared_lookup(
+        query_key(public_db.tarjetas, query, q, page, limit),
+        lambda: search_tarjetas(public_db.tarjetas, query, q, page, limit)
+    )
+
 @api_router.post("/tarjetas", response_model=Tarjeta)
 async def create_tarjeta(tarjeta_input: TarjetaCreate, request: Request):
     """Create new tarjeta"""
     user = await require_auth(request)
+    check_archivo_size(user, tarjeta_input.archivo_negocio)
+    archivo_bytes = inline_archivo_bytes(tarjeta_input.archivo_negocio)
+    
+    await reserve_usage(user, "tarjetas")
+    try:
+        await reserve_usage(user, "bytes", archivo_bytes)
+    except HTTPException:
+        await release_usage(user.id, "tarjetas")
+        raise
     
     # Generate slug
     slug = generate_slug(tarjeta_input.nombre)
@@ -372,33 +714,74 @@ async def create_tarjeta(tarjeta_input: TarjetaCreate, request: Request):
         "slug": slug,
         **tarjeta_input.model_dump(),
         "qr_url": "",
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "archivo_negocio_preview": "",
+        "archivo_negocio_version": str(uuid.uuid4()),
+        "archivo_negocio_bytes": archivo_bytes,
+        "enlaces_count": 0,
+        "created_at": datetime.now(timezone.utc)
     }
+    tarjeta_data["search_tokens"] = search_tokens(tarjeta_data)
+    
+    try:
+        await db.tarjetas.insert_one(tarjeta_data)
+    except Exception:
+        await release_usage(user.id, "tarjetas")
+        await release_usage(user.id, "bytes", archivo_bytes)
+        raise
+    
+    if tarjeta_data['archivo_negocio']:
+        await schedule_preview(tarjeta_data['id'])
+    await schedule_vcard(tarjeta_data['id'])
     
-    await db.tarjetas.insert_one(tarjeta_data)
-    tarjeta_data['created_at'] = datetime.fromisoformat(tarjeta_data['created_at'])
     return Tarjeta(**tarjeta_data)
 
 @api_router.put("/tarjetas/{tarjeta_id}", response_model=Tarjeta)
 async def update_tarjeta(tarjeta_id: str, tarjeta_update: TarjetaUpdate, request: Request):
     """Update tarjeta"""
     user = await require_auth(request)
+    check_archivo_size(user, tarjeta_update.archivo_negocio)
     
     # Check ownership
-    existing = await db.tarjetas.find_one({"id": tarjeta_id, "usuario_id": user.id})
+    existing = await db.tarjetas.find_one({"id": tarjeta_id, "usuario_id": user.id, "deleted_at": None})
     if not existing:
         raise HTTPException(status_code=404, detail="Tarjeta not found")
     
     # Update fields
     update_data = {k: v for k, v in tarjeta_update.model_dump().items() if v is not None}
     
+    # A new attachment invalidates the current preview
+    archivo_changed = (
+        "archivo_negocio" in update_data
+        and update_data["archivo_negocio"] != existing.get("archivo_negocio", "")
+    )
+    # Chunked uploads are attached on commit, an empty tipo means the file was removed
+    archivo_removed = update_data.get("archivo_negocio_tipo") == "" and existing.get("archivo_negocio_file_id")
+    if archivo_changed or archivo_removed:
+        archivo_bytes = inline_archivo_bytes(update_data.get("archivo_negocio", ""))
+        await reserve_usage(user, "bytes", archivo_bytes - existing.get("archivo_negocio_bytes", 0))
+        update_data["archivo_negocio_bytes"] = archivo_bytes
+        update_data["archivo_negocio_preview"] = ""
+        update_data["archivo_negocio_version"] = str(uuid.uuid4())
+        if existing.get("archivo_negocio_file_id"):
+            update_data["archivo_negocio_file_id"] = None
+            run_in_background(uploads.delete_file(db, existing["archivo_negocio_file_id"]))
+    
+    if SEARCH_FIELDS & update_data.keys():
+        update_data["search_tokens"] = search_tokens({**existing, **update_data})
+    
     if update_data:
         await db.tarjetas.update_one({"id": tarjeta_id}, {"$set": update_data})
+        # Open live editors would otherwise flush their older copy over these fields
+        await editor_hub.refresh(tarjeta_id, {k: v for k, v in update_data.items() if k in LIVE_FIELDS})
+    
+    if archivo_changed and update_data["archivo_negocio"]:
+        await schedule_preview(tarjeta_id)
+    if VCARD_FIELDS & update_data.keys():
+        foto_changed = "foto_url" in update_data and update_data["foto_url"] != existing.get("foto_url", "")
+        await schedule_vcard(tarjeta_id, refresh_photo=foto_changed)
     
     # Get updated tarjeta
     updated = await db.tarjetas.find_one({"id": tarjeta_id}, {"_id": 0})
-    if isinstance(updated.get('created_at'), str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     
     return Tarjeta(**updated)
 
@@ -407,12 +790,25 @@ async def delete_tarjeta(tarjeta_id: str, request: Request):
     """Delete tarjeta"""
     user = await require_auth(request)
     
-    result = await db.tarjetas.delete_one({"id": tarjeta_id, "usuario_id": user.id})
-    if result.deleted_count == 0:
+    # The tarjeta disappears right away, its enlaces and files are purged in the background
+    deleted = await db.tarjetas.find_one_and_update(
+        {"id": tarjeta_id, "usuario_id": user.id, "deleted_at": None},
+        # Frees the slug for new tarjetas
+        {"$set": {"deleted_at": datetime.now(timezone.utc), "slug": purge.tombstone(tarjeta_id)}},
+        projection={"_id": 0, "id": 1, "archivo_negocio_bytes": 1, "enlaces_count": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Tarjeta not found")
     
-    # Also delete associated enlaces
-    await db.enlaces.delete_many({"tarjeta_id": tarjeta_id})
+    enlaces = deleted.get("enlaces_count")
+    if enlaces is None:
+        # Tarjetas created before the counter
+        enlaces = await db.enlaces.count_documents({"tarjeta_id": tarjeta_id})
+    await release_usage(user.id, "tarjetas")
+    await release_usage(user.id, "enlaces", enlaces)
+    await release_usage(user.id, "bytes", deleted.get("archivo_negocio_bytes", 0))
+    
+    await schedule_purge("tarjeta", tarjeta_id)
     
     return {"success": True}
 
@@ -421,13 +817,12 @@ async def generate_qr(tarjeta_id: str, request: Request):
     """Generate QR code for tarjeta"""
     user = await require_auth(request)
     
-    tarjeta = await db.tarjetas.find_one({"id": tarjeta_id, "usuario_id": user.id})
+    tarjeta = await db.tarjetas.find_one({"id": tarjeta_id, "usuario_id": user.id, "deleted_at": None})
     if not tarjeta:
         raise HTTPException(status_code=404, detail="Tarjeta not found")
     
     # Generate QR URL using external API
-    frontend_url = os.environ.get('REACT_APP_BACKEND_URL', '').replace('/api', '')
-    tarjeta_url = f"{frontend_url}/t/{tarjeta['slug']}"
+    tarjeta_url = tarjeta_public_url(tarjeta['slug'])
     qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size=300x300&data={tarjeta_url}"
     
     # Update tarjeta with QR URL
@@ -435,26 +830,387 @@ async def generate_qr(tarjeta_id: str, request: Request):
     
     return {"qr_url": qr_url}
 
+async def stream_qr_sheet(tarjetas: list, sheet: QrSheetRequest):
+    """Render QR codes in the process pool and yield the sheet as it is built"""
+    loop = asyncio.get_running_loop()
+    writer = qrsheet.PdfSheetWriter() if sheet.formato == "pdf" else qrsheet.ZipSheetWriter()
+    
+    def render(tarjeta):
+        url = tarjeta_public_url(tarjeta["slug"])
+        if sheet.formato == "pdf":
+            return loop.run_in_executor(process_pool, qrsheet.render_pdf_page, url, tarjeta["nombre"])
+        renderer = qrsheet.render_svg if sheet.imagen == "svg" else qrsheet.render_png
+        return loop.run_in_executor(process_pool, renderer, url)
+    
+    def add(tarjeta, content):
+        if sheet.formato == "pdf":
+            return writer.add_page(content)
+        return writer.add_file(f"{tarjeta['slug']}.{sheet.imagen}", content)
+    
+    yield writer.start()
+    
+    # Keep a bounded window of renders in flight and emit them in order
+    pending = deque()
+    for tarjeta in tarjetas:
+        pending.append((tarjeta, render(tarjeta)))
+        if len(pending) >= QR_RENDER_WINDOW:
+            done, content = pending.popleft()
+            yield add(done, await content)
+    while pending:
+        done, content = pending.popleft()
+        yield add(done, await content)
+    
+    yield writer.finish()
+
+@api_router.post("/tarjetas/qr-sheet")
+async def generate_qr_sheet(sheet: QrSheetRequest, request: Request):
+    """Stream printable QR codes for several tarjetas as a PDF or ZIP"""
+    user = await require_auth(request)
+    
+    too_many = HTTPException(status_code=400, detail=f"A QR sheet can include at most {QR_SHEET_MAX_TARJETAS} tarjetas")
+    query = {"usuario_id": user.id, "deleted_at": None}
+    if sheet.tarjeta_ids is not None:
+        if len(sheet.tarjeta_ids) > QR_SHEET_MAX_TARJETAS:
+            raise too_many
+        query["id"] = {"$in": sheet.tarjeta_ids}
+    
+    # One past the limit tells a full sheet from one that would be cut short
+    tarjetas = await db.tarjetas.find(query, {"_id": 0, "slug": 1, "nombre": 1}).sort("nombre", 1).to_list(QR_SHEET_MAX_TARJETAS + 1)
+    if not tarjetas:
+        raise HTTPException(status_code=404, detail="Tarjeta not found")
+    if len(tarjetas) > QR_SHEET_MAX_TARJETAS:
+        raise too_many
+    
+    filename = f"qr-tarjetas.{sheet.formato}"
+    return StreamingResponse(
+        stream_qr_sheet(tarjetas, sheet),
+        media_type="application/pdf" if sheet.formato == "pdf" else "application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ============ LIVE EDITOR ============
+
+async def persist_live_update(tarjeta_id: str, fields: dict):
+    """Write the changes accumulated by a live editor session"""
+    if not SEARCH_FIELDS & fields.keys():
+        await db.tarjetas.update_one({"id": tarjeta_id, "deleted_at": None}, {"$set": fields})
+    else:
+        updated = await db.tarjetas.find_one_and_update(
+            {"id": tarjeta_id, "deleted_at": None},
+            {"$set": fields},
+            projection={field: 1 for field in SEARCH_FIELDS},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated:
+            await db.tarjetas.update_one({"id": tarjeta_id}, {"$set": {"search_tokens": search_tokens(updated)}})
+    if VCARD_FIELDS & fields.keys():
+        await schedule_vcard(tarjeta_id)
+
+editor_hub = EditorHub(persist_live_update, LIVE_DEBOUNCE_SECONDS, LIVE_MAX_DELAY_SECONDS)
+
+def parse_live_message(raw: str) -> dict:
+    """Decode a live editor message, raise ValueError with a readable message if invalid"""
+    try:
+        message = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError("Invalid JSON")
+    if not isinstance(message, dict) or message.get("type") not in ("patch", "flush"):
+        raise ValueError("Unknown message type")
+    return message
+
+def parse_live_patch(message: dict) -> dict:
+    """Validate the fields of a patch message"""
+    fields = message.get("fields")
+    if not isinstance(fields, dict):
+        raise ValueError("Patch must include a fields object")
+    unknown = set(fields) - LIVE_FIELDS
+    if unknown:
+        raise ValueError(f"Fields not editable live: {', '.join(sorted(unknown))}")
+    try:
+        validated = TarjetaUpdate(**fields)
+    except ValidationError:
+        raise ValueError("Invalid field values")
+    return {k: v for k, v in validated.model_dump().items() if k in fields and v is not None}
+
+def websocket_origin_allowed(websocket: WebSocket) -> bool:
+    """CORS doesn't cover WebSockets and the session cookie is sent cross-site, so check the origin ourselves"""
+    origin = websocket.headers.get("origin")
+    if not origin:
+        return True  # Not a browser
+    if "*" not in CORS_ORIGINS:
+        return origin in CORS_ORIGINS
+    # A wildcard would let any site drive the editor with the user's cookie, so
+    # only our own pages may connect (by host: a TLS proxy changes the scheme)
+    return urlsplit(origin).netloc == websocket.headers.get("host")
+
+@api_router.websocket("/ws/tarjetas/{tarjeta_id}/editor")
+async def live_editor(websocket: WebSocket, tarjeta_id: str):
+    """Live editing: receive field patches, broadcast them and persist them debounced"""
+    if not websocket_origin_allowed(websocket):
+        await websocket.close(code=4403)
+        return
+    
+    user = await get_current_user(websocket)
+    if not user:
+        await websocket.close(code=4401)
+        return
+    
+    tarjeta = await db.tarjetas.find_one(
+        {"id": tarjeta_id, "usuario_id": user.id, "deleted_at": None},
+        {"_id": 0, **{field: 1 for field in LIVE_FIELDS}}
+    )
+    if not tarjeta:
+        await websocket.close(code=4404)
+        return
+    
+    await websocket.accept()
+    session = editor_hub.join(tarjeta_id, websocket, tarjeta)
+    try:
+        await websocket.send_json({"type": "state", "tarjeta": session.state, "version": session.version})
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = parse_live_message(raw)
+                if message["type"] == "flush":
+                    await editor_hub.flush(session)
+                else:
+                    await editor_hub.apply(session, parse_live_patch(message))
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await editor_hub.leave(session, websocket)
+
+# ============ UPLOADS ENDPOINTS ============
+
+def upload_status(upload: dict) -> dict:
+    return {
+        "upload_id": upload["id"],
+        "offset": upload["offset"],
+        "size": upload["size"],
+        "status": upload["status"],
+        "chunk_size": uploads.UPLOAD_MAX_CHUNK_BYTES
+    }
+
+async def get_owned_upload(upload_id: str, user: User) -> dict:
+    upload = await db.uploads.find_one({"id": upload_id, "usuario_id": user.id}, {"_id": 0})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+@api_router.post("/uploads")
+async def init_upload(upload_input: UploadInit, request: Request):
+    """Start a resumable upload for a tarjeta's archivo_negocio"""
+    user = await require_auth(request)
+    
+    if upload_input.tipo not in ARCHIVO_TIPOS:
+        raise HTTPException(status_code=400, detail="Only PDF or JPG files are allowed")
+    if upload_input.size <= 0:
+        raise HTTPException(status_code=400, detail="Invalid file size")
+    limits = plan_limits(user)
+    if upload_input.size > limits["max_upload_bytes"]:
+        raise HTTPException(status_code=413, detail="File exceeds your plan's size limit")
+    # Early check only, the storage counter is reserved atomically on commit
+    if user.usage and user.usage.bytes + upload_input.size > limits["max_storage_bytes"]:
+        raise HTTPException(status_code=403, detail="Plan limit reached for bytes")
+    
+    tarjeta = await db.tarjetas.find_one({"id": upload_input.tarjeta_id, "usuario_id": user.id, "deleted_at": None}, {"_id": 0, "id": 1})
+    if not tarjeta:
+        raise HTTPException(status_code=404, detail="Tarjeta not found")
+    
+    now = datetime.now(timezone.utc)
+    upload = {
+        "id": str(uuid.uuid4()),
+        "usuario_id": user.id,
+        **upload_input.model_dump(),
+        "sha256": upload_input.sha256.lower(),
+        "offset": 0,
+        "status": "pending",
+        "created_at": now,
+        "updated_at": now
+    }
+    uploads.create_upload_file(upload["id"])
+    await db.uploads.insert_one(upload)
+    
+    return upload_status(upload)
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str, request: Request):
+    """Get the current offset of an upload (to resume it)"""
+    user = await require_auth(request)
+    upload = await get_owned_upload(upload_id, user)
+    return upload_status(upload)
+
+@api_router.put("/uploads/{upload_id}")
+async def append_upload(upload_id: str, offset: int, request: Request):
+    """Append the raw request body to an upload at the given offset"""
+    user = await require_auth(request)
+    upload = await get_owned_upload(upload_id, user)
+    
+    if upload["status"] != "pending":
+        raise HTTPException(status_code=409, detail="Upload already committed")
+    if offset != upload["offset"]:
+        raise HTTPException(status_code=409, detail={"message": "Offset mismatch", "offset": upload["offset"]})
+    
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_length > uploads.UPLOAD_MAX_CHUNK_BYTES:
+        raise HTTPException(status_code=413, detail="Chunk too large")
+    
+    # Claim the offset before touching the file, so two appends can't interleave their writes
+    now = datetime.now(timezone.utc)
+    append_token = str(uuid.uuid4())
+    claimed = await db.uploads.update_one(
+        {
+            "id": upload_id, "offset": offset, "status": "pending",
+            "$or": [{"append_expires_at": None}, {"append_expires_at": {"$lt": now}}]
+        },
+        {"$set": {
+            "append_token": append_token,
+            "append_expires_at": now + timedelta(seconds=uploads.UPLOAD_APPEND_LEASE_SECONDS),
+            # Keeps the sweep away from an upload that is still being appended, however slowly
+            "updated_at": now
+        }}
+    )
+    if claimed.modified_count == 0:
+        raise HTTPException(status_code=409, detail="Upload changed concurrently")
+    
+    limit = min(upload["size"], offset + uploads.UPLOAD_MAX_CHUNK_BYTES)
+    written = None
+    try:
+        written = await uploads.append_chunk(upload_id, offset, limit, request.stream())
+    except uploads.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Chunk exceeds the declared file size")
+    finally:
+        if written is None:
+            await db.uploads.update_one(
+                {"id": upload_id, "append_token": append_token},
+                {"$set": {"append_token": None, "append_expires_at": None}}
+            )
+    
+    result = await db.uploads.update_one(
+        {"id": upload_id, "append_token": append_token},
+        {"$set": {
+            "offset": offset + written, "append_token": None, "append_expires_at": None,
+            "updated_at": datetime.now(timezone.utc)
+        }}
+    )
+    if result.modified_count == 0:
+        # Our lease ran out and another append took the offset over
+        raise HTTPException(status_code=409, detail="Upload changed concurrently")
+    
+    upload["offset"] = offset + written
+    return upload_status(upload)
+
+@api_router.post("/uploads/{upload_id}/commit", response_model=Tarjeta)
+async def commit_upload(upload_id: str, request: Request):
+    """Verify a finished upload and attach it to its tarjeta"""
+    user = await require_auth(request)
+    upload = await get_owned_upload(upload_id, user)
+    
+    if upload["status"] != "pending":
+        raise HTTPException(status_code=409, detail="Upload already committed")
+    if upload["offset"] != upload["size"]:
+        raise HTTPException(status_code=409, detail={"message": "Upload incomplete", "offset": upload["offset"]})
+    
+    # Claim the upload first: two concurrent commits would both reserve its bytes
+    claimed = await db.uploads.update_one(
+        {"id": upload_id, "status": "pending", "offset": upload["size"]},
+        {"$set": {"status": "committing", "updated_at": datetime.now(timezone.utc)}}
+    )
+    if claimed.modified_count == 0:
+        raise HTTPException(status_code=409, detail="Upload already committed")
+    
+    try:
+        updated = await attach_upload(upload, user)
+    except BaseException:
+        await db.uploads.update_one(
+            {"id": upload_id, "status": "committing"},
+            {"$set": {"status": "pending", "updated_at": datetime.now(timezone.utc)}}
+        )
+        raise
+    
+    return Tarjeta(**updated)
+
+async def attach_upload(upload: dict, user: User) -> dict:
+    """Verify a claimed upload, store it and point its tarjeta at it, returns the updated tarjeta"""
+    upload_id = upload["id"]
+    digest = await asyncio.to_thread(uploads.hash_file, uploads.upload_path(upload_id))
+    if digest != upload["sha256"]:
+        raise HTTPException(status_code=422, detail="Content hash mismatch")
+    
+    existing = await db.tarjetas.find_one(
+        {"id": upload["tarjeta_id"], "usuario_id": user.id, "deleted_at": None},
+        {"_id": 0, "id": 1, "archivo_negocio_file_id": 1, "archivo_negocio_bytes": 1}
+    )
+    if not existing:
+        raise HTTPException(status_code=404, detail="Tarjeta not found")
+    
+    bytes_delta = upload["size"] - existing.get("archivo_negocio_bytes", 0)
+    await reserve_usage(user, "bytes", bytes_delta)
+    try:
+        file_id = await uploads.store_upload(db, upload)
+    except BaseException:
+        # Unconditional: undoing the reservation must not hit the plan limit check
+        await release_usage(user.id, "bytes", bytes_delta)
+        raise
+    await db.tarjetas.update_one(
+        {"id": upload["tarjeta_id"]},
+        {"$set": {
+            "archivo_negocio": "",
+            "archivo_negocio_file_id": file_id,
+            "archivo_negocio_tipo": upload["tipo"],
+            "archivo_negocio_nombre": upload["nombre"],
+            "archivo_negocio_bytes": upload["size"],
+            "archivo_negocio_preview": "",
+            "archivo_negocio_version": str(uuid.uuid4())
+        }}
+    )
+    await db.uploads.update_one(
+        {"id": upload_id},
+        {"$set": {"status": "committed", "updated_at": datetime.now(timezone.utc)}}
+    )
+    uploads.discard_upload_file(upload_id)
+    
+    if existing.get("archivo_negocio_file_id"):
+        run_in_background(uploads.delete_file(db, existing["archivo_negocio_file_id"]))
+    await schedule_preview(upload["tarjeta_id"])
+    
+    return await db.tarjetas.find_one({"id": upload["tarjeta_id"]}, {"_id": 0})
+
 # ============ ENLACES ENDPOINTS ============
 
 @api_router.get("/enlaces/{tarjeta_id}", response_model=List[Enlace])
 async def get_enlaces(tarjeta_id: str):
     """Get all enlaces for a tarjeta (public)"""
-    enlaces = await db.enlaces.find({"tarjeta_id": tarjeta_id}, {"_id": 0}).sort("orden", 1).to_list(100)
-    
-    for enlace in enlaces:
-        if isinstance(enlace.get('created_at'), str):
-            enlace['created_at'] = datetime.fromisoformat(enlace['created_at'])
+    query = {"tarjeta_id": tarjeta_id}
+    enlaces = await shared_lookup(
+        query_key(public_db.enlaces, query, "orden"),
+        lambda: find_public_enlaces(tarjeta_id)
+    )
     
     return enlaces
 
+async def find_public_enlaces(tarjeta_id: str) -> list:
+    """Enlaces of a tarjeta in display order, none once the tarjeta is deleted"""
+    # A deleted tarjeta keeps its enlaces until the purge job gets to them
+    if not await public_db.tarjetas.find_one({"id": tarjeta_id, "deleted_at": None}, {"_id": 1}):
+        return []
+    return await public_db.enlaces.find({"tarjeta_id": tarjeta_id}, {"_id": 0}).sort("orden", 1).to_list(100)
+
+async def count_enlaces(tarjeta_id: str, amount: int):
+    """Keep the tarjeta's enlace count, which delete_tarjeta releases from the quota"""
+    await db.tarjetas.update_one(
+        {"id": tarjeta_id, "enlaces_count": {"$exists": True}}, {"$inc": {"enlaces_count": amount}}
+    )
+
 @api_router.post("/enlaces/{tarjeta_id}", response_model=Enlace)
 async def create_enlace(tarjeta_id: str, enlace_input: EnlaceCreate, request: Request):
     """Create new enlace"""
     user = await require_auth(request)
     
     # Check tarjeta ownership
-    tarjeta = await db.tarjetas.find_one({"id": tarjeta_id, "usuario_id": user.id})
+    tarjeta = await db.tarjetas.find_one({"id": tarjeta_id, "usuario_id": user.id, "deleted_at": None})
     if not tarjeta:
         raise HTTPException(status_code=404, detail="Tarjeta not found")
     
@@ -462,11 +1218,18 @@ async def create_enlace(tarjeta_id: str, enlace_input: EnlaceCreate, request: Re
         "id": str(uuid.uuid4()),
         "tarjeta_id": tarjeta_id,
         **enlace_input.model_dump(),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     
-    await db.enlaces.insert_one(enlace_data)
-    enlace_data['created_at'] = datetime.fromisoformat(enlace_data['created_at'])
+    await reserve_usage(user, "enlaces")
+    try:
+        await db.enlaces.insert_one(enlace_data)
+    except Exception:
+        await release_usage(user.id, "enlaces")
+        raise
+    await count_enlaces(tarjeta_id, 1)
+    
+    await schedule_vcard(tarjeta_id)
     return Enlace(**enlace_data)
 
 @api_router.put("/enlaces/{enlace_id}", response_model=Enlace)
@@ -479,7 +1242,7 @@ async def update_enlace(enlace_id: str, enlace_update: EnlaceUpdate, request: Re
     if not enlace:
         raise HTTPException(status_code=404, detail="Enlace not found")
     
-    tarjeta = await db.tarjetas.find_one({"id": enlace["tarjeta_id"], "usuario_id": user.id})
+    tarjeta = await db.tarjetas.find_one({"id": enlace["tarjeta_id"], "usuario_id": user.id, "deleted_at": None})
     if not tarjeta:
         raise HTTPException(status_code=403, detail="Not authorized")
     
@@ -488,11 +1251,10 @@ async def update_enlace(enlace_id: str, enlace_update: EnlaceUpdate, request: Re
     
     if update_data:
         await db.enlaces.update_one({"id": enlace_id}, {"$set": update_data})
+        await schedule_vcard(enlace["tarjeta_id"])
     
     # Get updated enlace
     updated = await db.enlaces.find_one({"id": enlace_id}, {"_id": 0})
-    if isinstance(updated.get('created_at'), str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     
     return Enlace(**updated)
 
@@ -506,24 +1268,87 @@ async def delete_enlace(enlace_id: str, request: Request):
     if not enlace:
         raise HTTPException(status_code=404, detail="Enlace not found")
     
-    tarjeta = await db.tarjetas.find_one({"id": enlace["tarjeta_id"], "usuario_id": user.id})
+    tarjeta = await db.tarjetas.find_one({"id": enlace["tarjeta_id"], "usuario_id": user.id, "deleted_at": None})
     if not tarjeta:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.enlaces.delete_one({"id": enlace_id})
+    result = await db.enlaces.delete_one({"id": enlace_id})
+    if result.deleted_count:
+        await count_enlaces(enlace["tarjeta_id"], -1)
+        await release_usage(user.id, "enlaces")
+        await schedule_vcard(enlace["tarjeta_id"])
+    return {"success": True}
+
+# ============ ADMIN ENDPOINTS ============
+
+@api_router.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """List recorded slow-request traces, newest first"""
+    require_admin(request)
+    return await asyncio.to_thread(profiling.list_traces)
+
+@api_router.get("/admin/profiles/{name}")
+async def get_profile(name: str, request: Request):
+    """Get one recorded trace"""
+    require_admin(request)
+    trace = await asyncio.to_thread(profiling.read_trace, name)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return trace
+
+@api_router.get("/admin/jobs")
+async def get_job_metrics(request: Request):
+    """Queue depth, throughput and latency per job type"""
+    require_admin(request)
+    return await job_runner.metrics()
+
+@api_router.get("/admin/jobs/list")
+async def list_jobs(request: Request, status: Optional[str] = None, job_type: Optional[str] = Query(None, alias="type")):
+    """List jobs with their progress and last error, newest first"""
+    require_admin(request)
+    query = {k: v for k, v in {"status": status, "type": job_type}.items() if v}
+    return await db.jobs.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+
+@api_router.post("/admin/jobs/{job_id}/retry")
+async def retry_job(job_id: str, request: Request):
+    """Queue a dead-lettered job again"""
+    require_admin(request)
+    try:
+        retried = await job_runner.retry(job_id)
+    except DuplicateJob:
+        raise HTTPException(status_code=409, detail="A job with the same key is already queued")
+    if not retried:
+        raise HTTPException(status_code=404, detail="Dead job not found")
     return {"success": True}
 
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(profiling.ProfilingMiddleware, admin_token=ADMIN_TOKEN)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    allow_origins=CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_workers():
+    await db.uploads.create_index("id", unique=True)
+    await db.uploads.create_index([("status", 1), ("updated_at", 1)])
+    run_in_background(uploads.sweep_loop(db, UPLOAD_SWEEP_INTERVAL))
+    run_in_background(reconcile_loop(db, QUOTA_RECONCILE_INTERVAL))
+    await db.tarjetas.create_index([("usuario_id", 1), ("search_tokens", 1)])
+    await db.tarjetas.create_index([("usuario_id", 1), ("nombre", 1)])
+    await job_runner.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for task in list(background_tasks):
+        task.cancel()
+    await editor_hub.close()
+    await job_runner.stop()
+    client.close()
+    process_pool.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""Single-flight coalescing of identical concurrent async calls.
+
+When many requests ask for the same thing at once (a popular slug shared on
+social media), only the first caller runs the query; everyone else arriving
+while it is in flight awaits the same result.  Once it completes the key is
+forgotten, so this is not a cache: the next caller starts a fresh query.
+"""
+import asyncio
+import copy
+import json
+
+
+def query_key(collection, query: dict, *extra) -> str:
+    """Build a key from a collection, a filter and any other query options"""
+    return json.dumps([collection.full_name, query, *extra], sort_keys=True, default=str)
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = None):
+        self.timeout = timeout
+        self._calls = {}
+
+    async def do(self, key: str, fn, timeout: float = None):
+        """Run fn() unless a call for key is already in flight, and return its result.
+
+        Every waiter gets its own deep copy, so callers may mutate what they
+        receive.  Exceptions from the shared call are raised in every waiter.
+        A waiter that times out or is cancelled gives up on its own without
+        cancelling the call the other waiters depend on.
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+
+        timeout = self.timeout if timeout is None else timeout
+        # Not wait_for: on 3.11 it can swallow a cancel that lands as the call finishes
+        async with asyncio.timeout(timeout):
+            result = await asyncio.shield(future)
+        return copy.deepcopy(result)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every waiter gave up
+        if not future.cancelled():
+            future.exception()
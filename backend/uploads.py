@@ -0,0 +1,147 @@
+"""Resumable chunked uploads for archivo_negocio attachments.
+
+An upload is initialised with its declared size and SHA-256, then its bytes
+are appended in chunks at explicit offsets.  Chunks are streamed straight to
+a temporary file, so a client that loses its connection can ask for the
+current offset and carry on from there.  On commit the file is verified and
+copied into GridFS, again chunk by chunk.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import datastore
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', '/tmp/tarjetas-uploads'))
+# Largest chunk accepted in a single append request
+UPLOAD_MAX_CHUNK_BYTES = int(os.environ.get('UPLOAD_MAX_CHUNK_BYTES', str(4 * 1024 * 1024)))
+# Pending uploads untouched for this long are swept
+UPLOAD_TTL_SECONDS = int(os.environ.get('UPLOAD_TTL_SECONDS', str(24 * 60 * 60)))
+# How long an append may hold its offset before another request can take it over
+UPLOAD_APPEND_LEASE_SECONDS = int(os.environ.get('UPLOAD_APPEND_LEASE_SECONDS', '300'))
+GRIDFS_BUCKET = "archivos"
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when a chunk would take an upload past its declared size"""
+
+
+def get_bucket(database):
+    return datastore.gridfs_bucket(database, GRIDFS_BUCKET)
+
+
+def upload_path(upload_id: str) -> Path:
+    return UPLOAD_DIR / f"{upload_id}.part"
+
+
+def create_upload_file(upload_id: str):
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    upload_path(upload_id).touch()
+
+
+async def append_chunk(upload_id: str, offset: int, limit: int, chunks) -> int:
+    """Write an async iterable of byte chunks at offset, returns the number of bytes written.
+
+    Anything past offset (left over from an interrupted append) is discarded
+    first, and writing stops with UploadTooLarge as soon as the upload would
+    grow beyond limit bytes.  The caller must hold the upload's append lease.
+    """
+    def truncate(f):
+        f.seek(offset)
+        f.truncate()
+
+    written = 0
+    with open(upload_path(upload_id), "r+b") as f:
+        await asyncio.to_thread(truncate, f)
+        async for chunk in chunks:
+            written += len(chunk)
+            if offset + written > limit:
+                raise UploadTooLarge()
+            await asyncio.to_thread(f.write, chunk)
+    return written
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def store_upload(database, upload: dict) -> str:
+    """Copy a completed upload into GridFS, returns the stored file id"""
+    grid_in = get_bucket(database).open_upload_stream_with_id(
+        upload["id"],
+        upload["nombre"],
+        metadata={"usuario_id": upload["usuario_id"], "tipo": upload["tipo"]},
+    )
+    try:
+        with open(upload_path(upload["id"]), "rb") as f:
+            while block := await asyncio.to_thread(f.read, READ_BLOCK_BYTES):
+                await grid_in.write(block)
+    except Exception:
+        await grid_in.abort()
+        raise
+    await grid_in.close()
+    return upload["id"]
+
+
+async def read_file(database, file_id: str) -> bytes:
+    """Read a stored attachment fully (used for preview rendering)"""
+    grid_out = await get_bucket(database).open_download_stream(file_id)
+    return await grid_out.read()
+
+
+async def stream_file(database, file_id: str):
+    """Yield a stored attachment chunk by chunk"""
+    grid_out = await get_bucket(database).open_download_stream(file_id)
+    while True:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        yield chunk
+
+
+async def delete_file(database, file_id: str):
+    try:
+        await get_bucket(database).delete(file_id)
+    except Exception:
+        logger.warning("Could not delete stored file %s", file_id)
+
+
+def discard_upload_file(upload_id: str):
+    upload_path(upload_id).unlink(missing_ok=True)
+
+
+async def sweep_abandoned_uploads(database) -> int:
+    """Remove uploads (and their temporary files) untouched for the TTL"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_TTL_SECONDS)
+    # Abandoned uploads, commits that never finished (the server died halfway)
+    # and the records of committed ones, which are only needed while resuming
+    query = {"status": {"$in": ["pending", "committing", "committed"]}, "updated_at": {"$lt": cutoff}}
+    removed = 0
+    async for upload in database.uploads.find(query, {"_id": 0, "id": 1}):
+        # Skipped if an append or commit touched it since
+        result = await database.uploads.delete_one({"id": upload["id"], **query})
+        if result.deleted_count:
+            discard_upload_file(upload["id"])
+            removed += 1
+    return removed
+
+
+async def sweep_loop(database, interval: int):
+    while True:
+        try:
+            removed = await sweep_abandoned_uploads(database)
+            if removed:
+                logger.info("Swept %d abandoned uploads", removed)
+        except Exception:
+            logger.exception("Upload sweep failed")
+        await asyncio.sleep(interval)
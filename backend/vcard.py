@@ -0,0 +1,157 @@
+"""vCard 4.0 contact payloads for public cards.
+
+The vCard is rebuilt in the background whenever a tarjeta or its enlaces
+change and stored on the tarjeta with its ETag, so serving it is a single
+small projected read.  The contact photo is downscaled once (in the process
+pool) when foto_url changes and kept as ``vcard_photo``.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+
+from PIL import Image
+
+from previews import decode_data_url
+
+logger = logging.getLogger(__name__)
+
+PHOTO_SIZE = (128, 128)
+PHOTO_QUALITY = 75
+VCARD_FIELDS = {"nombre", "descripcion", "telefono", "whatsapp", "email", "foto_url"}
+
+
+def downscale_photo(foto_url: str) -> str:
+    """Downscale a base64 photo to a small JPEG data URL (remote URLs are kept as-is)"""
+    if not foto_url or not foto_url.startswith("data:"):
+        return foto_url or ""
+    _, raw = decode_data_url(foto_url)
+    image = Image.open(io.BytesIO(raw))
+    image.draft("RGB", PHOTO_SIZE)
+    image = image.convert("RGB")
+    image.thumbnail(PHOTO_SIZE)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=PHOTO_QUALITY, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode("ascii")
+
+
+def escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def uri(value: str) -> str:
+    """URI values aren't text: they keep their commas and semicolons, only line breaks go"""
+    return value.replace("\r", "").replace("\n", "")
+
+
+def fold(line: str) -> str:
+    """Fold a content line at 75 octets as RFC 6350 requires"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Don't split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+    return "\r\n ".join(parts)
+
+
+def phone_uri(number: str) -> str:
+    return "tel:" + "".join(c for c in number if c.isdigit() or c == "+")
+
+
+def build_vcard(tarjeta: dict, enlaces: list, photo: str, public_url: str) -> str:
+    lines = ["BEGIN:VCARD", "VERSION:4.0", f"FN:{escape(tarjeta.get('nombre') or '')}"]
+    if tarjeta.get("telefono"):
+        lines.append(f"TEL;VALUE=uri;TYPE=\"voice,cell\":{phone_uri(tarjeta['telefono'])}")
+    if tarjeta.get("whatsapp"):
+        lines.append(f"TEL;VALUE=uri;TYPE=\"text,cell\":{phone_uri(tarjeta['whatsapp'])}")
+        digits = "".join(c for c in tarjeta["whatsapp"] if c.isdigit())
+        lines.append(f"IMPP:https://wa.me/{digits}")
+    if tarjeta.get("email"):
+        lines.append(f"EMAIL:{escape(tarjeta['email'])}")
+    if tarjeta.get("descripcion"):
+        lines.append(f"NOTE:{escape(tarjeta['descripcion'])}")
+    lines.append(f"URL:{uri(public_url)}")
+    for enlace in enlaces:
+        if enlace.get("url"):
+            # PREF must be 1-100
+            pref = max(1, min(enlace.get("orden", 0) + 1, 100))
+            lines.append(f"URL;PREF={pref}:{uri(enlace['url'])}")
+    if photo:
+        lines.append(f"PHOTO:{uri(photo)}")
+    lines.append("END:VCARD")
+    return "\r\n".join(fold(line) for line in lines) + "\r\n"
+
+
+def vcard_etag(vcard: str) -> str:
+    return '"' + hashlib.sha256(vcard.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+async def refresh_vcard(database, pool, tarjeta_id: str, public_url_for, refresh_photo: bool = False):
+    """Rebuild and store the vCard of a tarjeta, returns (vcard, etag) or None if it's gone"""
+    projection = {"_id": 0, **{field: 1 for field in VCARD_FIELDS}, "slug": 1, "vcard_photo": 1}
+    tarjeta = await database.tarjetas.find_one({"id": tarjeta_id}, projection)
+    if not tarjeta:
+        return None
+
+    photo = tarjeta.get("vcard_photo")
+    changes = {}
+    if refresh_photo or photo is None:
+        try:
+            loop = asyncio.get_running_loop()
+            photo = await loop.run_in_executor(pool, downscale_photo, tarjeta.get("foto_url", ""))
+        except Exception:
+            logger.exception("Could not downscale photo for tarjeta %s", tarjeta_id)
+            photo = ""
+        changes["vcard_photo"] = photo
+
+    enlaces = await database.enlaces.find(
+        {"tarjeta_id": tarjeta_id}, {"_id": 0, "url": 1, "orden": 1}
+    ).sort("orden", 1).to_list(100)
+
+    vcard = build_vcard(tarjeta, enlaces, photo, public_url_for(tarjeta["slug"]))
+    etag = vcard_etag(vcard)
+    await database.tarjetas.update_one(
+        {"id": tarjeta_id}, {"$set": {**changes, "vcard": vcard, "vcard_etag": etag}}
+    )
+    return vcard, etag
+
+
+class VcardRefresher:
+    """Run vCard refreshes one at a time per tarjeta.
+
+    Refreshes requested while one is running for the same tarjeta are folded
+    into a single rerun, so a burst of edits costs at most two rebuilds and
+    an older rebuild can never overwrite a newer one.
+    """
+
+    def __init__(self, refresh):
+        # refresh(tarjeta_id, refresh_photo) rebuilds and stores the vCard
+        self.refresh = refresh
+        self.running = set()
+        self.queued = {}
+
+    async def run(self, tarjeta_id: str, refresh_photo: bool = False):
+        if tarjeta_id in self.running:
+            self.queued[tarjeta_id] = self.queued.get(tarjeta_id, False) or refresh_photo
+            return
+        self.running.add(tarjeta_id)
+        try:
+            while True:
+                await self.refresh(tarjeta_id, refresh_photo)
+                if tarjeta_id not in self.queued:
+                    break
+                refresh_photo = self.queued.pop(tarjeta_id)
+        finally:
+            self.running.discard(tarjeta_id)
+            self.queued.pop(tarjeta_id, None)
@@ -6,6 +6,7 @@ import Dashboard from "@/pages/Dashboard.jsx";
 import Editor from "@/pages/Editor.jsx";
 import TarjetaPublica from "@/pages/TarjetaPublica.jsx";
 import Premium from "@/pages/Premium.jsx";
+import Directorio from "@/pages/Directorio.jsx";
 import { Toaster } from "@/components/ui/sonner";
 
 function App() {
@@ -20,6 +21,7 @@ function App() {
           <Route path="/editor/:id" element={<Editor />} />
           <Route path="/t/:slug" element={<TarjetaPublica />} />
           <Route path="/premium" element={<Premium />} />
+          <Route path="/directorio/:usuarioId" element={<Directorio />} />
         </Routes>
       </BrowserRouter>
     </div>
@@ -2,6 +2,7 @@ import { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
+import { Input } from "@/components/ui/input";
 import axios from "axios";
 import { toast } from "sonner";
 import {
@@ -24,11 +25,38 @@ export default function Dashboard() {
   const [tarjetas, setTarjetas] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
   const [deleteId, setDeleteId] = useState(null);
+  const [confirmDeleteAccount, setConfirmDeleteAccount] = useState(false);
+  const [busqueda, setBusqueda] = useState("");
+  const [resultados, setResultados] = useState(null);
 
   useEffect(() => {
     loadData();
   }, []);
 
+  // Search runs on the server once typing pauses, null means show every tarjeta
+  useEffect(() => {
+    if (!busqueda.trim()) {
+      setResultados(null);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/tarjetas/buscar`, {
+          params: { q: busqueda, limit: 50 },
+          withCredentials: true,
+        });
+        setResultados(new Set(response.data.items.map((item) => item.id)));
+      } catch (error) {
+        console.error("Error searching tarjetas:", error);
+      }
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [busqueda]);
+
+  const tarjetasVisibles = resultados
+    ? tarjetas.filter((t) => resultados.has(t.id))
+    : tarjetas;
+
   const loadData = async () => {
     try {
       const [userRes, tarjetasRes] = await Promise.all([
@@ -71,6 +99,36 @@ export default function Dashboard() {
     }
   };
 
+  const handleDeleteAccount = async () => {
+    try {
+      await axios.delete(`${API}/auth/me`, { withCredentials: true });
+      toast.success("Cuenta eliminada");
+      navigate("/");
+    } catch (error) {
+      console.error("Error deleting account:", error);
+      toast.error("Error al eliminar la cuenta");
+    }
+  };
+
+  const handleDownloadQrSheet = async () => {
+    try {
+      const res = await axios.post(
+        `${API}/tarjetas/qr-sheet`,
+        { formato: "pdf" },
+        { withCredentials: true, responseType: "blob" }
+      );
+      const url = URL.createObjectURL(res.data);
+      const link = document.createElement("a");
+      link.href = url;
+      link.download = "qr-tarjetas.pdf";
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error("Error downloading QR sheet:", error);
+      toast.error("Error al descargar los códigos QR");
+    }
+  };
+
   const handleCreateNew = () => {
     // For now, just edit the first tarjeta
     if (tarjetas.length > 0) {
@@ -115,6 +173,14 @@ export default function Dashboard() {
             >
               Cerrar sesión
             </Button>
+            <Button
+              data-testid="delete-account-btn"
+              variant="outline"
+              onClick={() => setConfirmDeleteAccount(true)}
+              className="text-red-600 hover:text-red-700"
+            >
+              Eliminar cuenta
+            </Button>
           </div>
         </div>
       </header>
@@ -144,6 +210,31 @@ export default function Dashboard() {
         <div className="space-y-6">
           <div className="flex justify-between items-center">
             <h2 className="text-2xl font-bold text-gray-900">Mis tarjetas</h2>
+            {tarjetas.length > 0 && (
+              <div className="flex gap-2">
+                <Input
+                  data-testid="search-tarjetas-input"
+                  value={busqueda}
+                  onChange={(e) => setBusqueda(e.target.value)}
+                  placeholder="Buscar por nombre, descripción o email"
+                  className="w-72"
+                />
+                <Button
+                  data-testid="view-directorio-btn"
+                  variant="outline"
+                  onClick={() => window.open(`/directorio/${user?.id}`, "_blank")}
+                >
+                  👥 Ver directorio
+                </Button>
+                <Button
+                  data-testid="download-qr-sheet-btn"
+                  variant="outline"
+                  onClick={handleDownloadQrSheet}
+                >
+                  🖨️ Descargar QRs (PDF)
+                </Button>
+              </div>
+            )}
           </div>
 
           {tarjetas.length === 0 ? (
@@ -159,7 +250,7 @@ export default function Dashboard() {
             </Card>
           ) : (
             <div className="grid md:grid-cols-2 lg:grid-cols-3 gap-6">
-              {tarjetas.map((tarjeta) => (
+              {tarjetasVisibles.map((tarjeta) => (
                 <Card
                   key={tarjeta.id}
                   data-testid={`tarjeta-card-${tarjeta.id}`}
@@ -254,6 +345,28 @@ export default function Dashboard() {
           </AlertDialogFooter>
         </AlertDialogContent>
       </AlertDialog>
+
+      <AlertDialog open={confirmDeleteAccount} onOpenChange={setConfirmDeleteAccount}>
+        <AlertDialogContent>
+          <AlertDialogHeader>
+            <AlertDialogTitle>¿Eliminar tu cuenta?</AlertDialogTitle>
+            <AlertDialogDescription>
+              Esta acción no se puede deshacer. Tu cuenta, tus tarjetas y todos
+              sus enlaces y archivos serán eliminados permanentemente.
+            </AlertDialogDescription>
+          </AlertDialogHeader>
+          <AlertDialogFooter>
+            <AlertDialogCancel data-testid="cancel-delete-account-btn">Cancelar</AlertDialogCancel>
+            <AlertDialogAction
+              data-testid="confirm-delete-account-btn"
+              onClick={handleDeleteAccount}
+              className="bg-red-600 hover:bg-red-700"
+            >
+              Eliminar cuenta
+            </AlertDialogAction>
+          </AlertDialogFooter>
+        </AlertDialogContent>
+      </AlertDialog>
     </div>
   );
 }
@@ -0,0 +1,107 @@
+import { useEffect, useState } from "react";
+import { useParams } from "react-router-dom";
+import { Card } from "@/components/ui/card";
+import { Button } from "@/components/ui/button";
+import { Input } from "@/components/ui/input";
+import axios from "axios";
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+export default function Directorio() {
+  const { usuarioId } = useParams();
+  const [busqueda, setBusqueda] = useState("");
+  const [tarjetas, setTarjetas] = useState([]);
+  const [page, setPage] = useState(1);
+  const [hasMore, setHasMore] = useState(false);
+  const [isLoading, setIsLoading] = useState(true);
+
+  useEffect(() => {
+    setPage(1);
+  }, [busqueda]);
+
+  useEffect(() => {
+    const timer = setTimeout(() => loadPage(page), 250);
+    return () => clearTimeout(timer);
+  }, [usuarioId, busqueda, page]);
+
+  const loadPage = async (pageToLoad) => {
+    try {
+      const response = await axios.get(`${API}/public/directorio/${usuarioId}`, {
+        params: { q: busqueda, page: pageToLoad },
+      });
+      setTarjetas((previous) =>
+        pageToLoad === 1 ? response.data.items : [...previous, ...response.data.items]
+      );
+      setHasMore(response.data.has_more);
+    } catch (error) {
+      console.error("Error loading directorio:", error);
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  return (
+    <div className="min-h-screen bg-gradient-to-br from-indigo-50 via-white to-purple-50">
+      <main className="container mx-auto px-4 py-12 max-w-3xl space-y-6">
+        <h1 className="text-3xl font-bold text-gray-900">Directorio</h1>
+        <Input
+          data-testid="directorio-search-input"
+          value={busqueda}
+          onChange={(e) => setBusqueda(e.target.value)}
+          placeholder="Buscar por nombre, descripción o email"
+        />
+
+        {!isLoading && tarjetas.length === 0 && (
+          <p className="text-gray-600">No se encontraron tarjetas</p>
+        )}
+
+        <div className="space-y-4">
+          {tarjetas.map((tarjeta) => (
+            <a key={tarjeta.id} href={`/t/${tarjeta.slug}`} className="block">
+              <Card
+                data-testid={`directorio-item-${tarjeta.id}`}
+                className="p-4 flex items-center gap-4 bg-white/80 border-2 border-gray-100 rounded-2xl hover:shadow-md transition-all"
+                style={{ borderLeftColor: tarjeta.color_tema, borderLeftWidth: "4px" }}
+              >
+                {tarjeta.foto_url ? (
+                  <img
+                    src={tarjeta.foto_url}
+                    alt={tarjeta.nombre}
+                    loading="lazy"
+                    className="w-12 h-12 rounded-full object-cover"
+                  />
+                ) : (
+                  <div
+                    className="w-12 h-12 rounded-full flex items-center justify-center text-white font-bold"
+                    style={{ backgroundColor: tarjeta.color_tema }}
+                  >
+                    {tarjeta.nombre.charAt(0).toUpperCase()}
+                  </div>
+                )}
+                <div className="flex-1 min-w-0">
+                  <h2 className="font-bold text-gray-900">{tarjeta.nombre}</h2>
+                  {tarjeta.descripcion && (
+                    <p className="text-sm text-gray-600 line-clamp-1">{tarjeta.descripcion}</p>
+                  )}
+                  {tarjeta.email && <p className="text-sm text-gray-500">{tarjeta.email}</p>}
+                </div>
+              </Card>
+            </a>
+          ))}
+        </div>
+
+        {hasMore && (
+          <Button
+            data-testid="directorio-more-btn"
+            variant="outline"
+            onClick={() => setPage(page + 1)}
+            className="w-full"
+          >
+            Ver más
+          </Button>
+        )}
+      </main>
+    </div>
+  );
+}
@@ -1,10 +1,11 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useNavigate, useParams } from "react-router-dom";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
 import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
 import { Textarea } from "@/components/ui/textarea";
+import { Switch } from "@/components/ui/switch";
 import axios from "axios";
 import { toast } from "sonner";
 
@@ -26,16 +27,42 @@ export default function Editor() {
   const [telefono, setTelefono] = useState("");
   const [whatsapp, setWhatsapp] = useState("");
   const [email, setEmail] = useState("");
+  const [directorio, setDirectorio] = useState(false);
   const [fotoUrl, setFotoUrl] = useState("");
   const [fotoPreview, setFotoPreview] = useState("");
   const [archivoNegocio, setArchivoNegocio] = useState("");
   const [archivoNegocioTipo, setArchivoNegocioTipo] = useState("");
   const [archivoNegocioNombre, setArchivoNegocioNombre] = useState("");
+  const liveSocket = useRef(null);
 
   useEffect(() => {
     loadData();
   }, [id]);
 
+  // Live editing: field changes are streamed to the server, which saves them debounced
+  useEffect(() => {
+    const socket = new WebSocket(
+      `${BACKEND_URL.replace(/^http/, "ws")}/api/ws/tarjetas/${id}/editor`
+    );
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === "error") {
+        console.error("Live editor error:", message.detail);
+      }
+    };
+    liveSocket.current = socket;
+    return () => socket.close();
+  }, [id]);
+
+  const updateLiveField = (field, value, setter) => {
+    setter(value);
+    if (liveSocket.current?.readyState === WebSocket.OPEN) {
+      liveSocket.current.send(
+        JSON.stringify({ type: "patch", fields: { [field]: value } })
+      );
+    }
+  };
+
   const loadData = async () => {
     try {
       const [tarjetaRes, enlacesRes] = await Promise.all([
@@ -51,6 +78,7 @@ export default function Editor() {
       setTelefono(t.telefono || "");
       setWhatsapp(t.whatsapp || "");
       setEmail(t.email || "");
+      setDirectorio(t.directorio || false);
       setFotoUrl(t.foto_url || "");
       setFotoPreview(t.foto_url || "");
       setArchivoNegocio(t.archivo_negocio || "");
@@ -83,7 +111,51 @@ export default function Editor() {
     }
   };
 
-  const handleArchivoNegocioUpload = (e) => {
+  const uploadArchivoNegocio = async (file, tipo) => {
+    const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+    const sha256 = Array.from(new Uint8Array(digest))
+      .map((b) => b.toString(16).padStart(2, "0"))
+      .join("");
+
+    const initRes = await axios.post(
+      `${API}/uploads`,
+      { tarjeta_id: id, nombre: file.name, tipo, size: file.size, sha256 },
+      { withCredentials: true }
+    );
+    const { upload_id, chunk_size } = initRes.data;
+    let offset = initRes.data.offset;
+    let retries = 0;
+
+    while (offset < file.size) {
+      try {
+        const res = await axios.put(
+          `${API}/uploads/${upload_id}`,
+          file.slice(offset, offset + chunk_size),
+          {
+            params: { offset },
+            headers: { "Content-Type": "application/octet-stream" },
+            withCredentials: true,
+          }
+        );
+        offset = res.data.offset;
+        retries = 0;
+      } catch (error) {
+        if (error.response?.status === 413 || retries >= 5) {
+          throw error;
+        }
+        retries += 1;
+        // Resume from whatever the server has stored
+        const statusRes = await axios.get(`${API}/uploads/${upload_id}`, {
+          withCredentials: true,
+        });
+        offset = statusRes.data.offset;
+      }
+    }
+
+    await axios.post(`${API}/uploads/${upload_id}/commit`, {}, { withCredentials: true });
+  };
+
+  const handleArchivoNegocioUpload = async (e) => {
     const file = e.target.files[0];
     if (file) {
       // Validate file type
@@ -93,21 +165,21 @@ export default function Editor() {
         return;
       }
 
-      // Validate file size (max 5MB)
-      if (file.size > 5 * 1024 * 1024) {
-        toast.error("El archivo no debe superar 5MB");
-        return;
-      }
-
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        const base64String = reader.result;
-        setArchivoNegocio(base64String);
-        setArchivoNegocioTipo(file.type.includes('pdf') ? 'pdf' : 'jpg');
+      const tipo = file.type.includes('pdf') ? 'pdf' : 'jpg';
+      try {
+        await uploadArchivoNegocio(file, tipo);
+        setArchivoNegocio("");
+        setArchivoNegocioTipo(tipo);
         setArchivoNegocioNombre(file.name);
         toast.success(`Archivo ${file.name} cargado`);
-      };
-      reader.readAsDataURL(file);
+      } catch (error) {
+        console.error("Error uploading archivo:", error);
+        if (error.response?.status === 413) {
+          toast.error("El archivo supera el tamaño permitido por tu plan");
+        } else {
+          toast.error("Error al subir el archivo");
+        }
+      }
     }
   };
 
@@ -131,6 +203,7 @@ export default function Editor() {
           telefono,
           whatsapp,
           email,
+          directorio,
           foto_url: fotoUrl,
           archivo_negocio: archivoNegocio,
           archivo_negocio_tipo: archivoNegocioTipo,
@@ -175,7 +248,11 @@ export default function Editor() {
       loadData();
     } catch (error) {
       console.error("Error saving:", error);
-      toast.error("Error al guardar cambios");
+      if (error.response?.status === 403) {
+        toast.error("Has alcanzado el límite de tu plan. Actualiza a Premium para continuar");
+      } else {
+        toast.error("Error al guardar cambios");
+      }
     } finally {
       setIsSaving(false);
     }
@@ -281,7 +358,7 @@ export default function Editor() {
                     id="nombre"
                     data-testid="nombre-input"
                     value={nombre}
-                    onChange={(e) => setNombre(e.target.value)}
+                    onChange={(e) => updateLiveField("nombre", e.target.value, setNombre)}
                     placeholder="Tu nombre"
                     className="mt-2"
                   />
@@ -292,7 +369,7 @@ export default function Editor() {
                     id="descripcion"
                     data-testid="descripcion-input"
                     value={descripcion}
-                    onChange={(e) => setDescripcion(e.target.value)}
+                    onChange={(e) => updateLiveField("descripcion", e.target.value, setDescripcion)}
                     placeholder="Desarrollador Full Stack | Amante del café ☕"
                     rows={3}
                     className="mt-2"
@@ -306,12 +383,12 @@ export default function Editor() {
                       data-testid="color-input"
                       type="color"
                       value={colorTema}
-                      onChange={(e) => setColorTema(e.target.value)}
+                      onChange={(e) => updateLiveField("color_tema", e.target.value, setColorTema)}
                       className="w-20 h-12"
                     />
                     <Input
                       value={colorTema}
-                      onChange={(e) => setColorTema(e.target.value)}
+                      onChange={(e) => updateLiveField("color_tema", e.target.value, setColorTema)}
                       placeholder="#6366f1"
                       className="flex-1"
                     />
@@ -329,7 +406,7 @@ export default function Editor() {
                     id="telefono"
                     data-testid="telefono-input"
                     value={telefono}
-                    onChange={(e) => setTelefono(e.target.value)}
+                    onChange={(e) => updateLiveField("telefono", e.target.value, setTelefono)}
                     placeholder="+52 1234567890"
                     className="mt-2"
                   />
@@ -344,7 +421,7 @@ export default function Editor() {
                     data-testid="email-input"
                     type="email"
                     value={email}
-                    onChange={(e) => setEmail(e.target.value)}
+                    onChange={(e) => updateLiveField("email", e.target.value, setEmail)}
                     placeholder="tu@email.com"
                     className="mt-2"
                   />
@@ -355,11 +432,25 @@ export default function Editor() {
                     id="whatsapp"
                     data-testid="whatsapp-input"
                     value={whatsapp}
-                    onChange={(e) => setWhatsapp(e.target.value)}
+                    onChange={(e) => updateLiveField("whatsapp", e.target.value, setWhatsapp)}
                     placeholder="+52 1234567890"
                     className="mt-2"
                   />
                 </div>
+                <div className="flex items-center justify-between">
+                  <div>
+                    <Label htmlFor="directorio">Mostrar en mi directorio</Label>
+                    <p className="text-xs text-gray-500 mt-1">
+                      La tarjeta aparecerá en la página pública de tu equipo
+                    </p>
+                  </div>
+                  <Switch
+                    id="directorio"
+                    data-testid="directorio-switch"
+                    checked={directorio}
+                    onCheckedChange={setDirectorio}
+                  />
+                </div>
               </div>
             </Card>
 
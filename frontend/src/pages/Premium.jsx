@@ -28,7 +28,7 @@ export default function Premium() {
     },
     {
       title: "Más enlaces",
-      description: "Enlaces ilimitados (free: hasta 10)",
+      description: "Enlaces ilimitados (free: hasta 10 en total)",
       icon: "🔗",
     },
     {
@@ -188,6 +188,16 @@ export default function TarjetaPublica() {
 
             {/* Contact Buttons */}
             <div className="space-y-3">
+              {tarjeta?.slug && (
+                <a
+                  data-testid="vcard-btn"
+                  href={`${API}/public/${tarjeta.slug}/vcard`}
+                  className="block w-full p-4 rounded-xl text-center font-semibold text-white hover:scale-105 transition-transform shadow-md"
+                  style={{ backgroundColor: colorTema }}
+                >
+                  👤 Guardar contacto
+                </a>
+              )}
               {tarjeta?.telefono && (
                 <button
                   data-testid="phone-btn"
@@ -218,69 +228,28 @@ export default function TarjetaPublica() {
                   📱 WhatsApp
                 </button>
               )}
-              {tarjeta?.archivo_negocio && (
-                <button
+              {tarjeta?.archivo_negocio_url && (
+                <a
                   data-testid="archivo-negocio-btn"
-                  onClick={() => {
-                    // Open in new window instead of downloading
-                    const newWindow = window.open();
-                    if (newWindow) {
-                      if (tarjeta.archivo_negocio_tipo === 'pdf') {
-                        // For PDF, create an iframe viewer
-                        newWindow.document.write(`
-                          <!DOCTYPE html>
-                          <html>
-                            <head>
-                              <title>${tarjeta.archivo_negocio_nombre || 'Documento'}</title>
-                              <style>
-                                body { margin: 0; padding: 0; overflow: hidden; }
-                                iframe { border: none; width: 100vw; height: 100vh; }
-                              </style>
-                            </head>
-                            <body>
-                              <iframe src="${tarjeta.archivo_negocio}"></iframe>
-                            </body>
-                          </html>
-                        `);
-                      } else {
-                        // For images, display centered
-                        newWindow.document.write(`
-                          <!DOCTYPE html>
-                          <html>
-                            <head>
-                              <title>${tarjeta.archivo_negocio_nombre || 'Imagen'}</title>
-                              <style>
-                                body { 
-                                  margin: 0; 
-                                  padding: 20px;
-                                  background: #000;
-                                  display: flex;
-                                  align-items: center;
-                                  justify-content: center;
-                                  min-height: 100vh;
-                                }
-                                img { 
-                                  max-width: 100%;
-                                  max-height: 100vh;
-                                  object-fit: contain;
-                                  box-shadow: 0 4px 6px rgba(0,0,0,0.3);
-                                }
-                              </style>
-                            </head>
-                            <body>
-                              <img src="${tarjeta.archivo_negocio}" alt="${tarjeta.archivo_negocio_nombre || 'Imagen'}" />
-                            </body>
-                          </html>
-                        `);
-                      }
-                      newWindow.document.close();
-                    }
-                  }}
-                  className="w-full p-4 rounded-xl text-center font-semibold text-white hover:scale-105 transition-transform shadow-md"
+                  href={`${BACKEND_URL}${tarjeta.archivo_negocio_url}`}
+                  target="_blank"
+                  rel="noopener noreferrer"
+                  className="block w-full rounded-xl overflow-hidden text-center font-semibold text-white hover:scale-105 transition-transform shadow-md"
                   style={{ backgroundColor: colorTema }}
                 >
-                  {tarjeta.archivo_negocio_tipo === 'pdf' ? '📄' : '🖼️'} Ver {tarjeta.archivo_negocio_tipo === 'pdf' ? 'Catálogo' : 'Imagen'}
-                </button>
+                  {tarjeta.archivo_negocio_preview && (
+                    <img
+                      data-testid="archivo-negocio-preview"
+                      src={tarjeta.archivo_negocio_preview}
+                      alt={tarjeta.archivo_negocio_nombre || "Vista previa"}
+                      loading="lazy"
+                      className="w-full max-h-64 object-cover bg-white"
+                    />
+                  )}
+                  <span className="block p-4">
+                    {tarjeta.archivo_negocio_tipo === 'pdf' ? '📄' : '🖼️'} Ver {tarjeta.archivo_negocio_tipo === 'pdf' ? 'Catálogo' : 'Imagen'}
+                  </span>
+                </a>
               )}
             </div>
 
@@ -0,0 +1,31 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other as top-level modules, and server.py
+# picks its datastore at import time
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ["DATASTORE"] = "memory"
+os.environ.setdefault("DB_NAME", "test_database")
+os.environ.setdefault("ADMIN_TOKEN", "test-admin-token")
+
+
+@pytest.fixture
+def connect():
+    """Returns a coroutine function giving an httpx client for the app, signed in as a new user"""
+    import httpx
+    import server
+
+    async def connect_client():
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://testserver")
+        response = await http.post("/api/auth/register", json={
+            "name": "Ana Núñez", "email": f"{uuid.uuid4()}@example.com", "password": "secret1"
+        })
+        assert response.status_code == 200, response.text
+        http.headers["Authorization"] = f"Bearer {response.cookies['session_token']}"
+        return http
+
+    return connect_client
@@ -0,0 +1,239 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from gridfs.errors import NoFile
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import datastore
+from datastore import MemoryClient, MemoryGridFSBucket
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def collection(docs=()):
+    items = MemoryClient()["datastore_test"].items
+    for doc in docs:
+        run(items.insert_one(dict(doc)))
+    return items
+
+
+def ids(items, query, projection=None, sort=None):
+    cursor = items.find(query, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    return [doc["id"] for doc in run(cursor.to_list(None))]
+
+
+DOCS = [
+    {"id": "a", "n": 3, "tags": ["x", "y"], "sub": {"k": 1}, "deleted_at": None},
+    {"id": "b", "n": 1, "nombre": "Hola", "fecha": "2024-01-01T00:00:00"},
+    {"id": "c", "n": 2.5},
+    {"id": "d", "n": "tres", "deleted_at": datetime(2024, 1, 1, tzinfo=timezone.utc)},
+]
+
+
+def test_equality_null_and_arrays():
+    items = collection(DOCS)
+    assert ids(items, {"deleted_at": None}) == ["a", "b", "c"]
+    assert ids(items, {"deleted_at": {"$ne": None}}) == ["d"]
+    assert ids(items, {"tags": "y"}) == ["a"]
+    assert ids(items, {"sub.k": 1}) == ["a"]
+    assert ids(items, {"id": {"$in": ["a", "c"]}, "n": {"$exists": True}}) == ["a", "c"]
+    assert ids(items, {"id": {"$nin": ["a", "c"]}}) == ["b", "d"]
+    assert ids(items, {"$or": [{"id": "b"}, {"tags": "x"}]}) == ["a", "b"]
+
+
+def test_range_operators_only_compare_within_a_type():
+    items = collection(DOCS)
+    assert ids(items, {"n": {"$gt": 1}}) == ["a", "c"]
+    assert ids(items, {"n": {"$lte": 2.5}}) == ["b", "c"]
+    assert ids(items, {"n": {"$gt": "a"}}) == ["d"]
+
+
+def test_type_and_regex():
+    items = collection(DOCS)
+    assert ids(items, {"n": {"$type": "string"}}) == ["d"]
+    assert ids(items, {"n": {"$type": "number"}}) == ["a", "b", "c"]
+    assert ids(items, {"fecha": {"$type": "string"}}) == ["b"]
+    assert ids(items, {"deleted_at": {"$type": "date"}}) == ["d"]
+    assert ids(items, {"tags": {"$type": "array"}}) == ["a"]
+    assert ids(items, {"nombre": {"$regex": "^hol", "$options": "i"}}) == ["b"]
+    assert ids(items, {"tags": {"$regex": "^y"}}) == ["a"]
+
+
+def test_unsupported_operators_raise():
+    items = collection(DOCS)
+    with pytest.raises(NotImplementedError):
+        run(items.find_one({"n": {"$where": "1"}}))
+    with pytest.raises(NotImplementedError):
+        run(items.update_one({"id": "a"}, {"$push": {"tags": "z"}}))
+    with pytest.raises(ValueError):
+        run(items.update_one({"id": "a"}, {"n": 1}))
+
+
+def test_projections():
+    items = collection(DOCS)
+    assert run(items.find_one({"id": "a"}, {"_id": 0, "sub.k": 1, "id": 1})) == {"id": "a", "sub": {"k": 1}}
+    assert list(run(items.find_one({"id": "a"}, {"_id": 1}))) == ["_id"]
+    excluded = run(items.find_one({"id": "a"}, {"_id": 0, "tags": 0, "sub": 0}))
+    assert excluded == {"id": "a", "n": 3, "deleted_at": None}
+
+
+def test_returned_documents_are_copies():
+    items = collection(DOCS)
+    doc = run(items.find_one({"id": "a"}))
+    doc["sub"]["k"] = 99
+    assert run(items.find_one({"id": "a"}))["sub"]["k"] == 1
+
+    inserted = {"id": "e", "sub": {"k": 1}}
+    run(items.insert_one(inserted))
+    assert "_id" in inserted  # filled in like pymongo does
+    inserted["sub"]["k"] = 2
+    assert run(items.find_one({"id": "e"}))["sub"]["k"] == 1
+
+
+def test_dates_come_back_utc_aware_at_millisecond_precision():
+    items = collection()
+    run(items.insert_one({"id": "a", "at": datetime(2024, 5, 1, 12, 0, 0, 123456)}))
+    at = run(items.find_one({"id": "a"}))["at"]
+    assert at == datetime(2024, 5, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+
+
+def test_sort_orders_across_types_and_arrays():
+    items = collection(DOCS)
+    assert ids(items, {}, sort=[("n", 1)]) == ["b", "c", "a", "d"]
+    assert ids(items, {}, sort=[("n", -1)]) == ["d", "a", "c", "b"]
+    assert [doc["id"] for doc in run(items.find({}).sort("n", 1).skip(1).limit(2).to_list(None))] == ["c", "a"]
+
+    tagged = collection([{"id": "p", "tags": [5, 1]}, {"id": "q", "tags": [3]}, {"id": "r"}])
+    assert ids(tagged, {}, sort=[("tags", 1)]) == ["r", "p", "q"]
+    assert ids(tagged, {}, sort=[("tags", -1)]) == ["p", "q", "r"]
+
+
+def test_update_operators_and_modified_count():
+    items = collection(DOCS)
+    result = run(items.update_one({"id": "a"}, {"$inc": {"sub.k": 2, "usage.bytes": 10}, "$unset": {"tags": ""}}))
+    assert (result.matched_count, result.modified_count) == (1, 1)
+    assert run(items.find_one({"id": "a"}, {"_id": 0, "sub": 1, "usage": 1, "tags": 1})) == {
+        "sub": {"k": 3}, "usage": {"bytes": 10}
+    }
+    result = run(items.update_one({"id": "a"}, {"$set": {"n": 3}}))
+    assert (result.matched_count, result.modified_count) == (1, 0)
+    result = run(items.update_many({"n": {"$type": "number"}}, {"$set": {"seen": True}}))
+    assert result.modified_count == 3
+
+
+def test_upsert_seeds_document_from_equality_conditions():
+    items = collection()
+    result = run(items.update_one(
+        {"key": "k", "status": {"$eq": "queued"}, "n": {"$gt": 1}},
+        {"$setOnInsert": {"id": "new"}, "$set": {"count": 1}},
+        upsert=True,
+    ))
+    assert result.upserted_id is not None and result.matched_count == 0
+    assert run(items.find_one({}, {"_id": 0})) == {"key": "k", "status": "queued", "id": "new", "count": 1}
+
+    # $setOnInsert is skipped when the filter matches
+    run(items.update_one({"key": "k"}, {"$setOnInsert": {"id": "other"}, "$inc": {"count": 1}}, upsert=True))
+    assert run(items.find_one({}, {"_id": 0, "id": 1, "count": 1})) == {"id": "new", "count": 2}
+
+
+def test_find_one_and_update_sort_and_return_document():
+    now = datetime.now(timezone.utc)
+    items = collection([
+        {"id": "late", "status": "queued", "run_at": now},
+        {"id": "early", "status": "queued", "run_at": now - timedelta(seconds=5)},
+        {"id": "future", "status": "queued", "run_at": now + timedelta(seconds=60)},
+    ])
+    claim = lambda **options: run(items.find_one_and_update(
+        {"status": "queued", "run_at": {"$lte": now}},
+        {"$set": {"status": "running"}, "$inc": {"attempts": 1}},
+        sort=[("run_at", 1)], **options
+    ))
+
+    after = claim(return_document=ReturnDocument.AFTER, projection={"_id": 0, "id": 1, "status": 1, "attempts": 1})
+    assert after == {"id": "early", "status": "running", "attempts": 1}
+    before = claim()
+    assert before["id"] == "late" and before["status"] == "queued" and "attempts" not in before
+    assert claim() is None
+
+    deleted = run(items.find_one_and_delete({"status": "queued"}, projection={"_id": 0, "id": 1}))
+    assert deleted == {"id": "future"}
+
+
+def test_unique_and_partial_unique_indexes():
+    jobs = MemoryClient()["datastore_test"].jobs
+    run(jobs.create_index("id", unique=True))
+    run(jobs.create_index("key", unique=True, partialFilterExpression={"status": "queued", "key": {"$exists": True}}))
+
+    run(jobs.insert_one({"id": 1, "status": "queued"}))
+    run(jobs.insert_one({"id": 2, "status": "queued"}))  # Unkeyed jobs stay out of the key index
+    run(jobs.insert_one({"id": 3, "status": "queued", "key": "k"}))
+    with pytest.raises(DuplicateKeyError):
+        run(jobs.insert_one({"id": 4, "status": "queued", "key": "k"}))
+    with pytest.raises(DuplicateKeyError):
+        run(jobs.insert_one({"id": 1}))
+
+    # Only queued jobs are in the partial index
+    run(jobs.update_one({"id": 3}, {"$set": {"status": "running"}}))
+    run(jobs.insert_one({"id": 5, "status": "queued", "key": "k"}))
+    with pytest.raises(DuplicateKeyError):
+        run(jobs.update_one({"id": 3}, {"$set": {"status": "queued"}}))
+    assert run(jobs.find_one({"id": 3}))["status"] == "running"
+
+    # A keyed upsert that finds its queued twin doesn't insert
+    run(jobs.update_one({"key": "k", "status": "queued"}, {"$setOnInsert": {"id": 6}}, upsert=True))
+    assert run(jobs.count_documents({"key": "k"})) == 2
+
+
+def test_bulk_write_and_aggregate():
+    items = collection(DOCS)
+    result = run(items.bulk_write([
+        UpdateOne({"id": "a"}, {"$set": {"q": 1}}),
+        UpdateOne({"id": "zz"}, {"$set": {"q": 1}}),
+    ], ordered=False))
+    assert (result.matched_count, result.modified_count) == (1, 1)
+
+    run(items.create_index("id", unique=True))
+    with pytest.raises(BulkWriteError) as error:
+        run(items.bulk_write([UpdateOne({"id": "a"}, {"$set": {"id": "b"}})]))
+    assert error.value.details["writeErrors"][0]["code"] == 11000
+
+    rows = run(items.aggregate([
+        {"$match": {"n": {"$type": "number"}}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "lowest": {"$min": "$n"}}},
+    ]).to_list(None))
+    assert rows == [{"_id": None, "count": 3, "lowest": 1}]
+
+
+def test_gridfs_bucket():
+    database = MemoryClient()["datastore_test"]
+    bucket = datastore.gridfs_bucket(database, "archivos")
+    assert isinstance(bucket, MemoryGridFSBucket)
+
+    async def scenario():
+        grid_in = MemoryGridFSBucket(database, "archivos", chunk_size_bytes=4).open_upload_stream_with_id(
+            "f1", "catalogo.pdf", metadata={"usuario_id": "u"}
+        )
+        await grid_in.write(b"0123456789")
+        await grid_in.close()
+
+        grid_out = await bucket.open_download_stream("f1")
+        assert (grid_out.length, grid_out.filename) == (10, "catalogo.pdf")
+        chunks = []
+        while chunk := await grid_out.readchunk():
+            chunks.append(chunk)
+        assert chunks == [b"0123", b"4567", b"89"]
+        assert await (await bucket.open_download_stream("f1")).read() == b"0123456789"
+
+        await bucket.delete("f1")
+        with pytest.raises(NoFile):
+            await bucket.open_download_stream("f1")
+        with pytest.raises(NoFile):
+            await bucket.delete("f1")
+
+    run(scenario())
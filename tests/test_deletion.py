@@ -0,0 +1,45 @@
+import asyncio
+import uuid
+
+import httpx
+
+import server
+
+
+def test_deleted_tarjeta_frees_its_slug_before_the_purge(connect):
+    async def scenario():
+        http = await connect()
+        first = (await http.post("/api/tarjetas", json={"nombre": "Estudio Lumen"})).json()
+        assert first["slug"] == "estudio-lumen" or first["slug"].startswith("estudio-lumen-")
+        assert (await http.delete(f"/api/tarjetas/{first['id']}")).status_code == 200
+
+        second = (await http.post("/api/tarjetas", json={"nombre": "Estudio Lumen"})).json()
+        assert second["slug"] == first["slug"]
+        response = await http.get(f"/api/tarjetas/slug/{first['slug']}")
+        assert response.json()["id"] == second["id"]
+        # Still there for the purge job, under its placeholder
+        assert await server.db.tarjetas.find_one({"id": first["id"], "deleted_at": {"$ne": None}})
+
+    asyncio.run(scenario())
+
+
+def test_deleted_account_frees_its_email_before_the_purge():
+    account = {"name": "Ana Núñez", "email": f"{uuid.uuid4()}@example.com", "password": "secret1"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as http:
+            response = await http.post("/api/auth/register", json=account)
+            assert response.status_code == 200
+            old_id = response.json()["user_id"]
+            headers = {"Authorization": f"Bearer {response.cookies['session_token']}"}
+            old_slug = (await http.get("/api/tarjetas", headers=headers)).json()[0]["slug"]
+            assert (await http.delete("/api/auth/me", headers=headers)).status_code == 200
+
+            response = await http.post("/api/auth/register", json=account)
+            assert response.status_code == 200, response.text
+            assert response.json()["user_id"] != old_id
+            old = await server.db.tarjetas.find_one({"usuario_id": old_id})
+            assert old["deleted_at"] and old["slug"] != old_slug
+
+    asyncio.run(scenario())
@@ -0,0 +1,22 @@
+import asyncio
+
+
+def test_enlaces_of_a_deleted_tarjeta_are_hidden_before_the_purge(connect):
+    async def scenario():
+        http = await connect()
+        tarjeta = (await http.get("/api/tarjetas")).json()[0]
+        for orden in (1, 0):
+            response = await http.post(f"/api/enlaces/{tarjeta['id']}", json={
+                "titulo": f"Enlace {orden}", "url": f"https://example.com/{orden}", "orden": orden
+            })
+            assert response.status_code == 200, response.text
+
+        public = (await http.get(f"/api/enlaces/{tarjeta['id']}")).json()
+        assert [enlace["titulo"] for enlace in public] == ["Enlace 0", "Enlace 1"]
+
+        # No job runner here, so the enlaces are still stored
+        response = await http.delete(f"/api/tarjetas/{tarjeta['id']}")
+        assert response.status_code == 200
+        assert (await http.get(f"/api/enlaces/{tarjeta['id']}")).json() == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import jobs
+from datastore import MemoryClient
+from jobs import DuplicateJob, JobRunner
+
+
+def test_stop_returns_promptly_after_running_a_job(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0.01)
+
+    async def scenario():
+        ran = asyncio.Event()
+
+        async def handler(job):
+            ran.set()
+
+        runner = JobRunner(MemoryClient()["jobs_test"])
+        runner.register("noop", handler)
+        await runner.start()
+        await runner.enqueue("noop", {"n": 1})
+        await asyncio.wait_for(ran.wait(), 2)
+        await asyncio.sleep(0.05)
+        # A wakeup landing together with the cancel must not keep the loop polling
+        runner.types["noop"].wakeup.set()
+        await asyncio.wait_for(runner.stop(), 2)
+        assert all(task.done() for task in runner.tasks)
+
+    for _ in range(5):
+        asyncio.run(scenario())
+
+
+def test_retry_refuses_dead_job_whose_key_is_queued_again():
+    async def scenario():
+        async def handler(job):
+            pass
+
+        database = MemoryClient()["jobs_test"]
+        runner = JobRunner(database)
+        runner.register("vcard", handler)
+        await runner.start()
+        await runner.stop()
+
+        await runner.enqueue("vcard", {}, key="vcard:1")
+        await database.jobs.update_one({"key": "vcard:1"}, {"$set": {"status": "dead"}})
+        await runner.enqueue("vcard", {}, key="vcard:1")
+        dead = await database.jobs.find_one({"status": "dead"})
+
+        with pytest.raises(DuplicateJob):
+            await runner.retry(dead["id"])
+        assert await database.jobs.count_documents({"key": "vcard:1", "status": "dead"}) == 1
+        assert await database.jobs.count_documents({"key": "vcard:1", "status": "queued"}) == 1
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_on_the_last_attempt_dead_letters_the_job():
+    async def scenario():
+        ran = []
+
+        async def handler(job):
+            ran.append(job.attempts)
+
+        database = MemoryClient()["jobs_test"]
+        runner = JobRunner(database)
+        runner.register("preview", handler, max_attempts=3)
+        await runner.enqueue("preview", {"tarjeta_id": "t1"})
+        await runner.enqueue("preview", {"tarjeta_id": "t2"})
+        # Both workers died mid-run, one on its last attempt
+        expired = jobs.utcnow() - timedelta(seconds=1)
+        for tarjeta_id, attempts in (("t1", 3), ("t2", 2)):
+            await database.jobs.update_one(
+                {"payload.tarjeta_id": tarjeta_id},
+                {"$set": {"status": "running", "attempts": attempts, "lease_until": expired}}
+            )
+
+        spec = runner.types["preview"]
+        claimed = await runner._claim(spec)
+        assert claimed["payload"]["tarjeta_id"] == "t2" and claimed["attempts"] == 3
+        assert await runner._claim(spec) is None
+
+        dead = await database.jobs.find_one({"payload.tarjeta_id": "t1"})
+        assert dead["status"] == "dead" and dead["attempts"] == 3 and dead["lease_until"] is None
+        assert spec.dead == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,125 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import server
+
+
+@pytest.fixture
+def client():
+    client = TestClient(server.app)
+    response = client.post("/api/auth/register", json={
+        "name": "Ana Núñez", "email": f"{uuid.uuid4()}@example.com", "password": "secret1"
+    })
+    assert response.status_code == 200, response.text
+    client.headers["Authorization"] = f"Bearer {response.cookies['session_token']}"
+    return client
+
+
+def stored(tarjeta_id: str) -> dict:
+    return asyncio.run(server.db.tarjetas.find_one({"id": tarjeta_id}, {"_id": 0}))
+
+
+def test_patches_are_broadcast_and_flushed(client, monkeypatch):
+    monkeypatch.setattr(server.editor_hub, "debounce", 60)
+    tarjeta = client.get("/api/tarjetas").json()[0]
+
+    with client.websocket_connect(f"/api/ws/tarjetas/{tarjeta['id']}/editor") as websocket:
+        state = websocket.receive_json()
+        assert state["type"] == "state" and state["version"] == 0
+        assert state["tarjeta"]["nombre"] == tarjeta["nombre"]
+
+        websocket.send_json({"type": "patch", "fields": {"descripcion": "Fotografía en Madrid"}})
+        assert websocket.receive_json() == {
+            "type": "patch", "fields": {"descripcion": "Fotografía en Madrid"}, "version": 1
+        }
+        assert stored(tarjeta["id"])["descripcion"] != "Fotografía en Madrid"
+
+        websocket.send_json({"type": "flush"})
+        assert websocket.receive_json() == {"type": "saved", "version": 1}
+        assert stored(tarjeta["id"])["descripcion"] == "Fotografía en Madrid"
+
+
+def test_debounced_write_reaches_the_database(client, monkeypatch):
+    monkeypatch.setattr(server.editor_hub, "debounce", 0.05)
+    tarjeta = client.get("/api/tarjetas").json()[0]
+
+    with client.websocket_connect(f"/api/ws/tarjetas/{tarjeta['id']}/editor") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "patch", "fields": {"nombre": "Ana"}})
+        websocket.send_json({"type": "patch", "fields": {"nombre": "Ana García"}})
+        assert websocket.receive_json()["version"] == 1
+        assert websocket.receive_json()["version"] == 2
+        # Both patches land in one write
+        assert websocket.receive_json() == {"type": "saved", "version": 2}
+        assert stored(tarjeta["id"])["nombre"] == "Ana García"
+
+
+def test_invalid_patches_get_an_error(client):
+    tarjeta = client.get("/api/tarjetas").json()[0]
+
+    with client.websocket_connect(f"/api/ws/tarjetas/{tarjeta['id']}/editor") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "patch", "fields": {"slug": "otra", "nombre": "Ana"}})
+        assert websocket.receive_json() == {"type": "error", "detail": "Fields not editable live: slug"}
+        websocket.send_text("{")
+        assert websocket.receive_json() == {"type": "error", "detail": "Invalid JSON"}
+        websocket.send_json({"type": "flush"})
+    assert stored(tarjeta["id"])["slug"] == tarjeta["slug"]
+
+
+def test_other_origins_and_anonymous_editors_are_refused(client, monkeypatch):
+    monkeypatch.setattr(server, "CORS_ORIGINS", ["https://app.example.com"])
+    tarjeta = client.get("/api/tarjetas").json()[0]
+    url = f"/api/ws/tarjetas/{tarjeta['id']}/editor"
+
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect(url, headers={"Origin": "https://evil.example.com"}):
+            pass
+    assert refused.value.code == 4403
+
+    with client.websocket_connect(url, headers={"Origin": "https://app.example.com"}) as websocket:
+        assert websocket.receive_json()["type"] == "state"
+
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with TestClient(server.app).websocket_connect(url):
+            pass
+    assert refused.value.code == 4401
+
+
+def test_any_origin_setting_still_refuses_foreign_pages(client, monkeypatch):
+    monkeypatch.setattr(server, "CORS_ORIGINS", ["*"])
+    tarjeta = client.get("/api/tarjetas").json()[0]
+    url = f"/api/ws/tarjetas/{tarjeta['id']}/editor"
+
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect(url, headers={"Origin": "https://evil.example.com"}):
+            pass
+    assert refused.value.code == 4403
+
+    with client.websocket_connect(url, headers={"Origin": "https://testserver"}) as websocket:
+        assert websocket.receive_json()["type"] == "state"
+
+
+def test_rest_updates_replace_pending_live_edits(client, monkeypatch):
+    monkeypatch.setattr(server.editor_hub, "debounce", 60)
+    tarjeta = client.get("/api/tarjetas").json()[0]
+
+    with client.websocket_connect(f"/api/ws/tarjetas/{tarjeta['id']}/editor") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "patch", "fields": {"nombre": "Live", "descripcion": "Live"}})
+        websocket.receive_json()
+
+        response = client.put(f"/api/tarjetas/{tarjeta['id']}", json={"nombre": "Rest", "color_tema": "#000000"})
+        assert response.status_code == 200
+        assert websocket.receive_json() == {
+            "type": "patch", "fields": {"nombre": "Rest", "color_tema": "#000000"}, "version": 2
+        }
+
+        websocket.send_json({"type": "flush"})
+        assert websocket.receive_json() == {"type": "saved", "version": 2}
+    saved = stored(tarjeta["id"])
+    assert (saved["nombre"], saved["descripcion"], saved["color_tema"]) == ("Rest", "Live", "#000000")
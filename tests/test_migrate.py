@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timezone
+
+from datastore import MemoryClient
+from migrate import dates_migration, run_migration
+
+
+def users_with_string_dates(count: int):
+    database = MemoryClient()["migrate_test"]
+
+    async def seed():
+        for n in range(count):
+            await database.users.insert_one({"id": f"u{n}", "created_at": f"2024-01-0{n + 1}T10:00:00"})
+        # Already migrated documents are left alone
+        await database.users.insert_one({"id": "new", "created_at": datetime(2024, 2, 1, tzinfo=timezone.utc)})
+
+    asyncio.run(seed())
+    return database
+
+
+def migrate(database, **options):
+    migration = dates_migration("users", ["created_at"])
+    return asyncio.run(run_migration(database, migration, batch_size=2, ops_per_sec=1e6, **options))
+
+
+def created_at(database) -> dict:
+    users = asyncio.run(database.users.find({}, {"_id": 0}).to_list(None))
+    return {user["id"]: user["created_at"] for user in users}
+
+
+def test_string_dates_become_utc_dates():
+    database = users_with_string_dates(3)
+    assert migrate(database) == 3
+    dates = created_at(database)
+    assert dates["u0"] == datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+    assert all(isinstance(value, datetime) for value in dates.values())
+
+    state = asyncio.run(database.migrations.find_one({"name": "dates_users"}))
+    assert (state["status"], state["processed"], state["modified"]) == ("done", 3, 3)
+
+
+def test_interrupted_run_resumes_after_last_id():
+    database = users_with_string_dates(4)
+    second = asyncio.run(database.users.find({}).sort("_id", 1).to_list(None))[1]["_id"]
+    asyncio.run(database.migrations.insert_one({
+        "name": "dates_users", "status": "running", "last_id": second, "processed": 2, "modified": 2
+    }))
+
+    assert migrate(database) == 2
+    dates = created_at(database)
+    # The batch before the interruption isn't looked at again
+    assert isinstance(dates["u0"], str) and isinstance(dates["u1"], str)
+    assert isinstance(dates["u2"], datetime) and isinstance(dates["u3"], datetime)
+
+
+def test_rerun_modifies_nothing():
+    database = users_with_string_dates(3)
+    migrate(database)
+    assert migrate(database) == 0
+    assert migrate(database, rerun=True) == 0
+    state = asyncio.run(database.migrations.find_one({"name": "dates_users"}))
+    assert (state["status"], state["modified"]) == ("done", 0)
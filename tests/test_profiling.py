@@ -0,0 +1,45 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import profiling
+import server
+
+ADMIN = {"X-Admin-Token": os.environ["ADMIN_TOKEN"]}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    return TestClient(server.app)
+
+
+def test_x_profile_with_the_admin_token_records_a_trace(client):
+    assert client.get("/api/enlaces/missing").status_code == 200
+    assert client.get("/api/admin/profiles", headers=ADMIN).json() == []
+
+    response = client.get("/api/enlaces/missing", headers={"X-Profile": os.environ["ADMIN_TOKEN"]})
+    assert response.status_code == 200
+    traces = client.get("/api/admin/profiles", headers=ADMIN).json()
+    assert [(trace["method"], trace["path"], trace["status"]) for trace in traces] == [
+        ("GET", "/api/enlaces/missing", 200)
+    ]
+
+    trace = client.get(f"/api/admin/profiles/{traces[0]['name']}", headers=ADMIN).json()
+    assert trace["profile"] and "mongo" in trace
+
+
+def test_wrong_token_is_not_profiled_and_cannot_list(client):
+    client.get("/api/enlaces/missing", headers={"X-Profile": "guess"})
+    assert client.get("/api/admin/profiles", headers={"X-Admin-Token": "guess"}).status_code == 403
+    assert client.get("/api/admin/profiles", headers=ADMIN).json() == []
+
+
+def test_trace_ring_keeps_the_newest_files(client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 3)
+    for n in range(5):
+        client.get(f"/api/enlaces/t{n}", headers={"X-Profile": os.environ["ADMIN_TOKEN"]})
+
+    traces = client.get("/api/admin/profiles", headers=ADMIN).json()
+    assert [trace["path"] for trace in traces] == [f"/api/enlaces/t{n}" for n in (4, 3, 2)]
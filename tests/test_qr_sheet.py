@@ -0,0 +1,61 @@
+import asyncio
+import io
+import zipfile
+
+import pymupdf
+
+import server
+
+
+async def create_tarjetas(http, count: int) -> list:
+    for n in range(count):
+        response = await http.post("/api/tarjetas", json={"nombre": f"Tarjeta {n}"})
+        assert response.status_code == 200, response.text
+    return [tarjeta["id"] for tarjeta in (await http.get("/api/tarjetas")).json()]
+
+
+def test_sheet_streams_one_pdf_page_or_zip_file_per_tarjeta(connect):
+    async def scenario():
+        http = await connect()
+        tarjeta_ids = await create_tarjetas(http, 2)
+
+        response = await http.post("/api/tarjetas/qr-sheet", json={"formato": "pdf"})
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/pdf"
+        with pymupdf.open(stream=response.content, filetype="pdf") as document:
+            assert document.page_count == 3
+
+        response = await http.post("/api/tarjetas/qr-sheet", json={
+            "formato": "zip", "imagen": "svg", "tarjeta_ids": tarjeta_ids[:2]
+        })
+        assert response.status_code == 200, response.text
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert archive.testzip() is None
+            names = archive.namelist()
+        assert len(names) == 2 and all(name.endswith(".svg") for name in names)
+
+    asyncio.run(scenario())
+
+
+def test_sheet_over_the_limit_is_refused_not_truncated(connect, monkeypatch):
+    monkeypatch.setattr(server, "QR_SHEET_MAX_TARJETAS", 2)
+
+    async def scenario():
+        http = await connect()
+        tarjeta_ids = await create_tarjetas(http, 2)
+
+        # Every tarjeta of the user
+        response = await http.post("/api/tarjetas/qr-sheet", json={"formato": "zip"})
+        assert response.status_code == 400
+        assert "at most 2 tarjetas" in response.json()["detail"]
+
+        # Too many ids, even if some don't exist
+        response = await http.post("/api/tarjetas/qr-sheet", json={"tarjeta_ids": [*tarjeta_ids[:2], "missing"]})
+        assert response.status_code == 400
+
+        response = await http.post("/api/tarjetas/qr-sheet", json={"tarjeta_ids": tarjeta_ids[:2]})
+        assert response.status_code == 200, response.text
+        with pymupdf.open(stream=response.content, filetype="pdf") as document:
+            assert document.page_count == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+import asyncio
+
+from datastore import MemoryClient
+from quotas import reconcile_usage
+
+
+def test_reconcile_repairs_usage_and_per_tarjeta_enlace_counts():
+    async def scenario():
+        database = MemoryClient()["quotas_test"]
+        await database.users.insert_one({"id": "u", "usage": {"tarjetas": 2, "enlaces": 9, "bytes": 0}})
+        await database.tarjetas.insert_many([
+            {"id": "drifted", "usuario_id": "u", "deleted_at": None, "archivo_negocio_bytes": 0, "enlaces_count": 5},
+            {"id": "legacy", "usuario_id": "u", "deleted_at": None, "archivo_negocio_bytes": 0},
+            {"id": "right", "usuario_id": "u", "deleted_at": None, "archivo_negocio_bytes": 0, "enlaces_count": 1},
+        ])
+        await database.enlaces.insert_many([
+            {"id": "e1", "tarjeta_id": "drifted"},
+            {"id": "e2", "tarjeta_id": "legacy"},
+            {"id": "e3", "tarjeta_id": "legacy"},
+            {"id": "e4", "tarjeta_id": "right"},
+        ])
+
+        assert await reconcile_usage(database) == 1
+        counts = {t["id"]: t["enlaces_count"] async for t in database.tarjetas.find({})}
+        assert counts == {"drifted": 1, "legacy": 2, "right": 1}
+        user = await database.users.find_one({"id": "u"})
+        assert user["usage"] == {"tarjetas": 3, "enlaces": 4, "bytes": 0}
+
+        assert await reconcile_usage(database) == 0
+
+    asyncio.run(scenario())
+
+
+def test_only_enlace_counts_drifting_still_counts_as_repaired():
+    async def scenario():
+        database = MemoryClient()["quotas_test"]
+        await database.users.insert_one({"id": "u", "usage": {"tarjetas": 1, "enlaces": 0, "bytes": 0}})
+        await database.tarjetas.insert_one(
+            {"id": "t", "usuario_id": "u", "deleted_at": None, "archivo_negocio_bytes": 0, "enlaces_count": 3}
+        )
+        assert await reconcile_usage(database) == 1
+        assert (await database.tarjetas.find_one({"id": "t"}))["enlaces_count"] == 0
+
+    asyncio.run(scenario())
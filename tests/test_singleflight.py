@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call_and_get_their_own_copy():
+    async def scenario():
+        group = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"enlaces": [1, 2]}
+
+        results = await asyncio.gather(*(group.do("k", fetch) for _ in range(5)))
+        assert calls == 1 and group.in_flight() == 0
+        results[0]["enlaces"].append(3)
+        assert results[1] == {"enlaces": [1, 2]}
+
+        # Not a cache: the next call runs again
+        await group.do("k", fetch)
+        assert calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_waiter():
+    async def scenario():
+        group = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise LookupError("down")
+
+        results = await asyncio.gather(*(group.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, LookupError) for result in results)
+        assert group.in_flight() == 0
+
+    asyncio.run(scenario())
+
+
+def test_a_waiter_giving_up_does_not_cancel_the_others():
+    async def scenario():
+        group = SingleFlight()
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "ok"
+
+        patient = asyncio.create_task(group.do("k", slow))
+        cancelled = asyncio.create_task(group.do("k", slow))
+        await asyncio.sleep(0)
+        with pytest.raises(TimeoutError):
+            await group.do("k", slow, timeout=0.01)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+
+        assert not patient.done() and group.in_flight() == 1
+        release.set()
+        assert await patient == "ok"
+        assert cancelled.cancelled()
+
+    asyncio.run(scenario())
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+import uploads
+from datastore import MemoryClient
+from quotas import get_plan_limits
+
+
+def upload_request(tarjeta_id: str, content: bytes) -> dict:
+    return {
+        "tarjeta_id": tarjeta_id, "nombre": "catalogo.pdf", "tipo": "pdf",
+        "size": len(content), "sha256": hashlib.sha256(content).hexdigest(),
+    }
+
+
+async def start_upload(http, content: bytes) -> str:
+    tarjeta = (await http.get("/api/tarjetas")).json()[0]
+    response = await http.post("/api/uploads", json=upload_request(tarjeta["id"], content))
+    assert response.status_code == 200, response.text
+    return response.json()["upload_id"]
+
+
+def test_concurrent_commits_reserve_storage_once(connect):
+    content = os.urandom(20_000)
+
+    async def scenario():
+        http = await connect()
+        upload_id = await start_upload(http, content)
+        response = await http.put(f"/api/uploads/{upload_id}", params={"offset": 0}, content=content)
+        assert response.status_code == 200, response.text
+
+        responses = await asyncio.gather(*(http.post(f"/api/uploads/{upload_id}/commit") for _ in range(2)))
+        assert sorted(response.status_code for response in responses) == [200, 409]
+        me = (await http.get("/api/auth/me")).json()
+        assert me["usage"]["bytes"] == len(content)
+
+    asyncio.run(scenario())
+
+
+def test_append_at_a_claimed_offset_is_rejected_without_touching_the_file(connect):
+    content = os.urandom(50_000)
+    middle = len(content) // 2
+
+    async def scenario():
+        http = await connect()
+        upload_id = await start_upload(http, content)
+        release = asyncio.Event()
+
+        async def slow_body():
+            yield content[:1000]
+            await release.wait()
+            yield content[1000:middle]
+
+        first = asyncio.create_task(http.put(f"/api/uploads/{upload_id}", params={"offset": 0}, content=slow_body()))
+        await asyncio.sleep(0.05)
+        second = await http.put(f"/api/uploads/{upload_id}", params={"offset": 0}, content=os.urandom(middle))
+        assert second.status_code == 409
+        release.set()
+        response = await first
+        assert response.status_code == 200 and response.json()["offset"] == middle
+
+        response = await http.put(f"/api/uploads/{upload_id}", params={"offset": middle}, content=content[middle:])
+        assert response.status_code == 200, response.text
+        response = await http.post(f"/api/uploads/{upload_id}/commit")
+        assert response.status_code == 200, response.text
+
+    asyncio.run(scenario())
+
+
+def test_failed_append_releases_its_offset(connect):
+    content = os.urandom(10_000)
+
+    async def scenario():
+        http = await connect()
+        upload_id = await start_upload(http, content)
+        response = await http.put(f"/api/uploads/{upload_id}", params={"offset": 0}, content=content + b"extra")
+        assert response.status_code == 413
+        response = await http.put(f"/api/uploads/{upload_id}", params={"offset": 0}, content=content)
+        assert response.status_code == 200, response.text
+
+    asyncio.run(scenario())
+
+
+def test_download_reads_the_file_id_from_the_primary(connect, monkeypatch):
+    content = os.urandom(10_000)
+
+    async def scenario():
+        http = await connect()
+        upload_id = await start_upload(http, content)
+        await http.put(f"/api/uploads/{upload_id}", params={"offset": 0}, content=content)
+        tarjeta = (await http.post(f"/api/uploads/{upload_id}/commit")).json()
+
+        # A secondary that hasn't seen the tarjeta (or its new file) yet
+        monkeypatch.setattr(server, "public_db", MemoryClient()["lagging_secondary"])
+        response = await http.get(f"/api/tarjetas/slug/{tarjeta['slug']}/archivo")
+        assert response.status_code == 200 and response.content == content
+
+    asyncio.run(scenario())
+
+
+async def uploaded(http, content: bytes) -> str:
+    upload_id = await start_upload(http, content)
+    response = await http.put(f"/api/uploads/{upload_id}", params={"offset": 0}, content=content)
+    assert response.status_code == 200, response.text
+    return upload_id
+
+
+def test_failed_commit_of_a_smaller_file_gives_the_bytes_back_unconditionally(connect, monkeypatch):
+    first, second = os.urandom(30_000), os.urandom(10_000)
+    limit = get_plan_limits("free")["max_storage_bytes"]
+
+    async def scenario():
+        http = await connect()
+        response = await http.post(f"/api/uploads/{await uploaded(http, first)}/commit")
+        assert response.status_code == 200
+        user_id = (await http.get("/api/auth/me")).json()["id"]
+
+        async def store_upload(database, upload):
+            # Other uploads fill the plan while this one is being stored
+            await server.db.users.update_one({"id": user_id}, {"$set": {"usage.bytes": limit}})
+            raise RuntimeError("GridFS unavailable")
+
+        monkeypatch.setattr(uploads, "store_upload", store_upload)
+        upload_id = await uploaded(http, second)
+        with pytest.raises(RuntimeError):
+            await http.post(f"/api/uploads/{upload_id}/commit")
+
+        user = await server.db.users.find_one({"id": user_id})
+        assert user["usage"]["bytes"] == limit + len(first) - len(second)
+        assert (await server.db.uploads.find_one({"id": upload_id}))["status"] == "pending"
+
+    asyncio.run(scenario())
+
+
+def test_sweep_removes_stale_and_committed_uploads_but_not_active_appends(connect):
+    content = os.urandom(10_000)
+    stale = datetime.now(timezone.utc) - timedelta(seconds=uploads.UPLOAD_TTL_SECONDS + 60)
+
+    async def scenario():
+        http = await connect()
+        committed = await uploaded(http, content)
+        assert (await http.post(f"/api/uploads/{committed}/commit")).status_code == 200
+        abandoned = await start_upload(http, content)
+        appending = await start_upload(http, content)
+        ids = [committed, abandoned, appending]
+        await server.db.uploads.update_many({"id": {"$in": ids}}, {"$set": {"updated_at": stale}})
+
+        # A slow client still appending to an upload it started long ago
+        response = await http.put(f"/api/uploads/{appending}", params={"offset": 0}, content=content[:100])
+        assert response.status_code == 200
+
+        await uploads.sweep_abandoned_uploads(server.db)
+        left = await server.db.uploads.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(None)
+        assert [upload["id"] for upload in left] == [appending]
+        assert not uploads.upload_path(abandoned).exists()
+
+    asyncio.run(scenario())
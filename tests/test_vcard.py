@@ -0,0 +1,46 @@
+import asyncio
+
+from server import etag_matches
+from vcard import build_vcard
+
+
+def test_enlace_urls_keep_their_punctuation_and_a_valid_pref():
+    vcard = build_vcard(
+        {"nombre": "Ana, García; fotografía"},
+        [{"url": "https://example.com/a,b;c", "orden": -3}, {"url": "https://example.com/z", "orden": 250}],
+        "data:image/jpeg;base64,AAAA",
+        "https://tarjetas.example.com/ana",
+    )
+    lines = vcard.split("\r\n")
+    assert r"FN:Ana\, García\; fotografía" in lines
+    assert "URL;PREF=1:https://example.com/a,b;c" in lines
+    assert "URL;PREF=100:https://example.com/z" in lines
+    assert "PHOTO:data:image/jpeg;base64,AAAA" in lines
+
+
+def test_if_none_match_forms():
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('W/"abc"', etag)
+    assert etag_matches('"x","abc"', etag)
+    assert etag_matches('"x", W/"abc" ', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches("", etag)
+    assert not etag_matches('"abcd", "ab"', etag)
+
+
+def test_vcard_answers_304_for_a_matching_tag(connect):
+    async def scenario():
+        http = await connect()
+        slug = (await http.get("/api/tarjetas")).json()[0]["slug"]
+        response = await http.get(f"/api/public/{slug}/vcard")
+        assert response.status_code == 200 and response.text.startswith("BEGIN:VCARD")
+        etag = response.headers["etag"]
+
+        for header in (etag, f'"other", W/{etag}', "*"):
+            response = await http.get(f"/api/public/{slug}/vcard", headers={"If-None-Match": header})
+            assert response.status_code == 304 and response.headers["etag"] == etag
+        response = await http.get(f"/api/public/{slug}/vcard", headers={"If-None-Match": '"other"'})
+        assert response.status_code == 200
+
+    asyncio.run(scenario())